@@ -7,6 +7,7 @@ from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.core.exceptions import ValidationError
+from .changelist import ActivityLogChangeList, ActivityLogQuerySet, EstimatedCountPaginator
 from .models import SystemSettings, RoomActivityLog
 
 
@@ -141,7 +142,30 @@ class RoomActivityLogAdmin(admin.ModelAdmin):
     search_fields = ('room_id',)
     readonly_fields = ('room_id', 'action', 'timestamp', 'participant_count', 'ip_address', 'user_agent_hash')
     date_hierarchy = 'timestamp'
-    ordering = ('-timestamp',)
+    ordering = ('-timestamp', '-id')
+    # Таблица может содержать десятки миллионов строк: страницы по ключу
+    # (timestamp, id), оценка количества вместо COUNT(*), без сортировки
+    # по колонкам и без подсчёта фасетов
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    sortable_by = ()
+
+    def get_changelist(self, request, **kwargs):
+        """Список с постраничным выводом по ключу"""
+        return ActivityLogChangeList
+
+    def get_queryset(self, request):
+        """Queryset с быстрым построением иерархии дат"""
+        queryset = super().get_queryset(request)
+        return ActivityLogQuerySet(self.model, query=queryset.query, using=queryset.db)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по началу ID комнаты, по индексу"""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(room_id__startswith=search_term), False
 
     def room_id_short(self, obj):
         """Короткое отображение ID комнаты"""
@@ -166,12 +190,17 @@ class RoomActivityLogAdmin(admin.ModelAdmin):
     actions = ['delete_old_logs']
 
     def delete_old_logs(self, request, queryset):
-        """Удаление старых логов"""
-        from datetime import datetime, timedelta
-        old_date = datetime.now() - timedelta(days=30)
-        count = RoomActivityLog.objects.filter(timestamp__lt=old_date).delete()[0]
-        self.message_user(request, f'Удалено {count} старых записей (старше 30 дней)')
-    delete_old_logs.short_description = 'Удалить логи старше 30 дней'
+        """Удаление старых логов: целыми разделами таблицы, если она секционирована"""
+        from django.conf import settings
+        from .partitions import apply_retention, is_partitioned
+        days = settings.ACTIVITY_LOG_RETENTION_DAYS
+        count = apply_retention()
+        if is_partitioned():
+            self.message_user(request, f'Удалено {count} разделов журнала (старше {days} дней)')
+        else:
+            self.message_user(request, f'Удалено {count} старых записей (старше {days} дней)')
+    delete_old_logs.short_description = 'Удалить логи старше срока хранения'
+
 
 
 # Кастомизация админки
@@ -0,0 +1,186 @@
+# core/changelist.py - Admin changelist of the room activity log for large tables
+import hashlib
+import json
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .export import format_export_time, parse_export_time
+
+# Query string parameters of keyset pages: the timestamp and id of the row
+# a page continues after (next pages) or ends before (previous pages)
+AFTER_VAR = 'after'
+BEFORE_VAR = 'before'
+
+
+def estimate_count(queryset):
+    """Rows PostgreSQL's planner expects `queryset` to return, None on other databases"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts rows exactly up to ACTIVITY_ADMIN_EXACT_COUNT_LIMIT, reading no
+    more than that many; past it, takes the planner's estimate instead of
+    a COUNT(*) over the whole table. `estimated` tells which one it was.
+    """
+    estimated = False
+
+    @cached_property
+    def count(self):
+        limit = settings.ACTIVITY_ADMIN_EXACT_COUNT_LIMIT
+        counted = self.object_list.order_by()[:limit + 1].count()
+        if counted <= limit:
+            return counted
+        estimate = estimate_count(self.object_list)
+        if estimate is None:
+            return self.object_list.count()
+        self.estimated = True
+        return max(counted, estimate)
+
+
+class ActivityLogQuerySet(models.QuerySet):
+    """
+    QuerySet of the changelist. The date hierarchy lists years, months and
+    days through datetimes(), which here probes each period between the
+    first and last row for one row over the timestamp index, rather than
+    truncating every row in range, and caches the answer for
+    ACTIVITY_ADMIN_DATES_CACHE_SECONDS.
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+
+        tzinfo = tzinfo or timezone.get_current_timezone()
+        try:
+            query = str(self.query)
+        except EmptyResultSet:
+            return []
+        key = 'activity_admin_dates:' + hashlib.md5(f'{field_name}:{kind}:{tzinfo}:{query}'.encode()).hexdigest()
+
+        periods = cache.get(key)
+        if periods is None:
+            periods = self._probe_periods(field_name, kind, tzinfo)
+            cache.set(key, periods, settings.ACTIVITY_ADMIN_DATES_CACHE_SECONDS)
+        return periods if order == 'ASC' else periods[::-1]
+
+    def _probe_periods(self, field_name, kind, tzinfo):
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        first = timezone.localtime(bounds['first'], tzinfo)
+        last = timezone.localtime(bounds['last'], tzinfo)
+
+        periods = []
+        start = _period_start(first, kind, tzinfo)
+        while start <= last:
+            end = _period_end(start, kind, tzinfo)
+            if self.filter(**{f'{field_name}__gte': start, f'{field_name}__lt': end}).exists():
+                periods.append(start)
+            start = end
+        return periods
+
+
+def _period_start(moment, kind, tzinfo):
+    return timezone.make_aware(
+        datetime(moment.year, 1 if kind == 'year' else moment.month, moment.day if kind == 'day' else 1),
+        tzinfo
+    )
+
+
+def _period_end(start, kind, tzinfo):
+    if kind == 'year':
+        end = datetime(start.year + 1, 1, 1)
+    elif kind == 'month':
+        end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    else:
+        end = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+    return timezone.make_aware(end, tzinfo)
+
+
+def page_cursor(row):
+    return f'{format_export_time(row.timestamp)}_{row.pk}'
+
+
+def _parse_cursor(value):
+    """(timestamp, id) of a page cursor"""
+    try:
+        timestamp, pk = value.rsplit('_', 1)
+        return parse_export_time(timestamp), int(pk)
+    except ValueError:
+        raise IncorrectLookupParameters(f'Invalid page cursor: {value}')
+
+
+class ActivityLogChangeList(ChangeList):
+    """
+    Changelist paged by keyset on (timestamp, id), newest first: each page
+    is read from the index where the previous one ended, however deep,
+    instead of skipping rows with OFFSET. Pages link to the next and the
+    previous page rather than to page numbers.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for name in (AFTER_VAR, BEFORE_VAR):
+            lookup_params.pop(name, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Filter, search and date links start again from the first page
+        return super().get_query_string(new_params, [*(remove or []), AFTER_VAR, BEFORE_VAR])
+
+    def get_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        rows = self.queryset.order_by('-timestamp', '-pk')
+
+        after = request.GET.get(AFTER_VAR)
+        before = request.GET.get(BEFORE_VAR)
+        if before:
+            timestamp, pk = _parse_cursor(before)
+            # The first condition bounds the index scan, the second breaks ties
+            rows = rows.filter(Q(timestamp__gte=timestamp), Q(timestamp__gt=timestamp) | Q(pk__gt=pk)).reverse()
+        elif after:
+            timestamp, pk = _parse_cursor(after)
+            rows = rows.filter(Q(timestamp__lte=timestamp), Q(timestamp__lt=timestamp) | Q(pk__lt=pk))
+
+        result_list = list(rows[:self.list_per_page + 1])
+        more = len(result_list) > self.list_per_page
+        result_list = result_list[:self.list_per_page]
+        if before:
+            result_list.reverse()
+            has_next, has_previous = True, more
+        else:
+            has_next, has_previous = more, bool(after)
+        if not result_list:
+            has_next = has_previous = False
+
+        self.result_count = paginator.count
+        self.count_estimated = paginator.estimated
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = result_list
+        self.can_show_all = False
+        self.multi_page = has_next or has_previous
+        self.paginator = paginator
+
+        self.first_url = self.get_query_string() if after or before else None
+        self.previous_url = self.get_query_string({BEFORE_VAR: page_cursor(result_list[0])}) if has_previous else None
+        self.next_url = self.get_query_string({AFTER_VAR: page_cursor(result_list[-1])}) if has_next else None
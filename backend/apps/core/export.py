@@ -0,0 +1,112 @@
+# core/export.py - Streaming export of the room activity log
+import csv
+import io
+import json
+from datetime import timedelta, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import RoomActivityLog
+
+EXPORT_FIELDS = ('id', 'room_id', 'action', 'timestamp', 'participant_count', 'ip_address', 'user_agent_hash')
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def parse_export_time(value):
+    """Aware datetime of an ISO 8601 `value`, taken as UTC without an offset"""
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(f'Invalid date and time: {value}')
+    return moment if timezone.is_aware(moment) else moment.replace(tzinfo=dt_timezone.utc)
+
+
+def format_export_time(moment):
+    """ISO 8601 UTC form of `moment`, with no '+' to escape in query strings"""
+    return moment.astimezone(dt_timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def export_watermark(until=None):
+    """
+    Upper time bound of an export: `until`, but no later than
+    ACTIVITY_LOG_EXPORT_LAG seconds ago, so rows still held by activity
+    writers are not skipped. Passed as `since` to the next export, it
+    picks up exactly where this one ended.
+    """
+    settled = timezone.now() - timedelta(seconds=settings.ACTIVITY_LOG_EXPORT_LAG)
+    return min(until, settled) if until else settled
+
+
+def export_rows(until, since=None, actions=None):
+    """
+    Values of EXPORT_FIELDS for rows logged in [since, until), unordered so
+    PostgreSQL reads only the partitions in range, without sorting
+    """
+    rows = RoomActivityLog.objects.filter(timestamp__lt=until)
+    if since:
+        rows = rows.filter(timestamp__gte=since)
+    if actions:
+        rows = rows.filter(action__in=actions)
+    return rows.order_by().values_list(*EXPORT_FIELDS)
+
+
+class ActivityLogEncoder:
+    """Encodes export rows as CSV lines or NDJSON objects"""
+
+    def __init__(self, export_format):
+        self.export_format = export_format
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def header(self):
+        return self._csv_line(EXPORT_FIELDS) if self.export_format == 'csv' else ''
+
+    def encode(self, row):
+        row = [value.isoformat() if field == 'timestamp' else value for field, value in zip(EXPORT_FIELDS, row)]
+        if self.export_format == 'csv':
+            return self._csv_line(row)
+        return json.dumps(dict(zip(EXPORT_FIELDS, row)), separators=(',', ':')) + '\n'
+
+    def _csv_line(self, values):
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._writer.writerow(values)
+        return self._buffer.getvalue()
+
+
+def stream_export(rows, export_format, chunk_size):
+    """
+    Encoded export, `chunk_size` rows per string. Rows are read through a
+    server-side cursor `chunk_size` at a time, so memory use does not grow
+    with the export. The cursor is read inside a transaction, where in
+    autocommit PostgreSQL would materialise the whole result first; the
+    generator must be driven from a single thread.
+    """
+    encoder = ActivityLogEncoder(export_format)
+    chunk = [encoder.header()]
+    with transaction.atomic():
+        for row in rows.iterator(chunk_size=chunk_size):
+            chunk.append(encoder.encode(row))
+            if len(chunk) >= chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+async def astream_export(rows, export_format, chunk_size):
+    """
+    stream_export for ASGI responses, which would otherwise read synchronous
+    iterators whole. Chunks are all read in the request's database thread,
+    which holds the export's transaction open between them.
+    """
+    chunks = stream_export(rows, export_format, chunk_size)
+    try:
+        while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,111 @@
+# core/management/commands/bench_activity_admin.py - Activity log admin changelist benchmark
+import random
+import statistics
+import time
+from datetime import timedelta
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+from apps.core.changelist import AFTER_VAR, page_cursor
+from apps.core.models import RoomActivityLog
+from .bench_activity_metrics import ACTION_WEIGHTS
+
+
+class Command(BaseCommand):
+    """
+    Seed an activity log of --rows rows spread over --days days and time
+    the admin changelist on it: first and deep pages, the action filter,
+    room search and each level of the date hierarchy. The first run of a
+    page is reported apart, as date hierarchy levels are cached after it.
+    Pages slower than --budget-ms at p95 are flagged. Everything seeded is
+    rolled back at the end.
+    """
+    help = 'Time the room activity log admin changelist on a large seeded table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000000,
+                            help='Activity log rows to seed (default: 2000000)')
+        parser.add_argument('--days', type=int, default=30,
+                            help='Days the seeded rows are spread over (default: 30)')
+        parser.add_argument('--iterations', type=int, default=10,
+                            help='Timed loads of each page (default: 10)')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Rows per INSERT while seeding (default: 10000)')
+        parser.add_argument('--budget-ms', type=float, default=300,
+                            help='Page load budget at p95 (default: 300)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            try:
+                self._seed(options['rows'], options['days'], options['batch_size'])
+                results = [
+                    (page, self._measure(params, options['iterations']))
+                    for page, params in self._pages(options['rows'])
+                ]
+            finally:
+                transaction.set_rollback(True)
+
+        self.stdout.write(f'{"page":<14} {"first ms":>9} {"p50 ms":>9} {"p95 ms":>9} {"max ms":>9}')
+        for page, (first, latencies) in results:
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(
+                f'{page:<14} {first:>9.2f} {statistics.median(latencies):>9.2f} {p95:>9.2f} '
+                f'{latencies[-1]:>9.2f}{"  over budget" if p95 > options["budget_ms"] else ""}'
+            )
+
+    def _seed(self, rows, days, batch_size):
+        now = timezone.now()
+        span = days * 86400
+        actions = list(ACTION_WEIGHTS)
+        weights = list(ACTION_WEIGHTS.values())
+
+        started = time.monotonic()
+        for offset in range(0, rows, batch_size):
+            RoomActivityLog.objects.bulk_create([
+                RoomActivityLog(
+                    room_id=f'bench-{offset + i}',
+                    action=action,
+                    timestamp=now - timedelta(seconds=random.uniform(0, span))
+                )
+                for i, action in enumerate(random.choices(actions, weights, k=min(batch_size, rows - offset)))
+            ])
+
+        if connection.vendor == 'postgresql':
+            # Plans as on a table that size in production
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {RoomActivityLog._meta.db_table}')
+        self.stdout.write(f'Seeded {rows} rows in {time.monotonic() - started:.1f}s')
+
+    @staticmethod
+    def _pages(rows):
+        newest = RoomActivityLog.objects.order_by('-timestamp', '-id').first()
+        deep = RoomActivityLog.objects.order_by('-timestamp', '-id')[int(rows * 0.9)]
+        day = timezone.localtime(newest.timestamp)
+        return [
+            ('first page', {}),
+            ('deep page', {AFTER_VAR: page_cursor(deep)}),
+            ('action', {'action__exact': 'joined'}),
+            ('search', {'q': 'bench-123'}),
+            ('year', {'timestamp__year': day.year}),
+            ('month', {'timestamp__year': day.year, 'timestamp__month': day.month}),
+            ('day', {'timestamp__year': day.year, 'timestamp__month': day.month, 'timestamp__day': day.day}),
+        ]
+
+    @staticmethod
+    def _measure(params, iterations):
+        model_admin = admin.site._registry[RoomActivityLog]
+        user = User(username='bench', is_active=True, is_staff=True, is_superuser=True)
+        latencies = []
+        for _ in range(iterations + 1):
+            request = RequestFactory().get('/admin/core/roomactivitylog/', params)
+            request.user = user
+            started = time.perf_counter()
+            response = model_admin.changelist_view(request)
+            response.render()
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f'Changelist returned {response.status_code} for {params}')
+        return latencies[0], sorted(latencies[1:])
@@ -0,0 +1,105 @@
+# core/management/commands/bench_activity_metrics.py - Metrics endpoint query benchmark
+import random
+import statistics
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from apps.core.models import RoomActivityLog, RoomActivityRollup
+
+# Mix of seeded actions, roughly as a room's lifetime produces them
+ACTION_WEIGHTS = {'created': 1, 'joined': 2, 'left': 2, 'expired': 0.5, 'deleted': 0.5}
+
+
+class Command(BaseCommand):
+    """
+    Seed an activity log of --rows rows spread over --days days, counting
+    them into the rollups the way the activity writer does, then compare
+    the latency of the metrics endpoint's counters computed with COUNT(*)
+    over the log against the same counters read from the rollups.
+    Everything seeded is rolled back at the end.
+    """
+    help = 'Compare metrics counter latency over the raw activity log and the rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000000,
+                            help='Activity log rows to seed (default: 2000000)')
+        parser.add_argument('--days', type=int, default=30,
+                            help='Days the seeded rows are spread over (default: 30)')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Timed runs of each method (default: 20)')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Rows per INSERT while seeding (default: 10000)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            try:
+                self._seed(options['rows'], options['days'], options['batch_size'])
+                now = timezone.now()
+                results = [
+                    ('log scan', self._measure(self._scan_counters, now, options['iterations'])),
+                    ('rollups', self._measure(RoomActivityRollup.objects.summary, now, options['iterations'])),
+                ]
+            finally:
+                transaction.set_rollback(True)
+
+        self.stdout.write(f'{"method":<10} {"p50 ms":>9} {"p95 ms":>9} {"max ms":>9}')
+        for method, latencies in results:
+            self.stdout.write(
+                f'{method:<10} {statistics.median(latencies):>9.2f} '
+                f'{latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:>9.2f} {latencies[-1]:>9.2f}'
+            )
+
+    def _seed(self, rows, days, batch_size):
+        now = timezone.now()
+        span = days * 86400
+        actions = list(ACTION_WEIGHTS)
+        weights = list(ACTION_WEIGHTS.values())
+
+        started = time.monotonic()
+        for offset in range(0, rows, batch_size):
+            batch = [
+                RoomActivityLog(
+                    room_id=f'bench-{offset + i}',
+                    action=action,
+                    timestamp=now - timedelta(seconds=random.uniform(0, span))
+                )
+                for i, action in enumerate(random.choices(actions, weights, k=min(batch_size, rows - offset)))
+            ]
+            RoomActivityLog.objects.bulk_create(batch)
+            RoomActivityRollup.objects.add_events(batch)
+
+        if connection.vendor == 'postgresql':
+            # Plans as on a table that size in production
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {RoomActivityLog._meta.db_table}')
+                cursor.execute(f'ANALYZE {RoomActivityRollup._meta.db_table}')
+        self.stdout.write(f'Seeded {rows} rows in {time.monotonic() - started:.1f}s')
+
+    @staticmethod
+    def _scan_counters(now):
+        """The counters as the metrics endpoint computed them before rollups"""
+        last_hour = now - timedelta(hours=1)
+        last_day = now - timedelta(days=1)
+        logs = RoomActivityLog.objects
+        return {
+            'rooms': {
+                'created_last_hour': logs.filter(action='created', timestamp__gte=last_hour).count(),
+                'created_last_day': logs.filter(action='created', timestamp__gte=last_day).count(),
+                'total_created': logs.filter(action='created').count(),
+            },
+            'users': {
+                'joined_last_hour': logs.filter(action='joined', timestamp__gte=last_hour).count(),
+                'joined_last_day': logs.filter(action='joined', timestamp__gte=last_day).count(),
+            },
+        }
+
+    @staticmethod
+    def _measure(counters, now, iterations):
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            counters(now)
+            latencies.append((time.perf_counter() - started) * 1000)
+        return sorted(latencies)
@@ -0,0 +1,55 @@
+# core/management/commands/compact_activity_rollups.py - Activity rollup maintenance
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.core.models import RoomActivityLog, RoomActivityRollup, rebuild_activity_rollups
+
+
+class Command(BaseCommand):
+    """
+    Drop minute rollups older than ACTIVITY_ROLLUP_MINUTE_RETENTION_HOURS;
+    hour and all-time rollups are kept. Suitable for cron; use --interval
+    to keep running.
+
+    --rebuild recomputes every rollup from the activity log. Rollups are
+    backfilled by the migration creating them and updated with the log
+    rows they count, so a rebuild is only needed to repair them. Day
+    rollups of dropped log partitions are kept and still count towards
+    the all-time totals.
+    """
+    help = 'Prune old minute rollups of the room activity log, or rebuild all rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recompute all rollups from the activity log'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Repeat every N seconds instead of running once'
+        )
+
+    def handle(self, *args, **options):
+        retention = timedelta(hours=getattr(settings, 'ACTIVITY_ROLLUP_MINUTE_RETENTION_HOURS', 48))
+
+        if options['rebuild']:
+            started = time.monotonic()
+            rows = rebuild_activity_rollups(RoomActivityLog, RoomActivityRollup, timezone.now() - retention)
+            self.stdout.write(
+                f"rollups={rows} duration_ms={round((time.monotonic() - started) * 1000, 1)}"
+            )
+
+        while True:
+            pruned = RoomActivityRollup.objects.filter(
+                period='minute', bucket__lt=timezone.now() - retention
+            ).delete()[0]
+            self.stdout.write(f"minute_rollups_pruned={pruned}")
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,89 @@
+# core/management/commands/export_activity_log.py - Room activity log export
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.core.export import (
+    EXPORT_FORMATS, export_rows, export_watermark, format_export_time, parse_export_time, stream_export
+)
+from apps.core.models import RoomActivityLog
+
+
+class Command(BaseCommand):
+    """
+    Write room activity log rows as CSV or NDJSON to --output or stdout,
+    streamed through a server-side cursor. With --watermark-file, each run
+    exports the rows logged since the previous one: the file holds the end
+    of the last exported range and is only updated once an export is
+    complete.
+    """
+    help = 'Export room activity log rows as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=list(EXPORT_FORMATS),
+            default='csv',
+            help='Output format (default: csv)'
+        )
+        parser.add_argument(
+            '--since',
+            type=parse_export_time,
+            help='Export rows logged at or after this ISO 8601 time (UTC unless given)'
+        )
+        parser.add_argument(
+            '--until',
+            type=parse_export_time,
+            help='Export rows logged before this ISO 8601 time (UTC unless given)'
+        )
+        parser.add_argument(
+            '--action',
+            action='append',
+            choices=[action for action, _ in RoomActivityLog.ACTION_CHOICES],
+            help='Export only this action; repeat for several'
+        )
+        parser.add_argument(
+            '--watermark-file',
+            help='Continue from the time stored in this file (over --since), and store where this export ends'
+        )
+        parser.add_argument(
+            '--output',
+            help='File to write instead of stdout'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=settings.ACTIVITY_LOG_EXPORT_CHUNK_SIZE,
+            help='Rows fetched from the database at a time'
+        )
+
+    def handle(self, *args, **options):
+        since = options['since']
+        watermark_file = options['watermark_file']
+        if watermark_file and os.path.exists(watermark_file):
+            with open(watermark_file) as f:
+                try:
+                    since = parse_export_time(f.read().strip())
+                except ValueError as e:
+                    raise CommandError(f'{watermark_file}: {e}')
+
+        watermark = export_watermark(options['until'])
+        rows = export_rows(watermark, since=since, actions=options['action'])
+
+        if options['output']:
+            output = open(options['output'], 'w', newline='')
+        else:
+            output = self.stdout
+            output.ending = ''
+        try:
+            for chunk in stream_export(rows, options['format'], options['chunk_size']):
+                output.write(chunk)
+            output.flush()
+        finally:
+            if options['output']:
+                output.close()
+
+        if watermark_file:
+            with open(f'{watermark_file}.tmp', 'w') as f:
+                f.write(format_export_time(watermark))
+            os.replace(f'{watermark_file}.tmp', watermark_file)
+        self.stderr.write(f"watermark={format_export_time(watermark)}")
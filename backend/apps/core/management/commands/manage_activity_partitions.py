@@ -0,0 +1,65 @@
+# core/management/commands/manage_activity_partitions.py - Activity log partition maintenance
+import argparse
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.core import partitions
+
+
+class Command(BaseCommand):
+    """
+    Create the activity log partitions of the current and the next
+    --ahead periods (days or months, ACTIVITY_LOG_PARTITION), then drop
+    the partitions older than ACTIVITY_LOG_RETENTION_DAYS, adding their
+    rows to the daily rollups first with --summarise. Dropping a partition
+    takes a moment however many rows it holds. Run it at least once per
+    period (cron, or --interval to keep running) so rows never have to
+    fall back to the DEFAULT partition.
+    """
+    help = 'Create upcoming room activity log partitions and drop expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead',
+            type=int,
+            default=settings.ACTIVITY_LOG_PARTITIONS_AHEAD,
+            help='Periods to create partitions for ahead of the current one'
+        )
+        parser.add_argument(
+            '--summarise',
+            action=argparse.BooleanOptionalAction,
+            default=settings.ACTIVITY_LOG_SUMMARISE_ON_DROP,
+            help='Add rows of dropped partitions to the daily rollups'
+        )
+        parser.add_argument(
+            '--no-drop',
+            action='store_true',
+            help='Only create partitions'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Repeat every N seconds instead of running once'
+        )
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            raise CommandError('The room activity log is not partitioned (PostgreSQL only, see migration core 0005)')
+
+        while True:
+            created = partitions.create_partitions(options['ahead'])
+            for name in created:
+                self.stdout.write(f"created={name}")
+
+            if not options['no_drop']:
+                dropped = partitions.apply_retention(summarise=options['summarise'])
+                self.stdout.write(f"partitions_dropped={dropped}")
+
+            stray = partitions.default_partition_rows()
+            if stray:
+                self.stderr.write(f"default_partition_rows={stray} (create partitions further ahead)")
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
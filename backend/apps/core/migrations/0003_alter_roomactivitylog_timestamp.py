@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-16 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_roomactivitylog_options'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='roomactivitylog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
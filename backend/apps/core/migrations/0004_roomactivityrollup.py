@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-16 11:40
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+from apps.core.models import rebuild_activity_rollups
+
+
+def backfill_rollups(apps, schema_editor):
+    """Count the rows logged before the rollups existed, as compact_activity_rollups --rebuild does"""
+    retention = timedelta(hours=getattr(settings, 'ACTIVITY_ROLLUP_MINUTE_RETENTION_HOURS', 48))
+    rebuild_activity_rollups(
+        apps.get_model('core', 'RoomActivityLog'),
+        apps.get_model('core', 'RoomActivityRollup'),
+        timezone.now() - retention
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_alter_roomactivitylog_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('all', 'All Time')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('action', models.CharField(choices=[('created', 'Room Created'), ('joined', 'User Joined'), ('left', 'User Left'), ('expired', 'Room Expired'), ('deleted', 'Room Deleted')], max_length=20)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Room Activity Rollup',
+                'verbose_name_plural': 'Room Activity Rollups',
+                'ordering': ['-bucket'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'action', 'bucket'), name='unique_activity_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
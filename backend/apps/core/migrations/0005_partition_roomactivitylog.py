@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import migrations, models
+
+TABLE = 'core_roomactivitylog'
+LEGACY = f'{TABLE}_legacy'
+
+
+def partition_activity_log(apps, schema_editor):
+    """
+    Turn the activity log into a table range partitioned by timestamp.
+    Existing rows stay where they are, as the partition of everything up
+    to the start of next month; a DEFAULT partition takes rows outside the
+    partitions created by the manage_activity_partitions command. Indexes
+    keep their names, so queries by room_id and action use them as before.
+    PostgreSQL only; other databases keep a plain table.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        if cursor.fetchone()[0] == 'p':
+            return
+
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s",
+            [TABLE, f'{TABLE}_pkey']
+        )
+        indexes = cursor.fetchall()
+        now = datetime.now(dt_timezone.utc)
+        cutover = (now.replace(day=28) + timedelta(days=4)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY}')
+        cursor.execute(f'ALTER TABLE {LEGACY} DROP CONSTRAINT {TABLE}_pkey')
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX {name} RENAME TO {name}_legacy')
+
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {LEGACY} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE (timestamp)'
+        )
+        # New ids continue from the old table's, whose own sequence goes away
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), coalesce(max(id), 0) + 1, false) FROM {LEGACY}",
+            [TABLE]
+        )
+        cursor.execute(f'ALTER TABLE {LEGACY} ALTER COLUMN id DROP IDENTITY IF EXISTS')
+
+        # Unique constraints of a partitioned table must include its partition key
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, timestamp)')
+        for _, definition in indexes:
+            cursor.execute(definition)
+
+        cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {LEGACY} FOR VALUES FROM (MINVALUE) TO (%s)', [cutover])
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_roomactivityrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='roomactivityrollup',
+            name='period',
+            field=models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day'), ('all', 'All Time')], max_length=10),
+        ),
+        migrations.RunPython(partition_activity_log, elidable=False),
+    ]
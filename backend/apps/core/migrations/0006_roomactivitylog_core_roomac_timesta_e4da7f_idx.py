@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_partition_roomactivitylog'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='roomactivitylog',
+            index=models.Index(fields=['-timestamp', '-id'], name='core_roomac_timesta_e4da7f_idx'),
+        ),
+    ]
@@ -1,5 +1,9 @@
 # core/models.py - Core system models for video call application
-from django.db import models
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import connections, models, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncHour, TruncMinute
 from django.contrib.auth.hashers import make_password, check_password
 from django.utils import timezone
 
@@ -69,7 +73,8 @@ class RoomActivityLog(models.Model):
 
     room_id = models.CharField(max_length=36, db_index=True)  # UUID
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens; rows are written later in batches
+    timestamp = models.DateTimeField(default=timezone.now)
     participant_count = models.PositiveIntegerField(default=0)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent_hash = models.CharField(
@@ -84,9 +89,168 @@ class RoomActivityLog(models.Model):
         indexes = [
             models.Index(fields=['room_id', '-timestamp']),
             models.Index(fields=['action', '-timestamp']),
+            # Pages of the admin changelist, newest first
+            models.Index(fields=['-timestamp', '-id']),
         ]
         verbose_name = "Room Activity Log"
         verbose_name_plural = "Room Activity Logs"
 
     def __str__(self):
         return f"{self.get_action_display()} - {self.room_id[:8]}... at {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
+
+
+# Bucket of the all-time rollup rows
+ALL_TIME = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class RoomActivityRollupManager(models.Manager):
+    def add_events(self, rows):
+        """Count RoomActivityLog rows into their minute, hour and all-time buckets"""
+        counts = Counter()
+        for row in rows:
+            minute = row.timestamp.replace(second=0, microsecond=0)
+            counts['minute', minute, row.action] += 1
+            counts['hour', minute.replace(minute=0), row.action] += 1
+            counts['all', ALL_TIME, row.action] += 1
+        if not counts:
+            return
+
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        # Rows are upserted in one order everywhere, so concurrent writers
+        # wait for each other instead of deadlocking
+        params = [
+            (period, connection.ops.adapt_datetimefield_value(bucket), action, count)
+            for (period, bucket, action), count in sorted(counts.items())
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (period, bucket, action, count) VALUES (%s, %s, %s, %s) "
+                f"ON CONFLICT (period, action, bucket) DO UPDATE SET count = {table}.count + EXCLUDED.count",
+                params
+            )
+
+    def events_between(self, action, start, end):
+        """
+        Events of an action from `start` (to the minute) up to `end`, read
+        from hour buckets and the minute buckets at both edges: at most
+        about 120 minute rows and one hour row per hour in between
+        """
+        start = start.replace(second=0, microsecond=0)
+        first_hour = start.replace(minute=0)
+        if first_hour < start:
+            first_hour += timedelta(hours=1)
+        last_hour = end.replace(minute=0, second=0, microsecond=0)
+
+        if first_hour < last_hour:
+            buckets = (
+                Q(period='minute', bucket__gte=start, bucket__lt=first_hour)
+                | Q(period='hour', bucket__gte=first_hour, bucket__lt=last_hour)
+                | Q(period='minute', bucket__gte=last_hour, bucket__lte=end)
+            )
+        else:
+            buckets = Q(period='minute', bucket__gte=start, bucket__lte=end)
+        return self.filter(buckets, action=action).aggregate(total=Sum('count'))['total'] or 0
+
+    def events_total(self, action):
+        """Events of an action ever logged"""
+        return self.filter(period='all', bucket=ALL_TIME, action=action).values_list(
+            'count', flat=True
+        ).first() or 0
+
+    def summary(self, now):
+        """Room and user activity counters of the metrics endpoint"""
+        last_hour = now - timedelta(hours=1)
+        last_day = now - timedelta(days=1)
+        return {
+            'rooms': {
+                'created_last_hour': self.events_between('created', last_hour, now),
+                'created_last_day': self.events_between('created', last_day, now),
+                'total_created': self.events_total('created'),
+            },
+            'users': {
+                'joined_last_hour': self.events_between('joined', last_hour, now),
+                'joined_last_day': self.events_between('joined', last_day, now),
+            },
+        }
+
+
+class RoomActivityRollup(models.Model):
+    """
+    Number of RoomActivityLog events per action and time bucket, updated in
+    the transaction writing the log rows. Minute buckets cover recent
+    activity (see the compact_activity_rollups command), hour buckets all
+    of it, and one all-time bucket per action counts every event, so
+    counters are read from a bounded number of rows however large the log.
+    Day buckets keep the totals of log partitions dropped by retention (see
+    the manage_activity_partitions command).
+    """
+    PERIOD_CHOICES = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+        ('all', 'All Time'),
+    ]
+
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    # Start of the bucket; ALL_TIME for the all-time rows
+    bucket = models.DateTimeField()
+    action = models.CharField(max_length=20, choices=RoomActivityLog.ACTION_CHOICES)
+    count = models.PositiveBigIntegerField(default=0)
+
+    objects = RoomActivityRollupManager()
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'action', 'bucket'], name='unique_activity_rollup'),
+        ]
+        verbose_name = "Room Activity Rollup"
+        verbose_name_plural = "Room Activity Rollups"
+
+    def __str__(self):
+        return f"{self.get_action_display()} per {self.period} at {self.bucket:%Y-%m-%d %H:%M}: {self.count}"
+
+
+def rebuild_activity_rollups(log_model, rollup_model, minutes_since):
+    """
+    Recompute every rollup from the activity log: minute buckets from
+    `minutes_since` on, hour buckets and the all-time totals. Day rollups
+    of dropped log partitions are kept and still count towards the totals.
+    Takes the models so that migrations can pass their historical ones.
+    Returns the number of rollups written.
+    """
+    rollups = []
+
+    # Buckets are UTC, as when counted on write
+    periods = [
+        ('minute', TruncMinute('timestamp', tzinfo=dt_timezone.utc),
+         log_model.objects.filter(timestamp__gte=minutes_since)),
+        ('hour', TruncHour('timestamp', tzinfo=dt_timezone.utc), log_model.objects.all()),
+    ]
+    for period, trunc, logs in periods:
+        rollups.extend(
+            rollup_model(period=period, bucket=row['bucket'], action=row['action'], count=row['count'])
+            for row in logs.annotate(bucket=trunc).values('bucket', 'action').annotate(
+                count=Count('id')
+            ).order_by()
+        )
+    totals = Counter({
+        row['action']: row['count']
+        for row in rollup_model.objects.filter(period='day').values('action').annotate(
+            count=Sum('count')
+        ).order_by()
+    })
+    totals.update({
+        row['action']: row['count']
+        for row in log_model.objects.values('action').annotate(count=Count('id')).order_by()
+    })
+    rollups.extend(
+        rollup_model(period='all', bucket=ALL_TIME, action=action, count=count)
+        for action, count in totals.items()
+    )
+
+    with transaction.atomic():
+        rollup_model.objects.exclude(period='day').delete()
+        rollup_model.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
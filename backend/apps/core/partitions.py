@@ -0,0 +1,175 @@
+# core/partitions.py - Time partitions of the room activity log (PostgreSQL)
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+# The log is range partitioned on `timestamp` (see migration 0005): one
+# partition per day or month, named after its first day, plus a DEFAULT
+# partition catching rows no partition was created for yet. Rows from
+# before partitioning stay in the `_legacy` partition.
+TABLE = 'core_roomactivitylog'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+_RANGE_BOUND = re.compile(r"FROM \((.+)\) TO \((.+)\)")
+
+
+def is_partitioned():
+    """True if the activity log is a partitioned table"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def period_start(moment, period):
+    """Start (UTC) of the day or month holding `moment`"""
+    start = moment.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.replace(day=1) if period == 'month' else start
+
+
+def next_period(start, period):
+    if period == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def partition_name(start, period):
+    return f"{TABLE}_p{start:%Y%m}" if period == 'month' else f"{TABLE}_p{start:%Y%m%d}"
+
+
+def _parse_bound(value):
+    """Datetime of a partition bound, None for MINVALUE and MAXVALUE"""
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def list_partitions():
+    """(name, lower bound, upper bound) of each range partition, oldest first"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+            [TABLE]
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = _RANGE_BOUND.search(bound)
+        if match:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return sorted(partitions, key=lambda partition: partition[1] or datetime.min.replace(tzinfo=dt_timezone.utc))
+
+
+def create_partitions(ahead, period=None, now=None):
+    """
+    Create the partitions of the current period and the `ahead` following
+    ones; periods overlapping an existing partition are skipped. Rows that
+    already landed in the DEFAULT partition move to their new partition.
+    Returns the names of the partitions created.
+    """
+    period = period or settings.ACTIVITY_LOG_PARTITION
+    existing = list_partitions()
+    created = []
+
+    start = period_start(now or timezone.now(), period)
+    for _ in range(ahead + 1):
+        end = next_period(start, period)
+        overlaps = any(
+            (lower is None or lower < end) and (upper is None or upper > start)
+            for _, lower, upper in existing
+        )
+        if not overlaps:
+            name = partition_name(start, period)
+            _create_partition(name, start, end)
+            created.append(name)
+        start = end
+    return created
+
+
+def _create_partition(name, start, end):
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {qn(DEFAULT_PARTITION)} WHERE timestamp >= %s AND timestamp < %s)",
+            [start, end]
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f"CREATE TABLE {qn(name)} PARTITION OF {qn(TABLE)} FOR VALUES FROM (%s) TO (%s)",
+                [start, end]
+            )
+            return
+
+        # The range may not overlap rows left in the DEFAULT partition
+        cursor.execute(f"ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(DEFAULT_PARTITION)}")
+        cursor.execute(
+            f"CREATE TABLE {qn(name)} PARTITION OF {qn(TABLE)} FOR VALUES FROM (%s) TO (%s)",
+            [start, end]
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {qn(DEFAULT_PARTITION)} WHERE timestamp >= %s AND timestamp < %s "
+            f"RETURNING *) INSERT INTO {qn(name)} SELECT * FROM moved",
+            [start, end]
+        )
+        cursor.execute(f"ALTER TABLE {qn(TABLE)} ATTACH PARTITION {qn(DEFAULT_PARTITION)} DEFAULT")
+
+
+def drop_partitions(before, summarise=False):
+    """
+    Drop the partitions holding only rows older than `before`, each in its
+    own transaction. With `summarise`, their rows are first added to the
+    daily rollups. Returns the names of the partitions dropped.
+    """
+    from apps.core.models import RoomActivityRollup
+
+    qn = connection.ops.quote_name
+    rollups = qn(RoomActivityRollup._meta.db_table)
+    dropped = []
+
+    for name, _, upper in list_partitions():
+        if upper is None or upper > before:
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            if summarise:
+                cursor.execute(
+                    f"INSERT INTO {rollups} (period, bucket, action, count) "
+                    f"SELECT 'day', date_trunc('day', timestamp, 'UTC'), action, count(*) FROM {qn(name)} "
+                    f"GROUP BY 2, 3 ORDER BY 2, 3 "
+                    f"ON CONFLICT (period, action, bucket) DO UPDATE SET count = {rollups}.count + EXCLUDED.count"
+                )
+            cursor.execute(f"DROP TABLE {qn(name)}")
+        dropped.append(name)
+    return dropped
+
+
+def default_partition_rows():
+    """Rows in the DEFAULT partition: periods with no partition created in time"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM {connection.ops.quote_name(DEFAULT_PARTITION)}")
+        return cursor.fetchone()[0]
+
+
+def apply_retention(summarise=None, now=None):
+    """
+    Remove activity rows older than ACTIVITY_LOG_RETENTION_DAYS: whole
+    partitions are dropped (summarised first if ACTIVITY_LOG_SUMMARISE_ON_DROP,
+    or `summarise`). Returns the number of partitions dropped, or of rows
+    deleted where the log is not partitioned.
+    """
+    from apps.core.models import RoomActivityLog
+
+    cutoff = (now or timezone.now()) - timedelta(days=settings.ACTIVITY_LOG_RETENTION_DAYS)
+    if summarise is None:
+        summarise = settings.ACTIVITY_LOG_SUMMARISE_ON_DROP
+
+    if is_partitioned():
+        # A partition's upper bound is exclusive, so the newest one dropped
+        # ends at the start of the cutoff's period at the latest
+        return len(drop_partitions(cutoff, summarise=summarise))
+    return RoomActivityLog.objects.filter(timestamp__lt=cutoff).delete()[0]
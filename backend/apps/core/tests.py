@@ -1,3 +1,335 @@
-from django.test import TestCase
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import os
+import runpy
+import tempfile
+from datetime import timedelta
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+import run_server
+from apps.core import partitions
+from apps.core.changelist import ActivityLogQuerySet
+from apps.core.export import ActivityLogEncoder
+from apps.core.models import RoomActivityLog, RoomActivityRollup
+from apps.rooms.activity import flush_activity_log, write_activity_rows
+from videocall_app import settings as settings_module
+
+
+class ActivityRollupTests(TransactionTestCase):
+    """Activity metrics are summed from per-minute and per-hour rollups"""
+
+    def test_rollups_count_rows_across_minute_and_hour_buckets(self):
+        # Rows other tests left in the buffer would count too
+        flush_activity_log()
+        now = timezone.now()
+        write_activity_rows([
+            RoomActivityLog(room_id='rollup_room', action='created', timestamp=now - timedelta(minutes=minutes))
+            for minutes in (0, 50, 90, 23 * 60, 26 * 60)
+        ])
+
+        self.assertEqual(RoomActivityRollup.objects.summary(now)['rooms'], {
+            'created_last_hour': 2,
+            'created_last_day': 4,
+            'total_created': 5,
+        })
+
+    def test_migration_backfills_rollups_of_existing_rows(self):
+        now = timezone.now()
+        # Logged before the rollups existed, so not counted on write
+        RoomActivityLog.objects.bulk_create([
+            RoomActivityLog(room_id='history_room', action='created', timestamp=now - timedelta(minutes=minutes))
+            for minutes in (10, 3 * 60, 30 * 24 * 60)
+        ])
+
+        import_module('apps.core.migrations.0004_roomactivityrollup').backfill_rollups(django_apps, None)
+
+        self.assertEqual(RoomActivityRollup.objects.summary(now)['rooms'], {
+            'created_last_hour': 1,
+            'created_last_day': 2,
+            'total_created': 3,
+        })
+
+
+@skipUnless(connection.vendor == 'postgresql', 'The activity log is partitioned on PostgreSQL only')
+class ActivityLogPartitionTests(TransactionTestCase):
+    """Old activity rows go by dropping partitions, optionally summarised first"""
+
+    def test_rows_move_out_of_default_partition_and_drop_into_day_rollups(self):
+        later = timezone.now() + timedelta(days=400)
+        write_activity_rows([
+            RoomActivityLog(room_id='partitioned_room', action=action, timestamp=later)
+            for action in ('created', 'joined', 'joined')
+        ])
+        self.assertEqual(partitions.default_partition_rows(), 3)
+
+        created = partitions.create_partitions(0, period='day', now=later)
+        self.assertEqual(created, [partitions.partition_name(partitions.period_start(later, 'day'), 'day')])
+        self.assertEqual(partitions.default_partition_rows(), 0)
+        self.assertEqual(RoomActivityLog.objects.filter(room_id='partitioned_room', action='joined').count(), 2)
+
+        dropped = partitions.drop_partitions(later + timedelta(days=1), summarise=True)
+        self.assertIn(created[0], dropped)
+        self.assertFalse(RoomActivityLog.objects.filter(room_id='partitioned_room').exists())
+        self.assertEqual(
+            dict(RoomActivityRollup.objects.filter(period='day').values_list('action', 'count')),
+            {'created': 1, 'joined': 2}
+        )
+
+
+class ActivityLogExportTests(TransactionTestCase):
+    """Activity rows stream out in time ranges that chain through watermarks"""
+
+    def setUp(self):
+        now = timezone.now()
+        write_activity_rows([
+            RoomActivityLog(room_id='export_room', action=action, timestamp=now - timedelta(hours=hours))
+            for action, hours in (('created', 3), ('joined', 2), ('left', 1))
+        ])
+        self.staff = User.objects.create_user('exporter', password='exporter', is_staff=True)
+
+    async def test_endpoint_streams_filtered_ndjson_to_staff_only(self):
+        self.assertEqual((await self.async_client.get('/api/activity/export/')).status_code, 403)
+
+        await self.async_client.aforce_login(self.staff)
+        since = timezone.now() - timedelta(hours=2, minutes=30)
+        response = await self.async_client.get('/api/activity/export/', {
+            'format': 'ndjson', 'since': since.isoformat(), 'action': ['joined', 'left']
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Export-Watermark', response)
+        content = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        self.assertEqual(sorted(json.loads(line)['action'] for line in content.splitlines()), ['joined', 'left'])
+
+    async def test_endpoint_reads_rows_inside_a_transaction(self):
+        # In autocommit PostgreSQL would materialise every row before the first is sent
+        encode = ActivityLogEncoder.encode
+        in_transaction = []
+
+        def record(encoder, row):
+            in_transaction.append(connection.in_atomic_block)
+            return encode(encoder, row)
+
+        await self.async_client.aforce_login(self.staff)
+        with mock.patch.object(ActivityLogEncoder, 'encode', autospec=True, side_effect=record):
+            response = await self.async_client.get('/api/activity/export/', {'format': 'ndjson'})
+            content = [chunk async for chunk in response.streaming_content]
+
+        self.assertEqual(len(b''.join(content).splitlines()), 3)
+        self.assertEqual(in_transaction, [True] * 3)
+
+    def test_command_exports_only_rows_after_the_watermark(self):
+        with tempfile.TemporaryDirectory() as directory:
+            watermark = os.path.join(directory, 'watermark')
+            first, second = io.StringIO(), io.StringIO()
+            call_command('export_activity_log', watermark_file=watermark, stdout=first, stderr=io.StringIO())
+            write_activity_rows([RoomActivityLog(room_id='export_room', action='deleted')])
+            with override_settings(ACTIVITY_LOG_EXPORT_LAG=-1):
+                call_command('export_activity_log', watermark_file=watermark, stdout=second, stderr=io.StringIO())
+
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(first.getvalue())))), 3)
+        self.assertEqual(
+            [row['action'] for row in csv.DictReader(io.StringIO(second.getvalue()))], ['deleted']
+        )
+
+
+@override_settings(ACTIVITY_ADMIN_DATES_CACHE_SECONDS=0)
+class ActivityLogChangeListTests(TransactionTestCase):
+    """The activity log admin pages by (timestamp, id) and lists dates without scanning"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        write_activity_rows([
+            RoomActivityLog(room_id=f'changelist_room_{hours}', action='joined', timestamp=self.now - timedelta(hours=hours))
+            for hours in (0, 0, 30, 60, 90)
+        ])
+        self.model_admin = admin.site._registry[RoomActivityLog]
+        self.user = User(username='admin', is_active=True, is_staff=True, is_superuser=True)
+
+    def changelist(self, params):
+        request = RequestFactory().get('/admin/core/roomactivitylog/', params)
+        request.user = self.user
+        with mock.patch.object(self.model_admin, 'list_per_page', 2):
+            return self.model_admin.get_changelist_instance(request)
+
+    def test_keyset_pages_walk_forward_and_back(self):
+        expected = list(RoomActivityLog.objects.order_by('-timestamp', '-id'))
+        first = self.changelist({})
+        self.assertEqual(first.result_list, expected[:2])
+        self.assertEqual(first.result_count, 5)
+        self.assertIsNone(first.previous_url)
+
+        second = self.changelist(QueryDict(first.next_url[1:]))
+        self.assertEqual(second.result_list, expected[2:4])
+        third = self.changelist(QueryDict(second.next_url[1:]))
+        self.assertEqual(third.result_list, expected[4:])
+        self.assertIsNone(third.next_url)
+
+        self.assertEqual(self.changelist(QueryDict(third.previous_url[1:])).result_list, expected[2:4])
+
+    def test_date_hierarchy_periods_match_truncation(self):
+        for kind in ('year', 'month', 'day'):
+            self.assertEqual(
+                list(ActivityLogQuerySet(RoomActivityLog).datetimes('timestamp', kind)),
+                list(RoomActivityLog.objects.datetimes('timestamp', kind))
+            )
+
+
+class FakeProcess:
+    """Stands in for a worker process; tests decide when it exits"""
+
+    pids = itertools.count(1000)
+
+    def __init__(self, target=None, args=(), name=None):
+        self.pid = next(self.pids)
+        self.alive = False
+        self.exitcode = None
+        self.terminated = False
+        self.killed = False
+
+    def start(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self):
+        pass
+
+    def terminate(self):
+        self.terminated = True
+
+    def kill(self):
+        self.killed = True
+        self.alive = False
+
+    def exit(self, code):
+        self.alive = False
+        self.exitcode = code
+
+
+class RunServerArgumentTests(SimpleTestCase):
+    """run_server.py takes its defaults from the SERVER_* settings"""
+
+    def _parse(self, *argv):
+        with mock.patch('sys.argv', ['run_server.py', *argv]):
+            return run_server.parse_args()
+
+    @override_settings(SERVER_BACKEND='uvicorn', SERVER_WORKERS=3, SERVER_MAX_REQUESTS=500,
+                       SERVER_MAX_MEMORY_MB=256, SERVER_GRACEFUL_TIMEOUT=10)
+    def test_defaults_come_from_settings(self):
+        options = self._parse()
+
+        self.assertEqual(
+            (options.server, options.workers, options.max_requests, options.max_memory, options.graceful_timeout),
+            ('uvicorn', 3, 500, 256, 10)
+        )
+        self.assertFalse(options.port_per_worker)
+
+    def test_arguments_override_settings(self):
+        options = self._parse('--server', 'daphne', '--workers', '2', '--port', '9000', '--port-per-worker')
+
+        self.assertEqual((options.server, options.workers, options.port), ('daphne', 2, 9000))
+        self.assertTrue(options.port_per_worker)
+
+    def test_at_least_one_worker(self):
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            self._parse('--workers', '0')
+
+    def test_server_settings_are_read_from_the_environment(self):
+        with mock.patch.dict(os.environ, {'SERVER_WORKERS': '4', 'SERVER_BACKEND': 'uvicorn'}):
+            server_settings = runpy.run_path(settings_module.__file__)
+        self.assertEqual((server_settings['SERVER_WORKERS'], server_settings['SERVER_BACKEND']), (4, 'uvicorn'))
+
+        with mock.patch.dict(os.environ, {'SERVER_BACKEND': 'gunicorn'}):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'Unknown SERVER_BACKEND: gunicorn'):
+                runpy.run_path(settings_module.__file__)
+
+
+class SupervisorTests(SimpleTestCase):
+    """Workers are restarted when they crash and replaced without a gap"""
+
+    def setUp(self):
+        options = argparse.Namespace(
+            workers=2, server='daphne', max_requests=0, max_memory=0, graceful_timeout=30
+        )
+        self.supervisor = run_server.Supervisor(options, [None] * options.workers)
+        self.supervisor.context = SimpleNamespace(
+            Process=FakeProcess,
+            Value=lambda typecode, value, lock: SimpleNamespace(value=value)
+        )
+        self.output = self.enterContext(contextlib.redirect_stdout(io.StringIO()))
+        for slot in range(options.workers):
+            self.supervisor.spawn(slot)
+
+    def test_crashed_worker_restarts_with_growing_delay(self):
+        for expected_delay in (1, 3, 7):
+            self.supervisor.workers[0].process.exit(1)
+            self.supervisor.check_workers()
+
+            self.assertNotIn(0, self.supervisor.workers)
+            self.assertAlmostEqual(
+                self.supervisor.restart_at[0] - run_server.time.monotonic(), expected_delay, delta=0.5
+            )
+            self.supervisor.check_workers()
+            self.assertNotIn(0, self.supervisor.workers)
+
+            self.supervisor.restart_at[0] = 0
+            self.supervisor.check_workers()
+            self.assertTrue(self.supervisor.workers[0].process.is_alive())
+
+    def test_worker_past_its_request_limit_is_replaced_before_draining(self):
+        old = self.supervisor.workers[0]
+        old.max_requests = 10
+        old.counter.value = 10
+
+        self.supervisor.check_workers()
+
+        self.assertIsNot(self.supervisor.workers[0], old)
+        self.assertTrue(self.supervisor.workers[0].process.is_alive())
+        self.assertTrue(old.process.terminated)
+        self.assertEqual(self.supervisor.draining, [old])
+        self.assertIn('served 10 requests', self.output.getvalue())
+
+    def test_reload_replaces_every_worker_once(self):
+        old = dict(self.supervisor.workers)
+
+        self.supervisor.handle_reload(None, None)
+        self.supervisor.check_workers()
+        self.supervisor.check_workers()
+
+        self.assertEqual(self.supervisor.draining, [old[0], old[1]])
+        self.assertFalse(set(self.supervisor.workers.values()) & set(old.values()))
+        self.assertFalse(self.supervisor.reloading)
+
+    def test_draining_worker_is_killed_after_its_deadline(self):
+        worker = self.supervisor.workers[0]
+        self.supervisor.drain(worker, 'test')
+
+        self.supervisor.reap_draining()
+        self.assertFalse(worker.process.killed)
+
+        # A second stop signal ends the wait
+        self.supervisor.handle_stop(None, None)
+        self.supervisor.handle_stop(None, None)
+        self.supervisor.reap_draining()
+        self.assertTrue(worker.process.killed)
+
+        self.supervisor.reap_draining()
+        self.assertEqual(self.supervisor.draining, [])
@@ -6,5 +6,8 @@ app_name = 'core'
 
 urlpatterns = [
     path('health/', views.health_check, name='health'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('workers/', views.workers, name='workers'),
+    path('activity/export/', views.export_activity_log, name='activity_export'),
     path('csrf/', views.get_csrf_token, name='csrf'),
 ]
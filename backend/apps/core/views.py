@@ -1,5 +1,5 @@
 # apps/core/views.py - Core application views including health check
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.utils import timezone
@@ -180,39 +180,26 @@ def metrics(request):
     Basic metrics endpoint for monitoring.
     """
     try:
-        from apps.core.models import RoomActivityLog
-        from datetime import timedelta
+        from apps.core.models import RoomActivityRollup
+        from apps.rooms.activity import activity_log_metrics
+        from apps.rooms.affinity import affinity_metrics
+        from apps.rooms.outbound import outbound_metrics
+        from apps.rooms.ratelimit import rate_limit_metrics
 
-        # Calculate basic metrics
+        # Activity counters come from the rollups, a few rows each
         now = timezone.now()
-        last_hour = now - timedelta(hours=1)
-        last_day = now - timedelta(days=1)
 
         metrics_data = {
             'timestamp': now.isoformat(),
-            'rooms': {
-                'created_last_hour': RoomActivityLog.objects.filter(
-                    action='created',
-                    timestamp__gte=last_hour
-                ).count(),
-                'created_last_day': RoomActivityLog.objects.filter(
-                    action='created',
-                    timestamp__gte=last_day
-                ).count(),
-                'total_created': RoomActivityLog.objects.filter(
-                    action='created'
-                ).count(),
-            },
-            'users': {
-                'joined_last_hour': RoomActivityLog.objects.filter(
-                    action='joined',
-                    timestamp__gte=last_hour
-                ).count(),
-                'joined_last_day': RoomActivityLog.objects.filter(
-                    action='joined',
-                    timestamp__gte=last_day
-                ).count(),
-            }
+            **RoomActivityRollup.objects.summary(now),
+            # Outbound WebSocket queues of the worker serving this request
+            'signaling': outbound_metrics(),
+            # Inbound messages rejected by this worker's rate limits
+            'rate_limits': rate_limit_metrics(),
+            # Rooms and sockets served by this worker
+            'affinity': affinity_metrics(),
+            # Activity rows buffered and written by this worker
+            'activity_log': activity_log_metrics()
         }
 
         return JsonResponse(metrics_data)
@@ -225,6 +212,95 @@ def metrics(request):
         }, status=500)
 
 
+@require_http_methods(["GET"])
+@csrf_exempt
+def workers(request):
+    """
+    Room distribution across workers, as published by each of them.
+    Only available in DEBUG mode or to authenticated users.
+    """
+    if not settings.DEBUG and not request.session.get('authenticated'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    try:
+        from apps.rooms.models import RoomManager
+
+        distribution = RoomManager.get_worker_distribution()
+        rooms = sum(worker['rooms'] for worker in distribution.values())
+
+        return JsonResponse({
+            'timestamp': timezone.now().isoformat(),
+            'affinity': settings.ROOM_AFFINITY,
+            'workers': distribution,
+            'totals': {
+                'workers': len(distribution),
+                'rooms': rooms,
+                'sockets': sum(worker['sockets'] for worker in distribution.values()),
+                # Rooms served by a worker other than their owner, counted per worker
+                'foreign_rooms': sum(worker['foreign_rooms'] for worker in distribution.values()),
+                # Share of all rooms held by the busiest worker
+                'max_share': round(
+                    max((worker['rooms'] for worker in distribution.values()), default=0) / rooms, 3
+                ) if rooms else 0,
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"Workers endpoint failed: {e}")
+        return JsonResponse({
+            'error': 'Failed to retrieve worker distribution',
+            'message': str(e)
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def export_activity_log(request):
+    """
+    Stream room activity log rows as CSV or NDJSON (?format=), optionally
+    limited to [since, until) and to some actions (?action=, repeatable).
+    The X-Export-Watermark header holds the end of the exported range;
+    pass it as ?since= to export only the rows logged after it.
+    Staff only, as rows hold client IP addresses.
+    """
+    if not request.user.is_active or not request.user.is_staff:
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    from apps.core.export import (
+        EXPORT_FORMATS, astream_export, export_rows, export_watermark, format_export_time, parse_export_time
+    )
+    from apps.core.models import RoomActivityLog
+
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': f'Unknown format: {export_format}'}, status=400)
+
+    bounds = {}
+    for name in ('since', 'until'):
+        if request.GET.get(name):
+            try:
+                bounds[name] = parse_export_time(request.GET[name])
+            except ValueError:
+                return JsonResponse({'error': f'Invalid {name}: {request.GET[name]}'}, status=400)
+
+    actions = request.GET.getlist('action')
+    unknown = set(actions) - {action for action, _ in RoomActivityLog.ACTION_CHOICES}
+    if unknown:
+        return JsonResponse({'error': f'Unknown action: {", ".join(sorted(unknown))}'}, status=400)
+
+    watermark = export_watermark(bounds.get('until'))
+    rows = export_rows(watermark, since=bounds.get('since'), actions=actions)
+
+    response = StreamingHttpResponse(
+        astream_export(rows, export_format, settings.ACTIVITY_LOG_EXPORT_CHUNK_SIZE),
+        content_type=EXPORT_FORMATS[export_format]
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="activity-log-{watermark:%Y%m%dT%H%M%S}.{export_format}"'
+    )
+    response['X-Export-Watermark'] = format_export_time(watermark)
+    return response
+
+
 @ensure_csrf_cookie
 @require_http_methods(["GET"])
 def get_csrf_token(request):
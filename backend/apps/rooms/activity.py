@@ -0,0 +1,171 @@
+# rooms/activity.py - Buffered writes of room activity log rows
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Worker-wide counters, exported by the metrics endpoint: rows queued for
+# the writer, written by it, dropped on a full buffer, written by their
+# caller instead, and lost to failed INSERTs
+ACTIVITY_LOG_STATS = {
+    'queued': 0,
+    'written': 0,
+    'dropped': 0,
+    'direct': 0,
+    'failed': 0,
+}
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class ActivityLogWriter(threading.Thread):
+    """
+    Daemon thread writing queued RoomActivityLog rows with bulk_create, as
+    soon as `batch_size` rows are waiting or `interval` seconds after the
+    first of a batch was queued. The queue holds at most `capacity` rows.
+    """
+
+    def __init__(self, capacity, batch_size, interval):
+        super().__init__(name='activity-log-writer', daemon=True)
+        self.queue = queue.Queue(maxsize=capacity)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pid = os.getpid()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect()
+            if batch:
+                self.write(batch)
+                close_old_connections()
+
+    def _collect(self):
+        """Wait for a batch: full, or `interval` old, or whatever came in `interval`"""
+        batch = []
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+            if len(batch) == 1:
+                deadline = time.monotonic() + self.interval
+        return batch
+
+    def write(self, batch):
+        try:
+            write_activity_rows(batch)
+            ACTIVITY_LOG_STATS['written'] += len(batch)
+        except Exception as e:
+            ACTIVITY_LOG_STATS['failed'] += len(batch)
+            logger.error(f"Failed to write {len(batch)} room activity log rows: {e}")
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    def flush(self):
+        """Write everything queued so far, including batches the thread holds"""
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                break
+            self.write(batch)
+        self.queue.join()
+
+    def stop(self, timeout=5):
+        """Stop the thread and write what is left"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        self.flush()
+
+
+def write_activity_rows(rows):
+    """Store RoomActivityLog rows and count them into the rollups, atomically"""
+    from apps.core.models import RoomActivityLog, RoomActivityRollup
+
+    with transaction.atomic():
+        RoomActivityLog.objects.bulk_create(rows)
+        RoomActivityRollup.objects.add_events(rows)
+
+
+def get_writer():
+    """The writer thread of this process, started on first use"""
+    global _writer
+
+    with _writer_lock:
+        # A forked worker needs its own thread
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = ActivityLogWriter(
+                settings.ACTIVITY_LOG_BUFFER_SIZE,
+                batch_size=getattr(settings, 'ACTIVITY_LOG_BATCH_SIZE', 500),
+                interval=getattr(settings, 'ACTIVITY_LOG_FLUSH_INTERVAL', 1.0)
+            )
+            _writer.start()
+            atexit.register(_writer.stop)
+    return _writer
+
+
+def buffer_activity(**fields):
+    """
+    Queue a RoomActivityLog row for the writer thread, stamped with the
+    current time. Returns None once the row is queued (or dropped, on a
+    full buffer with ACTIVITY_LOG_DROP_ON_OVERLOAD), otherwise the unsaved
+    row for the caller to write itself.
+    """
+    from apps.core.models import RoomActivityLog
+
+    row = RoomActivityLog(timestamp=timezone.now(), **fields)
+    if getattr(settings, 'ACTIVITY_LOG_BUFFER_SIZE', 0):
+        try:
+            get_writer().queue.put_nowait(row)
+            ACTIVITY_LOG_STATS['queued'] += 1
+            return None
+        except queue.Full:
+            if settings.ACTIVITY_LOG_DROP_ON_OVERLOAD:
+                ACTIVITY_LOG_STATS['dropped'] += 1
+                return None
+    ACTIVITY_LOG_STATS['direct'] += 1
+    return row
+
+
+def log_activity(**fields):
+    """Record a RoomActivityLog row, through the buffer where possible"""
+    row = buffer_activity(**fields)
+    if row is not None:
+        write_activity_rows([row])
+
+
+def flush_activity_log():
+    """Write all rows queued by this process"""
+    if _writer is not None and _writer.pid == os.getpid():
+        _writer.flush()
+
+
+def stop_activity_writer():
+    """Stop this process's writer thread once its queue is written"""
+    if _writer is not None and _writer.pid == os.getpid():
+        _writer.stop()
+
+
+def activity_log_metrics():
+    """Snapshot of this worker's activity log counters"""
+    buffered = _writer.queue.qsize() if _writer is not None else 0
+    return {**ACTIVITY_LOG_STATS, 'buffered': buffered}
@@ -0,0 +1,79 @@
+# rooms/affinity.py - Which worker serves the sockets of a room
+import os
+import socket
+import time
+from collections import Counter
+from django.conf import settings
+
+# Worker-wide counters, exported by the metrics endpoint: sockets admitted
+# on the room's owning worker, sockets admitted elsewhere, and sockets told
+# to reconnect to the owner
+AFFINITY_STATS = {
+    'owned': 0,
+    'foreign': 0,
+    'redirected': 0,
+}
+
+# Sockets of this worker per room, and the rooms among them owned by
+# another worker (a peer reached this one despite affinity)
+_local_sockets = Counter()
+_foreign_rooms = set()
+_last_published = 0
+
+_worker_id = None
+
+
+def worker_id():
+    """ID of this worker: WORKER_ID, or host name and process ID"""
+    global _worker_id
+
+    if _worker_id is None:
+        _worker_id = getattr(settings, 'WORKER_ID', '') or f'{socket.gethostname()}-{os.getpid()}'
+    return _worker_id
+
+
+def track_socket(room_id, owned):
+    """Count a socket of a room served by this worker"""
+    AFFINITY_STATS['owned' if owned else 'foreign'] += 1
+    _local_sockets[room_id] += 1
+    if owned:
+        _foreign_rooms.discard(room_id)
+    else:
+        _foreign_rooms.add(room_id)
+
+
+def untrack_socket(room_id):
+    """Forget a socket; returns True if it was the room's last one here"""
+    _local_sockets[room_id] -= 1
+    if _local_sockets[room_id] > 0:
+        return False
+    del _local_sockets[room_id]
+    _foreign_rooms.discard(room_id)
+    return True
+
+
+def worker_snapshot():
+    """Room distribution on this worker, as published to the registry"""
+    return {
+        'url': getattr(settings, 'WORKER_URL', ''),
+        'rooms': len(_local_sockets),
+        'sockets': sum(_local_sockets.values()),
+        'foreign_rooms': len(_foreign_rooms),
+        'updated': int(time.time()),
+    }
+
+
+def publish_due(interval, now=None):
+    """True once per `interval` seconds, for publishing the snapshot"""
+    global _last_published
+
+    now = time.monotonic() if now is None else now
+    if now - _last_published < interval:
+        return False
+    _last_published = now
+    return True
+
+
+def affinity_metrics():
+    """Snapshot of this worker's affinity counters and room distribution"""
+    return {'worker': worker_id(), **AFFINITY_STATS, **worker_snapshot()}
@@ -1,13 +1,36 @@
 # rooms/consumers.py - WebSocket consumer for WebRTC signaling
+import asyncio
 import json
 import logging
+import uuid
+from urllib.parse import parse_qs
+import msgpack
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from django.conf import settings
 from django.utils import timezone
-from apps.rooms.models import RoomManager
+from apps.rooms.affinity import (
+    AFFINITY_STATS, publish_due, track_socket, untrack_socket, worker_id, worker_snapshot
+)
+from apps.rooms.models import AsyncRoomManager, RoomManager
+from apps.rooms.outbound import OUTBOUND_STATS, OutboundQueue
+from apps.rooms.protocol import (
+    MSGPACK_SUBPROTOCOL, build_event, decode_json, decode_msgpack, encode_json, encode_msgpack,
+    text_frame_size
+)
+from apps.rooms.ratelimit import RATE_LIMIT_STATS, MessageRateLimiter
+from apps.rooms.router import MessageRouter
 
 logger = logging.getLogger(__name__)
 
+# Inbound message types, registered by the handlers below
+signaling_router = MessageRouter()
+
+# Largest accepted session description frame; SDPs grow with every media line
+MAX_SDP_FRAME_SIZE = 65536
+
+# Shape of the session descriptions clients relay (RTCSessionDescriptionInit)
+SESSION_DESCRIPTION = {'type': str, 'sdp': str}
+
 
 class VideoCallConsumer(AsyncWebsocketConsumer):
     """
@@ -20,6 +43,53 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
         self.room_id = None
         self.room_group_name = None
         self.participant_id = None
+        # Channel names of the other participants, for targeted delivery
+        self.peer_channels = {}
+        # Pending ICE candidates and their flush tasks, keyed by target
+        self.ice_batches = {}
+        self.ice_flush_tasks = {}
+        self.ice_batch_window = getattr(settings, 'ICE_BATCH_WINDOW_MS', 0) / 1000
+        self.ice_batch_max = getattr(settings, 'ICE_BATCH_MAX_CANDIDATES', 16)
+        # Whether the client accepts batched `ice_candidates` frames
+        self.ice_batch_client = False
+        self.ice_candidates_count = 0
+        self.ice_layer_messages = 0
+        # Whether the client negotiated MessagePack binary frames
+        self.binary = False
+        # Participants of the room (joined over the REST API) keep their
+        # presence alive through the heartbeat
+        self.is_member = False
+        self.expires_ts = None
+        self.heartbeat_task = None
+        # Paced user_joined announcements to the peers already in the room
+        self.negotiation_task = None
+        # Token letting a dropped client resume as the same participant
+        self.resume_token = None
+        # Targeted messages waiting to be written to their targets' replay
+        # buffers, and the task writing them behind delivery
+        self.replay_pending = []
+        self.replay_task = None
+        self.replay_size = getattr(settings, 'REPLAY_BUFFER_SIZE', 64)
+        # Sequence IDs are this connection's prefix and a counter
+        self.seq_prefix = uuid.uuid4().hex[:12]
+        self.seq_count = 0
+        # Frames waiting for a slow client, written by writer_task
+        self.outbound = None
+        self.writer_task = None
+        self.outbound_max_lag = getattr(settings, 'OUTBOUND_MAX_LAG_MS', 5000) / 1000
+        # Inbound budgets of this connection, and tokens leased from the
+        # room-wide budget when one is configured
+        self.rate_limiter = MessageRateLimiter(
+            getattr(settings, 'SIGNALING_RATE_LIMITS', {}),
+            getattr(settings, 'SIGNALING_RATE_LIMIT_MAX_VIOLATIONS', 20)
+        )
+        self.room_rate_limit = getattr(settings, 'SIGNALING_ROOM_RATE_LIMIT', 0)
+        self.room_rate_lease = getattr(settings, 'SIGNALING_ROOM_RATE_LEASE', 5)
+        self.room_tokens = 0
+        # Which worker owns the room's sockets, see apps.rooms.affinity
+        self.room_affinity = getattr(settings, 'ROOM_AFFINITY', 'off')
+        self.owns_room = True
+        self.tracked = False
 
     async def connect(self):
         """Handle WebSocket connection"""
@@ -29,41 +99,88 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
             self.room_group_name = f'room_{self.room_id}'
 
             # Get participant ID from session or generate one
-            session = self.scope.get('session', {})
-            self.participant_id = session.get('session_key') or f'temp_{timezone.now().timestamp()}'
-
-            # Verify room exists and user can join
-            room_data = await self.get_room_data(self.room_id)
+            session_key = getattr(self.scope.get('session'), 'session_key', None)
+            self.participant_id = RoomManager.participant_id_for(session_key) if session_key \
+                else f'temp_{uuid.uuid4().hex}'
+
+            query = parse_qs(self.scope.get('query_string', b'').decode())
+            self.ice_batch_client = query.get('ice_batch', ['0'])[0] == '1'
+            self.binary = MSGPACK_SUBPROTOCOL in self.scope.get('subprotocols', [])
+
+            # A socket reaching another worker than the room's owner is sent
+            # there; once redirected it is served wherever it lands, so a
+            # lease changing hands can't bounce it around
+            if self.room_affinity != 'off':
+                owner_url = await self.claim_room(redirected='redirected' in query)
+                if owner_url:
+                    await self.redirect(owner_url)
+                    return
+
+            # Check the room, reserve a slot and join the room group at the
+            # same time; a client resuming a dropped connection continues as
+            # the same participant
+            admission, _ = await asyncio.gather(
+                self.admit(query.get('resume', [None])[0]),
+                self.channel_layer.group_add(self.room_group_name, self.channel_name)
+            )
 
-            if not room_data:
-                await self.close(code=4004)  # Room not found
+            if admission['status'] != 'admitted':
+                await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+                if admission['status'] == 'full':
+                    await self.close(code=4003)  # Room is full
+                else:
+                    await self.close(code=4004)  # Room not found
                 return
 
-            # Check room capacity
-            participants = room_data.get('participants', [])
-            max_participants = room_data.get('max_participants', 2)
+            self.participant_id = admission['participant_id']
+            self.resume_token = admission['resume_token']
+            self.expires_ts = admission['expires_ts']
+            self.is_member = admission['is_member']
+            resumed = admission['resumed']
 
-            if len(participants) >= max_participants and self.participant_id not in participants:
-                await self.close(code=4003)  # Room is full
-                return
+            track_socket(self.room_id, self.owns_room)
+            self.tracked = True
 
-            # Join the room group
-            await self.channel_layer.group_add(
-                self.room_group_name,
-                self.channel_name
-            )
+            # Where the other participants are, for targeted delivery
+            channels = admission['channels']
+            channels.pop(self.participant_id, None)
+            self.peer_channels = channels
 
             # Accept the WebSocket connection
-            await self.accept()
+            await self.accept(subprotocol=MSGPACK_SUBPROTOCOL if self.binary else None)
+            self.outbound = OutboundQueue(
+                getattr(settings, 'OUTBOUND_QUEUE_MAX_FRAMES', 256),
+                getattr(settings, 'OUTBOUND_QUEUE_MAX_BYTES', 1048576)
+            )
+            self.writer_task = asyncio.create_task(self.write_frames())
+            self.heartbeat_task = asyncio.create_task(self.heartbeat())
+
+            await self.send_message({
+                'type': 'session',
+                'participant_id': self.participant_id,
+                'resume_token': self.resume_token,
+                'resumed': resumed,
+                'timestamp': timezone.now().isoformat()
+            })
+
+            if resumed:
+                # Peers only need the new channel; the call itself goes on
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    {
+                        'type': 'user_resumed',
+                        'participant_id': self.participant_id,
+                        'channel_name': self.channel_name
+                    }
+                )
+                await self.replay_missed(query.get('last_seq', [None])[0])
+                logger.info(f"User {self.participant_id} resumed in room {self.room_id}")
+                return
 
-            # Notify other participants about new user
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'user_joined',
-                    'participant_id': self.participant_id,
-                    'timestamp': timezone.now().isoformat()
-                }
+            # Tell the participants already in the room about the new user,
+            # one at a time; each of them answers with one targeted offer
+            self.negotiation_task = asyncio.create_task(
+                self.announce_to_peers(list(self.peer_channels))
             )
 
             logger.info(f"User {self.participant_id} connected to room {self.room_id}")
@@ -75,16 +192,25 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
         try:
+            if self.heartbeat_task:
+                self.heartbeat_task.cancel()
+            if self.negotiation_task:
+                self.negotiation_task.cancel()
+            self.stop_writer()
+
+            if self.tracked and untrack_socket(self.room_id) and self.owns_room \
+                    and self.room_affinity != 'off':
+                await AsyncRoomManager.release_room_worker(self.room_id, worker_id())
+
             if self.room_group_name and self.participant_id:
-                # Notify other participants about user leaving
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'user_left',
-                        'participant_id': self.participant_id,
-                        'timestamp': timezone.now().isoformat()
-                    }
-                )
+                # Deliver candidates still waiting in a batch window
+                await self.flush_all_ice_candidates()
+                await self.flush_replay_buffer()
+                if self.ice_candidates_count:
+                    logger.info(
+                        f"User {self.participant_id} sent {self.ice_candidates_count} ICE candidates "
+                        f"in {self.ice_layer_messages} channel layer messages"
+                    )
 
                 # Remove user from room group
                 await self.channel_layer.group_discard(
@@ -92,18 +218,75 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
                     self.channel_name
                 )
 
-                # Update room data
-                await self.leave_room(self.room_id, self.participant_id)
+                if self.is_member and close_code not in (1000, 1001):
+                    # Dropped rather than closed: keep the slot and the channel
+                    # registered so peers' messages land in the replay buffer
+                    # until the client resumes within PRESENCE_TTL, or the
+                    # sweeper reaps the participant and announces it as gone
+                    logger.info(
+                        f"User {self.participant_id} dropped from room {self.room_id} "
+                        f"(code {close_code}), waiting for resume"
+                    )
+                    return
+
+                if self.resume_token:
+                    await AsyncRoomManager.drop_resume_token(self.room_id, self.resume_token)
+
+                # Notify other participants unless a resumed connection
+                # already replaced this one
+                if await AsyncRoomManager.unregister_channel(
+                    self.room_id,
+                    self.participant_id,
+                    self.channel_name
+                ):
+                    await self.channel_layer.group_send(
+                        self.room_group_name,
+                        build_event(
+                            {
+                                'type': 'user_left',
+                                'participant_id': self.participant_id,
+                                'timestamp': timezone.now().isoformat()
+                            },
+                            participant_id=self.participant_id
+                        )
+                    )
+
+                # A clean close leaves the room, deleting it once empty
+                if self.is_member:
+                    await AsyncRoomManager.leave_room(self.room_id, self.participant_id)
 
             logger.info(f"User {self.participant_id} disconnected from room {self.room_id}")
 
         except Exception as e:
             logger.error(f"WebSocket disconnect error: {e}")
 
-    async def receive(self, text_data):
-        """Handle incoming WebSocket messages"""
+    async def receive(self, text_data=None, bytes_data=None):
+        """
+        Handle incoming WebSocket messages. Each message type is declared
+        with signaling_router, which gives its handler, shape, largest frame
+        and rate limit budget.
+        """
         try:
-            data = json.loads(text_data)
+            # Limits are in bytes, as sent on the wire
+            if bytes_data is None:
+                frame_size = text_frame_size(text_data, signaling_router.max_size)
+            else:
+                frame_size = len(bytes_data)
+            # No message type accepts a frame this big, so don't decode it
+            if frame_size > signaling_router.max_size:
+                await self.reject('Message too large')
+                return
+
+            if bytes_data is not None:
+                if not self.binary:
+                    await self.send_error('Binary frames require the msgpack subprotocol')
+                    return
+                data = decode_msgpack(bytes_data)
+            else:
+                data = decode_json(text_data)
+            if not isinstance(data, dict):
+                await self.send_error('Message must be an object')
+                return
             message_type = data.get('type')
 
             # Validate message structure
@@ -111,125 +294,310 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
                 await self.send_error('Message type is required')
                 return
 
-            # Handle different message types
-            if message_type == 'offer':
-                await self.handle_webrtc_offer(data)
-            elif message_type == 'answer':
-                await self.handle_webrtc_answer(data)
-            elif message_type == 'ice_candidate':
-                await self.handle_ice_candidate(data)
-            elif message_type == 'ping':
-                await self.handle_ping()
-            elif message_type == 'media_state':
-                await self.handle_media_state(data)
-            else:
-                await self.send_error(f'Unknown message type: {message_type}')
+            route = signaling_router.get(message_type)
+            if route is None:
+                # Unknown types still draw from the shared budget
+                if await self.check_rate_limit('*', 1, False):
+                    await self.send_error(f'Unknown message type: {message_type}')
+                return
+
+            if bytes_data is None:
+                frame_size = text_frame_size(text_data, route.max_size)
+            if frame_size > route.max_size:
+                await self.reject(f'Message too large for {message_type}')
+                return
+
+            if not await self.check_rate_limit(
+                route.rate_class,
+                route.cost(data) if route.cost else 1,
+                route.relayed
+            ):
+                return
+
+            error = route.validate(data)
+            if error:
+                await self.send_error(error)
+                return
+
+            await route.handler(self, data)
 
         except json.JSONDecodeError:
             await self.send_error('Invalid JSON format')
+        except msgpack.UnpackException:
+            await self.send_error('Invalid MessagePack format')
         except Exception as e:
             logger.error(f"WebSocket receive error: {e}")
             await self.send_error('Message processing failed')
 
+    async def check_rate_limit(self, rate_class, cost, relayed):
+        """
+        Charge a message against the connection's budget for its rate class
+        and, for messages relayed to peers, against the room's
+        """
+        if self.rate_limiter.allow(rate_class, cost) \
+                and (not relayed or await self.take_room_tokens(cost)):
+            return True
+
+        await self.reject(f'Rate limit exceeded for {rate_class}')
+        return False
+
+    async def reject(self, error_message):
+        """
+        Answer a message breaking the limits with an error. A client that
+        keeps sending such messages is disconnected.
+        """
+        if self.rate_limiter.strike():
+            await self.send_error(error_message)
+            return
+
+        RATE_LIMIT_STATS['disconnects'] += 1
+        logger.warning(f"User {self.participant_id} in room {self.room_id} exceeded rate limits")
+        await self.close(code=4029)  # Too many messages
+
+    async def take_room_tokens(self, cost):
+        """
+        Spend tokens leased from the room-wide budget, leasing more from
+        Redis only when the local ones run out
+        """
+        if not self.room_rate_limit:
+            return True
+        if self.room_tokens < cost:
+            self.room_tokens += await AsyncRoomManager.take_room_tokens(
+                self.room_id, max(cost - self.room_tokens, self.room_rate_lease)
+            )
+            if self.room_tokens < cost:
+                RATE_LIMIT_STATS['room_rejected'] += 1
+                return False
+        self.room_tokens -= cost
+        return True
+
+    @signaling_router.route(
+        'offer',
+        required={'offer': SESSION_DESCRIPTION},
+        optional={'target': str},
+        max_size=MAX_SDP_FRAME_SIZE,
+        relayed=True
+    )
     async def handle_webrtc_offer(self, data):
         """Handle WebRTC offer from peer"""
         try:
             target_participant = data.get('target')
-            offer = data.get('offer')
+            offer = data['offer']
 
-            if not offer:
-                await self.send_error('Offer data is required')
-                return
+            # Candidates batched before this offer go out ahead of it
+            await self.flush_ice_candidates(target_participant)
 
             # Forward offer to target participant or broadcast to room
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'webrtc_offer',
-                    'offer': offer,
-                    'sender': self.participant_id,
-                    'target': target_participant,
-                    'timestamp': timezone.now().isoformat()
-                }
-            )
+            await self.relay(target_participant, {
+                'type': 'webrtc_offer',
+                'offer': offer,
+                'sender': self.participant_id,
+                'timestamp': timezone.now().isoformat()
+            })
 
         except Exception as e:
             logger.error(f"WebRTC offer handling error: {e}")
             await self.send_error('Failed to process offer')
 
+    @signaling_router.route(
+        'answer',
+        required={'answer': SESSION_DESCRIPTION},
+        optional={'target': str},
+        max_size=MAX_SDP_FRAME_SIZE,
+        relayed=True
+    )
     async def handle_webrtc_answer(self, data):
         """Handle WebRTC answer from peer"""
         try:
             target_participant = data.get('target')
-            answer = data.get('answer')
+            answer = data['answer']
 
-            if not answer:
-                await self.send_error('Answer data is required')
-                return
+            # Candidates batched before this answer go out ahead of it
+            await self.flush_ice_candidates(target_participant)
 
             # Forward answer to target participant
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'webrtc_answer',
-                    'answer': answer,
-                    'sender': self.participant_id,
-                    'target': target_participant,
-                    'timestamp': timezone.now().isoformat()
-                }
-            )
+            await self.relay(target_participant, {
+                'type': 'webrtc_answer',
+                'answer': answer,
+                'sender': self.participant_id,
+                'timestamp': timezone.now().isoformat()
+            })
 
         except Exception as e:
             logger.error(f"WebRTC answer handling error: {e}")
             await self.send_error('Failed to process answer')
 
+    @signaling_router.route(
+        'ice_candidate',
+        required={'candidate': dict},
+        optional={'target': str},
+        max_size=2048,
+        relayed=True
+    )
     async def handle_ice_candidate(self, data):
         """Handle ICE candidate exchange"""
         try:
-            target_participant = data.get('target')
-            candidate = data.get('candidate')
-
-            if not candidate:
-                await self.send_error('ICE candidate data is required')
-                return
-
-            # Forward ICE candidate to target participant
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'ice_candidate',
-                    'candidate': candidate,
-                    'sender': self.participant_id,
-                    'target': target_participant,
-                    'timestamp': timezone.now().isoformat()
-                }
-            )
+            await self.queue_ice_candidates(data.get('target'), [data['candidate']])
 
         except Exception as e:
             logger.error(f"ICE candidate handling error: {e}")
             await self.send_error('Failed to process ICE candidate')
 
-    async def handle_ping(self):
+    # Batches draw from the single candidate budget, charged per candidate
+    @signaling_router.route(
+        'ice_candidates',
+        required={'candidates': list},
+        optional={'target': str},
+        max_size=32768,
+        rate_class='ice_candidate',
+        cost=lambda data: len(data['candidates']) if isinstance(data.get('candidates'), list) else 1,
+        relayed=True
+    )
+    async def handle_ice_candidates(self, data):
+        """Handle a batch of ICE candidates from a client"""
+        try:
+            await self.queue_ice_candidates(data.get('target'), data['candidates'])
+
+        except Exception as e:
+            logger.error(f"ICE candidates handling error: {e}")
+            await self.send_error('Failed to process ICE candidates')
+
+    async def queue_ice_candidates(self, target, candidates):
+        """
+        Collect candidates for a target during the batch window and send them
+        as one `ice_candidates` event. Without a window they go out at once.
+        """
+        self.ice_candidates_count += len(candidates)
+        if self.ice_batch_window <= 0:
+            await self.send_ice_candidates(target, candidates)
+            return
+
+        batch = self.ice_batches.setdefault(target, [])
+        batch.extend(candidates)
+        if len(batch) >= self.ice_batch_max:
+            await self.flush_ice_candidates(target)
+        elif target not in self.ice_flush_tasks:
+            self.ice_flush_tasks[target] = asyncio.create_task(self.flush_ice_candidates_later(target))
+
+    async def flush_ice_candidates_later(self, target):
+        """Flush the batch for a target when its window closes"""
+        await asyncio.sleep(self.ice_batch_window)
+        self.ice_flush_tasks.pop(target, None)
+        try:
+            await self.flush_ice_candidates(target)
+        except Exception as e:
+            logger.error(f"ICE candidate flush error: {e}")
+
+    async def flush_ice_candidates(self, target):
+        """Send the pending batch for a target, if any"""
+        task = self.ice_flush_tasks.pop(target, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
+        candidates = self.ice_batches.pop(target, None)
+        if candidates:
+            await self.send_ice_candidates(target, candidates)
+
+    async def flush_all_ice_candidates(self):
+        """Send every pending batch, e.g. before the connection goes away"""
+        for target in list(self.ice_batches):
+            await self.flush_ice_candidates(target)
+
+    async def send_ice_candidates(self, target, candidates):
+        """Forward candidates to the target as one channel layer message"""
+        self.ice_layer_messages += 1
+        timestamp = timezone.now().isoformat()
+        if len(candidates) == 1:
+            message = {'type': 'ice_candidate', 'candidate': candidates[0]}
+            routing = {}
+        else:
+            message = {'type': 'ice_candidates', 'candidates': candidates}
+            # Kept unencoded for receivers that expand the batch
+            routing = {'candidates': candidates, 'timestamp': timestamp}
+        message.update({'sender': self.participant_id, 'timestamp': timestamp})
+        await self.relay(target, message, **routing)
+
+    async def announce_to_peers(self, peers):
+        """
+        Send user_joined to each peer that was in the room before this
+        connection, NEGOTIATION_PACE_MS apart. Peers send the newcomer an
+        offer when told, so every pair negotiates exactly once, initiated by
+        the side that was there first (no glare), and a newcomer to a large
+        room gets its offers spread out instead of all at once.
+        """
+        pace = getattr(settings, 'NEGOTIATION_PACE_MS', 100) / 1000
+        for index, peer in enumerate(peers):
+            if index and pace:
+                await asyncio.sleep(pace)
+            if peer not in self.peer_channels:
+                continue  # Left in the meantime
+            try:
+                await self.relay(
+                    peer,
+                    {
+                        'type': 'user_joined',
+                        'participant_id': self.participant_id,
+                        'timestamp': timezone.now().isoformat()
+                    },
+                    participant_id=self.participant_id,
+                    channel_name=self.channel_name
+                )
+            except Exception as e:
+                logger.error(f"Failed to announce {self.participant_id} to {peer}: {e}")
+
+    async def heartbeat(self):
+        """
+        Send heartbeats to the client and keep the participant's presence,
+        or the socket's reservation, alive while the connection is open. A
+        participant who was reaped or left in the meantime is disconnected.
+        """
+        interval = getattr(settings, 'HEARTBEAT_INTERVAL', 15)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.send_message({
+                    'type': 'heartbeat',
+                    'timestamp': timezone.now().isoformat()
+                })
+                if not await AsyncRoomManager.refresh_presence(
+                    self.room_id, self.participant_id, self.expires_ts, self.is_member
+                ):
+                    logger.info(f"User {self.participant_id} is no longer in room {self.room_id}")
+                    await self.close(code=4008)  # Presence lost
+                    return
+                if self.room_affinity != 'off' and self.owns_room:
+                    # Extend the room's lease while this worker serves it
+                    await self.claim_room(redirected=True)
+                if publish_due(interval):
+                    await AsyncRoomManager.publish_worker(worker_id(), worker_snapshot())
+            except Exception as e:
+                logger.error(f"Heartbeat error: {e}")
+
+    @signaling_router.route('ping', max_size=256)
+    async def handle_ping(self, data):
         """Handle ping message for connection health check"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'pong',
             'timestamp': timezone.now().isoformat()
-        }))
+        })
 
+    @signaling_router.route('media_state', optional={'state': dict}, max_size=1024, relayed=True)
     async def handle_media_state(self, data):
         """Handle media state changes (mute/unmute, video on/off)"""
         try:
-            media_state = data.get('state', {})
+            media_state = data.get('state') or {}
 
             # Broadcast media state to other participants
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
-                    'type': 'media_state_update',
-                    'participant_id': self.participant_id,
-                    'state': media_state,
-                    'timestamp': timezone.now().isoformat()
-                }
+                build_event(
+                    {
+                        'type': 'media_state_update',
+                        'participant_id': self.participant_id,
+                        'state': media_state,
+                        'timestamp': timezone.now().isoformat()
+                    },
+                    participant_id=self.participant_id
+                )
             )
 
         except Exception as e:
@@ -237,83 +605,222 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
             await self.send_error('Failed to process media state')
 
     # Group message handlers
+    # Events carry the client frame pre-encoded by the sender (see build_event),
+    # so handlers only decide whether to forward it.
     async def user_joined(self, event):
         """Send user joined notification"""
+        # Announcements are targeted, but reach the whole group when the
+        # target's channel is unknown
+        if event.get('target') not in (None, self.participant_id):
+            return
         if event['participant_id'] != self.participant_id:
-            await self.send(text_data=json.dumps({
-                'type': 'user_joined',
-                'participant_id': event['participant_id'],
-                'timestamp': event['timestamp']
-            }))
+            if event.get('channel_name'):
+                self.peer_channels[event['participant_id']] = event['channel_name']
+            await self.forward_frame(event)
 
     async def user_left(self, event):
         """Send user left notification"""
         if event['participant_id'] != self.participant_id:
-            await self.send(text_data=json.dumps({
-                'type': 'user_left',
-                'participant_id': event['participant_id'],
-                'timestamp': event['timestamp']
-            }))
+            self.peer_channels.pop(event['participant_id'], None)
+            await self.forward_frame(event)
 
     async def webrtc_offer(self, event):
         """Forward WebRTC offer to client"""
         # Only send to target participant or broadcast if no target specified
         if not event.get('target') or event['target'] == self.participant_id:
             if event['sender'] != self.participant_id:
-                await self.send(text_data=json.dumps({
-                    'type': 'webrtc_offer',
-                    'offer': event['offer'],
-                    'sender': event['sender'],
-                    'timestamp': event['timestamp']
-                }))
+                await self.forward_frame(event)
 
     async def webrtc_answer(self, event):
         """Forward WebRTC answer to client"""
         if event.get('target') == self.participant_id:
-            await self.send(text_data=json.dumps({
-                'type': 'webrtc_answer',
-                'answer': event['answer'],
-                'sender': event['sender'],
-                'timestamp': event['timestamp']
-            }))
+            await self.forward_frame(event)
 
     async def ice_candidate(self, event):
         """Forward ICE candidate to client"""
         # Only send to target participant or broadcast if no target specified
         if not event.get('target') or event['target'] == self.participant_id:
             if event['sender'] != self.participant_id:
-                await self.send(text_data=json.dumps({
-                    'type': 'ice_candidate',
-                    'candidate': event['candidate'],
-                    'sender': event['sender'],
-                    'timestamp': event['timestamp']
-                }))
+                await self.forward_frame(event)
+
+    async def ice_candidates(self, event):
+        """Forward a batch of ICE candidates to client"""
+        if not event.get('target') or event['target'] == self.participant_id:
+            if event['sender'] != self.participant_id:
+                if self.ice_batch_client:
+                    await self.forward_frame(event)
+                    return
+
+                await self.send_candidates_individually(event)
+
+    async def user_resumed(self, event):
+        """Point targeted delivery at a peer's resumed connection"""
+        if event['participant_id'] != self.participant_id:
+            self.peer_channels[event['participant_id']] = event['channel_name']
 
     async def media_state_update(self, event):
         """Forward media state update to client"""
         if event['participant_id'] != self.participant_id:
-            await self.send(text_data=json.dumps({
-                'type': 'media_state_update',
-                'participant_id': event['participant_id'],
-                'state': event['state'],
-                'timestamp': event['timestamp']
-            }))
+            await self.forward_frame(event)
 
     # Helper methods
+    async def relay(self, target, message, **routing):
+        """
+        Send a signaling message to its target, or to the room without one.
+        Targeted messages carry a sequence ID and are written to the target's
+        replay buffer after delivery, so a resuming client can fetch what it
+        missed without delivery waiting on Redis.
+        """
+        if target and self.replay_size:
+            self.seq_count += 1
+            message['seq'] = routing['seq'] = f'{self.seq_prefix}-{self.seq_count}'
+            self.replay_pending.append((target, message))
+        await self.send_to_participant(
+            target,
+            build_event(message, sender=self.participant_id, target=target, **routing)
+        )
+        if self.replay_pending and self.replay_task is None:
+            self.replay_task = asyncio.create_task(self.write_replay_buffer())
+
+    async def write_replay_buffer(self):
+        """Write pending messages to the replay buffers, a pipeline at a time"""
+        try:
+            while self.replay_pending:
+                events, self.replay_pending = self.replay_pending, []
+                await AsyncRoomManager.buffer_events(self.room_id, events)
+        except Exception as e:
+            logger.error(f"Replay buffer write error: {e}")
+        finally:
+            self.replay_task = None
+
+    async def flush_replay_buffer(self):
+        """Wait for pending replay buffer writes, e.g. before the connection goes away"""
+        if self.replay_task:
+            await asyncio.shield(self.replay_task)
+
+    async def replay_missed(self, last_seq):
+        """Send buffered messages newer than the client's last sequence ID"""
+        events = await AsyncRoomManager.replay_events(self.room_id, self.participant_id, last_seq)
+        for message in events:
+            if message['type'] == 'ice_candidates' and not self.ice_batch_client:
+                await self.send_candidates_individually(message)
+            else:
+                await self.send_message(message)
+        if events:
+            logger.info(f"Replayed {len(events)} messages to {self.participant_id}")
+
+    async def send_candidates_individually(self, batch):
+        """Clients without batch support get one frame per candidate"""
+        for candidate in batch['candidates']:
+            message = {
+                'type': 'ice_candidate',
+                'candidate': candidate,
+                'sender': batch['sender'],
+                'timestamp': batch['timestamp']
+            }
+            if batch.get('seq'):
+                message['seq'] = batch['seq']
+            await self.send_message(message)
+
+    async def send_to_participant(self, target, event):
+        """
+        Deliver an event straight to the target's channel. Untargeted events
+        and targets whose channel is unknown fall back to the room group.
+        """
+        channel_name = self.peer_channels.get(target) if target else None
+        if channel_name:
+            await self.channel_layer.send(channel_name, event)
+        else:
+            await self.channel_layer.group_send(self.room_group_name, event)
+
+    async def forward_frame(self, event):
+        """Send the pre-encoded frame of an event in the negotiated format"""
+        frame = event['bytes'] if self.binary else event['text']
+        await self.enqueue(event['type'], frame, event.get('participant_id'))
+
+    async def send_message(self, message):
+        """Send a message to the client in the negotiated wire format"""
+        frame = encode_msgpack(message) if self.binary else encode_json(message)
+        await self.enqueue(message['type'], frame, message.get('participant_id'))
+
+    async def enqueue(self, message_type, frame, participant_id=None):
+        """
+        Hand a frame to the writer. A client whose queue overflows with
+        frames that can't be shed, or whose oldest frame waits longer than
+        OUTBOUND_MAX_LAG_MS, is disconnected; it may resume afterwards.
+        """
+        if self.outbound is None or self.outbound.closed:
+            return
+        if self.outbound.put(message_type, frame, participant_id) \
+                and self.outbound.lag() <= self.outbound_max_lag:
+            return
+
+        OUTBOUND_STATS['slow_disconnects'] += 1
+        logger.warning(
+            f"User {self.participant_id} in room {self.room_id} is too slow: "
+            f"{self.outbound.frames} frames / {self.outbound.bytes} bytes queued, "
+            f"lag {self.outbound.lag():.1f}s"
+        )
+        await self.close(code=4009)  # Client too slow
+
+    async def write_frames(self):
+        """Write queued frames to the socket one at a time"""
+        while True:
+            frame = await self.outbound.get()
+            if isinstance(frame, bytes):
+                await self.send(bytes_data=frame)
+            else:
+                await self.send(text_data=frame)
+
+    def stop_writer(self):
+        """Stop the writer and drop frames it has not written yet"""
+        if self.writer_task:
+            self.writer_task.cancel()
+        if self.outbound:
+            self.outbound.close()
+
+    async def close(self, code=None):
+        """Close the socket; frames still queued are not written after it"""
+        self.stop_writer()
+        await super().close(code)
+
     async def send_error(self, error_message):
         """Send error message to client"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'error',
             'message': error_message,
             'timestamp': timezone.now().isoformat()
-        }))
-
-    @database_sync_to_async
-    def get_room_data(self, room_id):
-        """Get room data from Redis"""
-        return RoomManager.get_room_by_id(room_id)
-
-    @database_sync_to_async
-    def leave_room(self, room_id, participant_id):
-        """Remove participant from room"""
-        return RoomManager.leave_room(room_id, participant_id)
+        })
+
+    async def claim_room(self, redirected):
+        """
+        Claim the room for this worker, see AsyncRoomManager.claim_room_worker.
+        Returns the owner's URL if the client should reconnect there instead.
+        """
+        owner, owner_url = await AsyncRoomManager.claim_room_worker(
+            self.room_id, worker_id(), getattr(settings, 'WORKER_URL', '')
+        )
+        self.owns_room = owner == worker_id()
+        if self.owns_room:
+            return None
+        if self.room_affinity == 'redirect' and owner_url and not redirected:
+            return owner_url
+        return None
+
+    async def redirect(self, url):
+        """Tell the client to reconnect to the worker owning the room"""
+        AFFINITY_STATS['redirected'] += 1
+        await self.accept(subprotocol=MSGPACK_SUBPROTOCOL if self.binary else None)
+        message = {'type': 'redirect', 'url': url, 'timestamp': timezone.now().isoformat()}
+        if self.binary:
+            await self.send(bytes_data=encode_msgpack(message))
+        else:
+            await self.send(text_data=encode_json(message))
+        await self.close(code=4010)  # Reconnect to the room's worker
+        logger.info(f"Socket for room {self.room_id} redirected to {url}")
+
+    async def admit(self, resume_token):
+        """Admit this socket into the room, see AsyncRoomManager.admit_socket"""
+        return await AsyncRoomManager.admit_socket(
+            self.room_id, self.participant_id, self.channel_name, resume_token
+        )
@@ -0,0 +1,209 @@
+# rooms/layers.py - Sharded Redis channel layers and the in-process fast path
+import asyncio
+import collections
+import logging
+import uuid
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from channels_redis.core import RedisChannelLayer
+from channels_redis.pubsub import RedisPubSubChannelLayer, RedisPubSubLoopLayer
+from channels_redis.utils import _wrap_close
+from django.utils.module_loading import import_string
+from apps.rooms.sharding import get_ring, room_group_shard
+
+logger = logging.getLogger(__name__)
+
+# Event key naming the process a group message was sent from
+ORIGIN_KEY = '__origin__'
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """
+    List-based channel layer whose hosts are REDIS_SHARD_URLS. The group of
+    a room lives on the shard holding the room, so adding a shard only moves
+    the groups of the rooms that move with it. Per-connection channels keep
+    the stock placement: they last as long as their socket.
+    """
+
+    def consistent_hash(self, value):
+        shard = room_group_shard(value)
+        if shard is not None and self.ring_size == len(get_ring().nodes):
+            return shard
+        return super().consistent_hash(value)
+
+
+class ShardedRedisPubSubLoopLayer(RedisPubSubLoopLayer):
+    """Pub/Sub loop layer publishing room groups on their room's shard"""
+
+    def _get_shard(self, channel_or_group_name):
+        group_prefix = self._get_group_channel_name('')
+        if channel_or_group_name.startswith(group_prefix):
+            shard = room_group_shard(channel_or_group_name[len(group_prefix):])
+            if shard is not None and len(self._shards) == len(get_ring().nodes):
+                return self._shards[shard]
+        return super()._get_shard(channel_or_group_name)
+
+
+class ShardedRedisPubSubChannelLayer(RedisPubSubChannelLayer):
+    """Pub/Sub counterpart of ShardedRedisChannelLayer"""
+
+    def _get_layer(self):
+        loop = asyncio.get_running_loop()
+
+        try:
+            layer = self._layers[loop]
+        except KeyError:
+            layer = ShardedRedisPubSubLoopLayer(
+                *self._args,
+                **self._kwargs,
+                channel_layer=self,
+            )
+            self._layers[loop] = layer
+            _wrap_close(self, loop)
+
+        return layer
+
+
+class LocalFirstChannelLayer(BaseChannelLayer):
+    """
+    Channel layer delivering messages between consumers of the same process
+    in memory and everything else through `backend`, the Redis layer.
+
+    Each channel created here gets an inbox fed by its own pump from the
+    backend, so a local send never waits on a Redis read. The path between
+    a sender and a channel never changes (local channels always get memory,
+    others always Redis), which keeps messages from one sender in order.
+    group_send delivers to local members first and then always publishes
+    through the backend for other processes, tagged with this process so
+    its own copies coming back from Redis are dropped. With a room's sockets
+    routed to one worker, targeted sends between them skip Redis, but each
+    group_send is still published there, so local members get their copy
+    without waiting on it rather than without Redis being involved.
+    """
+
+    def __init__(self, backend, local_capacity=100, **config):
+        self.backend = import_string(backend)(**config)
+        self.local_capacity = local_capacity
+        self.origin = uuid.uuid4().hex
+        # Local channel -> (inbox, loop the inbox belongs to)
+        self.inboxes = {}
+        self.pumps = {}
+        # Group -> local member channels
+        self.groups = collections.defaultdict(set)
+
+    extensions = ['groups', 'flush']
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    async def new_channel(self, *args, **kwargs):
+        channel = await self.backend.new_channel(*args, **kwargs)
+        self.inboxes[channel] = (
+            asyncio.Queue(maxsize=self.local_capacity), asyncio.get_running_loop()
+        )
+        return channel
+
+    async def send(self, channel, message):
+        if channel in self.inboxes:
+            self._deliver(channel, message)
+        else:
+            await self.backend.send(channel, message)
+
+    async def receive(self, channel):
+        if channel not in self.inboxes:
+            return await self.backend.receive(channel)
+
+        inbox, _ = self.inboxes[channel]
+        if channel not in self.pumps:
+            self.pumps[channel] = asyncio.ensure_future(self._pump(channel, inbox))
+        try:
+            return await inbox.get()
+        except asyncio.CancelledError:
+            # Consumers only stop receiving when they exit
+            self._close(channel)
+            raise
+
+    async def group_add(self, group, channel):
+        await self.backend.group_add(group, channel)
+        if channel in self.inboxes:
+            self.groups[group].add(channel)
+
+    async def group_discard(self, group, channel):
+        members = self.groups.get(group)
+        if members is not None:
+            members.discard(channel)
+            if not members:
+                del self.groups[group]
+        await self.backend.group_discard(group, channel)
+
+    async def group_send(self, group, message):
+        for channel in list(self.groups.get(group, ())):
+            try:
+                self._deliver(channel, message)
+            except ChannelFull:
+                # As with Redis, a full member doesn't fail the whole group
+                logger.info(f"Channel {channel} over capacity in group {group}, message dropped")
+        await self.backend.group_send(group, {**message, ORIGIN_KEY: self.origin})
+
+    async def flush(self):
+        for channel in list(self.inboxes):
+            self._close(channel)
+        await self.backend.flush()
+
+    def _deliver(self, channel, message):
+        """
+        Hand a copy of the message to a local channel's inbox. Raises
+        ChannelFull when the inbox is full, like the Redis layer's send.
+        """
+        inbox, loop = self.inboxes[channel]
+        # Events are flat dicts of immutable values, a shallow copy
+        # isolates receivers like a trip through Redis would
+        message = dict(message)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._put(channel, inbox, message)
+        else:
+            # Sent from another thread, e.g. the sweeper's async_to_sync,
+            # which can't be told the inbox was full
+            loop.call_soon_threadsafe(self._put_or_drop, channel, inbox, message)
+
+    @staticmethod
+    def _put(channel, inbox, message):
+        try:
+            inbox.put_nowait(message)
+        except asyncio.QueueFull:
+            raise ChannelFull(channel)
+
+    def _put_or_drop(self, channel, inbox, message):
+        """Queue a message no sender waits on, dropping it if the inbox is full"""
+        try:
+            self._put(channel, inbox, message)
+        except ChannelFull:
+            logger.warning(f"Channel {channel} over capacity, message dropped")
+
+    async def _pump(self, channel, inbox):
+        """Move messages for a local channel from the backend to its inbox"""
+        while True:
+            try:
+                message = await self.backend.receive(channel)
+            except Exception as e:
+                logger.error(f"Channel layer receive failed for {channel}: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message.pop(ORIGIN_KEY, None) == self.origin:
+                # Already delivered in memory by group_send
+                continue
+            self._put_or_drop(channel, inbox, message)
+
+    def _close(self, channel):
+        self.inboxes.pop(channel, None)
+        pump = self.pumps.pop(channel, None)
+        if pump is not None:
+            pump.cancel()
+        for group in [group for group, members in self.groups.items() if channel in members]:
+            self.groups[group].discard(channel)
+            if not self.groups[group]:
+                del self.groups[group]
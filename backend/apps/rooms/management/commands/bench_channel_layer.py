@@ -0,0 +1,127 @@
+# rooms/management/commands/bench_channel_layer.py - Channel layer backend benchmark
+import asyncio
+import logging
+import statistics
+import time
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from apps.rooms.layers import LocalFirstChannelLayer
+from apps.rooms.protocol import build_event
+
+
+class Command(BaseCommand):
+    """
+    Bounce signaling events between pairs of channels over the list-based
+    and the Pub/Sub channel layer and report round-trip latency percentiles
+    and the Redis CPU time spent per message. Run it against an otherwise
+    idle Redis: CPU is read from INFO and covers every client. With --local
+    each mode is measured again behind LocalFirstChannelLayer; both ends of
+    every pair live in this process, so that is the co-located fast path.
+    """
+    help = 'Compare signaling round-trip latency and Redis CPU of the channel layer modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['list', 'pubsub', 'both'], default='both')
+        parser.add_argument('--pairs', type=int, default=20,
+                            help='Concurrent sender/echo pairs (default: 20)')
+        parser.add_argument('--messages', type=int, default=500,
+                            help='Round trips per pair (default: 500)')
+        parser.add_argument('--group', action='store_true',
+                            help='Send through group_send to a one-member group instead of send')
+        parser.add_argument('--local', action='store_true',
+                            help='Also measure each mode with in-process delivery')
+
+    def handle(self, *args, **options):
+        logging.getLogger('apps.rooms').setLevel(logging.WARNING)
+        client = redis.Redis.from_url(settings.REDIS_URL)
+        modes = ['list', 'pubsub'] if options['mode'] == 'both' else [options['mode']]
+
+        variants = [(mode, False) for mode in modes]
+        if options['local']:
+            variants += [(mode, True) for mode in modes]
+
+        self.stdout.write(
+            f'{"mode":<12} {"round trips":>11} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+            f'{"max ms":>8} {"msgs/s":>9} {"redis cpu ms":>13} {"cpu us/msg":>11}'
+        )
+        for mode, local in variants:
+            # A prefix of its own keeps the benchmark away from live channels
+            config = {'hosts': [settings.REDIS_URL], 'prefix': 'bench_channel_layer'}
+            if local:
+                layer = LocalFirstChannelLayer(backend=settings.CHANNEL_LAYER_BACKENDS[mode], **config)
+            else:
+                layer = import_string(settings.CHANNEL_LAYER_BACKENDS[mode])(**config)
+            cpu_before = self._redis_cpu(client)
+            latencies, wall = asyncio.run(
+                self._bounce(layer, options['pairs'], options['messages'], options['group'])
+            )
+            cpu = (self._redis_cpu(client) - cpu_before) * 1000
+            # Every round trip is two layer messages
+            messages = len(latencies) * 2
+            label = f'{mode}+local' if local else mode
+            self.stdout.write(self._format(label, latencies, wall, messages, cpu))
+
+    async def _bounce(self, layer, pairs, messages, group):
+        latencies = []
+
+        async def pair(index):
+            sender = await layer.new_channel()
+            echo = await layer.new_channel()
+            group_name = f'bench_{index}'
+            if group:
+                await layer.group_add(group_name, echo)
+            event = build_event(
+                {
+                    'type': 'ice_candidate',
+                    'candidate': {
+                        'candidate': f'candidate:{index} 1 udp 2122260223 192.0.2.{index % 256} 54400 typ host',
+                        'sdpMid': '0',
+                        'sdpMLineIndex': 0,
+                    },
+                    'sender': sender,
+                    'timestamp': timezone.now().isoformat()
+                },
+                sender=sender,
+                target=echo
+            )
+
+            async def reflect():
+                while True:
+                    await layer.send(sender, await layer.receive(echo))
+
+            reflector = asyncio.create_task(reflect())
+            try:
+                for _ in range(messages):
+                    started = time.perf_counter()
+                    if group:
+                        await layer.group_send(group_name, event)
+                    else:
+                        await layer.send(echo, event)
+                    await layer.receive(sender)
+                    latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                reflector.cancel()
+                await asyncio.gather(reflector, return_exceptions=True)
+                if group:
+                    await layer.group_discard(group_name, echo)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(pair(index) for index in range(pairs)))
+        return sorted(latencies), time.perf_counter() - started
+
+    def _redis_cpu(self, client):
+        info = client.info('cpu')
+        return info['used_cpu_sys'] + info['used_cpu_user']
+
+    def _format(self, mode, latencies, wall, messages, cpu):
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return (
+            f'{mode:<12} {len(latencies):>11} {statistics.median(latencies):>8.2f} '
+            f'{percentile(0.95):>8.2f} {percentile(0.99):>8.2f} {latencies[-1]:>8.2f} '
+            f'{messages / wall:>9.0f} {cpu:>13.1f} {cpu * 1000 / messages:>11.1f}'
+        )
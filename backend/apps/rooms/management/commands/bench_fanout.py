@@ -0,0 +1,65 @@
+# rooms/management/commands/bench_fanout.py - Broadcast serialization benchmark
+import json
+import time
+from django.core.management.base import BaseCommand
+from apps.rooms.management.commands.bench_signaling_codec import sample_payloads
+from apps.rooms.protocol import encode_msgpack, get_json_backend, orjson
+
+ROOM_SIZES = (2, 8, 32)
+
+
+class Command(BaseCommand):
+    """
+    Serialization CPU per broadcast: every receiving consumer encoding the
+    message itself (per-receiver) versus the sender encoding it once per wire
+    format and receivers forwarding the frame (serialize-once).
+    """
+    help = 'Measure serialization CPU per broadcast for different room sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--broadcasts', type=int, default=5000,
+                            help='Broadcasts per room size and strategy')
+
+    def handle(self, *args, **options):
+        broadcasts = options['broadcasts']
+        payloads = sample_payloads()
+        backends = ['json'] + (['orjson'] if orjson is not None else [])
+
+        self.stdout.write(
+            f'{"room":>4} {"payload":<13} {"strategy":<22} {"us/broadcast":>13} {"speedup":>8}'
+        )
+        for size in ROOM_SIZES:
+            for name in ('media_state', 'offer'):
+                message = payloads[name]
+                baseline = self._cpu(self._per_receiver, message, size, broadcasts)
+                self.stdout.write(self._format(size, name, 'per-receiver json', baseline, baseline))
+                for backend in backends:
+                    dumps = get_json_backend(backend)[0]
+                    elapsed = self._cpu(
+                        lambda m, n: self._serialize_once(m, n, dumps), message, size, broadcasts
+                    )
+                    self.stdout.write(
+                        self._format(size, name, f'serialize-once {backend}', elapsed, baseline)
+                    )
+
+    def _per_receiver(self, message, size):
+        # Each consumer rebuilds the client message from the event and encodes it
+        for _ in range(size - 1):
+            json.dumps(dict(message))
+
+    def _serialize_once(self, message, size, dumps):
+        event = {'text': dumps(message), 'bytes': encode_msgpack(message)}
+        for _ in range(size - 1):
+            event['text']
+
+    def _cpu(self, broadcast, message, size, broadcasts):
+        started = time.process_time()
+        for _ in range(broadcasts):
+            broadcast(message, size)
+        return (time.process_time() - started) / broadcasts * 1e6
+
+    def _format(self, size, name, strategy, elapsed, baseline):
+        return (
+            f'{size:>4} {name:<13} {strategy:<22} {elapsed:>13.1f} '
+            f'{baseline / elapsed if elapsed else 0:>7.1f}x'
+        )
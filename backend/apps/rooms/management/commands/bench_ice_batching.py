@@ -0,0 +1,131 @@
+# rooms/management/commands/bench_ice_batching.py - ICE candidate batching benchmark
+import asyncio
+import json
+import logging
+import random
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from apps.rooms.models import RoomManager
+from apps.rooms.routing import websocket_urlpatterns
+
+
+class Command(BaseCommand):
+    """
+    Simulate call setups in which both peers trickle a burst of ICE candidates
+    and count the channel layer messages and WebSocket frames they cause, with
+    and without the batching window.
+    """
+    help = 'Measure channel layer messages per call setup with and without ICE batching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=20, help='Call setups per mode')
+        parser.add_argument('--candidates', type=int, default=12,
+                            help='Candidates trickled by each peer (default: 12)')
+        parser.add_argument('--burst-ms', type=int, default=300,
+                            help='Time over which each peer trickles its candidates')
+        parser.add_argument('--window-ms', type=int, default=50,
+                            help='Batch window of the batched mode (default: 50)')
+
+    def handle(self, *args, **options):
+        logging.getLogger('apps.rooms').setLevel(logging.WARNING)
+        self.application = URLRouter(websocket_urlpatterns)
+
+        self.stdout.write(
+            f'{"mode":<8} {"window":>7} {"cands/call":>11} {"layer msgs/call":>16} '
+            f'{"frames/call":>12} {"reduction":>10}'
+        )
+        baseline = None
+        for mode, window in (('single', 0), ('batched', options['window_ms'])):
+            room_ids = [RoomManager.create_room()['room_id'] for _ in range(options['calls'])]
+            try:
+                with override_settings(ICE_BATCH_WINDOW_MS=window):
+                    candidates, messages, frames = asyncio.run(
+                        self._run(room_ids, mode == 'batched', options)
+                    )
+            finally:
+                for room_id in room_ids:
+                    RoomManager.delete_room(room_id)
+            calls = options['calls']
+            if baseline is None:
+                baseline = messages
+            reduction = (1 - messages / baseline) * 100 if baseline else 0
+            self.stdout.write(
+                f'{mode:<8} {window:>5}ms {candidates / calls:>11.1f} {messages / calls:>16.1f} '
+                f'{frames / calls:>12.1f} {reduction:>9.1f}%'
+            )
+
+    async def _run(self, room_ids, batch_client, options):
+        layer = get_channel_layer()
+        counts = {'messages': 0}
+        original_send, original_group_send = layer.send, layer.group_send
+
+        async def counted_send(*args, **kwargs):
+            counts['messages'] += 1
+            return await original_send(*args, **kwargs)
+
+        async def counted_group_send(*args, **kwargs):
+            counts['messages'] += 1
+            return await original_group_send(*args, **kwargs)
+
+        total_candidates = total_frames = 0
+        try:
+            for room_id in room_ids:
+                peers = await self._connect_pair(room_id, batch_client)
+                layer.send, layer.group_send = counted_send, counted_group_send
+                await asyncio.gather(*(
+                    self._trickle(communicator, target, options)
+                    for communicator, target in peers
+                ))
+                for communicator, _ in peers:
+                    total_frames += await self._drain(communicator, options['window_ms'])
+                layer.send, layer.group_send = original_send, original_group_send
+
+                for communicator, _ in peers:
+                    await communicator.disconnect()
+                total_candidates += 2 * options['candidates']
+        finally:
+            layer.send, layer.group_send = original_send, original_group_send
+
+        return total_candidates, counts['messages'], total_frames
+
+    async def _connect_pair(self, room_id, batch_client):
+        query = '?ice_batch=1' if batch_client else ''
+        first = WebsocketCommunicator(self.application, f'/ws/room/{room_id}/{query}')
+        await first.connect()
+        first_session = json.loads(await first.receive_from())
+        second = WebsocketCommunicator(self.application, f'/ws/room/{room_id}/{query}')
+        await second.connect()
+        second_session = json.loads(await second.receive_from())
+        return [
+            (first, second_session['participant_id']),
+            (second, first_session['participant_id'])
+        ]
+
+    async def _trickle(self, communicator, target, options):
+        delays = sorted(random.uniform(0, options['burst_ms'] / 1000)
+                        for _ in range(options['candidates']))
+        elapsed = 0
+        for index, delay in enumerate(delays):
+            await asyncio.sleep(delay - elapsed)
+            elapsed = delay
+            await communicator.send_json_to({
+                'type': 'ice_candidate',
+                'target': target,
+                'candidate': {
+                    'candidate': f'candidate:{index} 1 udp 2122260223 192.0.2.{index} 54400 typ host',
+                    'sdpMid': '0',
+                    'sdpMLineIndex': 0,
+                },
+            })
+
+    async def _drain(self, communicator, window_ms):
+        frames = 0
+        timeout = window_ms / 1000 + 0.2
+        while not await communicator.receive_nothing(timeout):
+            message = json.loads(await communicator.receive_from())
+            if message['type'] in ('ice_candidate', 'ice_candidates'):
+                frames += 1
+        return frames
@@ -0,0 +1,142 @@
+# rooms/management/commands/bench_mesh_setup.py - Mesh call setup load test
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from apps.rooms.models import RoomManager
+from apps.rooms.routing import websocket_urlpatterns
+
+# Stand-in session description of a typical audio + video offer
+FAKE_SDP = 'v=0\r\n' + 'a=candidate-placeholder\r\n' * 100
+
+
+class Command(BaseCommand):
+    """
+    Fill mesh rooms with simulated clients that offer when told a peer
+    joined and answer every offer they get, and count the signaling
+    messages and time until every pair has negotiated. The server announces
+    each joiner to the existing peers one at a time; clients sending
+    untargeted offers (answered by every peer) are compared with clients
+    sending each offer to the announced peer only.
+    """
+    help = 'Measure signaling messages and setup time of 4-, 6- and 8-person calls'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='4,6,8', help='Room sizes (default: 4,6,8)')
+        parser.add_argument('--calls', type=int, default=5, help='Calls per size and mode')
+        parser.add_argument('--timeout', type=float, default=30,
+                            help='Seconds to wait for a call to finish negotiating')
+
+    def handle(self, *args, **options):
+        logging.getLogger('apps.rooms').setLevel(logging.WARNING)
+        self.application = URLRouter(websocket_urlpatterns)
+        sizes = [int(size) for size in options['sizes'].split(',')]
+
+        self.stdout.write(
+            f'{"size":>4} {"mode":<10} {"pairs":>6} {"offers":>7} {"answers":>8} '
+            f'{"layer msgs":>11} {"p50 setup ms":>13} {"complete":>9}'
+        )
+        for size in sizes:
+            for mode in ('untargeted', 'targeted'):
+                room_ids = [
+                    RoomManager.create_room(max_participants=size)['room_id']
+                    for _ in range(options['calls'])
+                ]
+                try:
+                    results = asyncio.run(
+                        self._run(room_ids, size, mode == 'targeted', options['timeout'])
+                    )
+                finally:
+                    for room_id in room_ids:
+                        RoomManager.delete_room(room_id)
+                self.stdout.write(self._format(size, mode, results))
+
+    async def _run(self, room_ids, size, targeted, timeout):
+        layer = get_channel_layer()
+        counts = Counter()
+        original_send, original_group_send = layer.send, layer.group_send
+
+        async def counted_send(*args, **kwargs):
+            counts['layer'] += 1
+            return await original_send(*args, **kwargs)
+
+        async def counted_group_send(*args, **kwargs):
+            counts['layer'] += 1
+            return await original_group_send(*args, **kwargs)
+
+        setup_times = []
+        layer.send, layer.group_send = counted_send, counted_group_send
+        try:
+            for room_id in room_ids:
+                elapsed, complete = await self._call(room_id, size, targeted, counts, timeout)
+                setup_times.append(elapsed)
+                counts['complete'] += complete
+        finally:
+            layer.send, layer.group_send = original_send, original_group_send
+
+        return counts, setup_times, len(room_ids)
+
+    async def _call(self, room_id, size, targeted, counts, timeout):
+        pairs = set()
+        expected = size * (size - 1) // 2
+        done = asyncio.Event()
+        communicators, tasks = [], []
+
+        started = time.perf_counter()
+        try:
+            for _ in range(size):
+                communicator = WebsocketCommunicator(self.application, f'/ws/room/{room_id}/')
+                await communicator.connect()
+                session = json.loads(await communicator.receive_from())
+                communicators.append(communicator)
+                tasks.append(asyncio.create_task(self._client(
+                    communicator, session['participant_id'], targeted, pairs, expected, counts, done
+                )))
+            try:
+                await asyncio.wait_for(done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            elapsed = (time.perf_counter() - started) * 1000
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*(c.disconnect() for c in communicators), return_exceptions=True)
+
+        return elapsed, done.is_set()
+
+    async def _client(self, communicator, participant_id, targeted, pairs, expected, counts, done):
+        """A client that offers to peers announced to it and answers every offer"""
+        while True:
+            message = json.loads(await communicator.receive_from(timeout=3600))
+            if message['type'] == 'user_joined':
+                offer = {'type': 'offer', 'offer': {'type': 'offer', 'sdp': FAKE_SDP}}
+                if targeted:
+                    offer['target'] = message['participant_id']
+                counts['offers'] += 1
+                await communicator.send_json_to(offer)
+            elif message['type'] == 'webrtc_offer':
+                counts['answers'] += 1
+                await communicator.send_json_to({
+                    'type': 'answer',
+                    'answer': {'type': 'answer', 'sdp': FAKE_SDP},
+                    'target': message['sender'],
+                })
+            elif message['type'] == 'webrtc_answer':
+                pairs.add(frozenset((participant_id, message['sender'])))
+                if len(pairs) >= expected:
+                    done.set()
+
+    def _format(self, size, mode, results):
+        counts, setup_times, calls = results
+        setup_times.sort()
+        return (
+            f'{size:>4} {mode:<10} {size * (size - 1) // 2:>6} {counts["offers"] / calls:>7.1f} '
+            f'{counts["answers"] / calls:>8.1f} {counts["layer"] / calls:>11.1f} '
+            f'{setup_times[len(setup_times) // 2]:>13.1f} {counts["complete"]:>5}/{calls:<3}'
+        )
@@ -0,0 +1,133 @@
+# rooms/management/commands/bench_room_storage.py - Room storage layout benchmark
+import time
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from redis.exceptions import ResponseError
+from apps.rooms.models import RoomManager, PARTICIPANTS_SUFFIX
+
+
+class Command(BaseCommand):
+    """
+    Compare the legacy layout (one pickled dict per room, rewritten on every
+    change) with the field-level layout (hash + participants set).
+
+    Bytes moved are taken from the Redis server's own network counters, so
+    run it against an otherwise idle Redis instance.
+    """
+    help = 'Benchmark bytes moved and ops/sec of the legacy and field-level room layouts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=200, help='Number of rooms per layout')
+        parser.add_argument('--participants', type=int, default=8,
+                            help='Participants already in each room')
+        parser.add_argument('--rounds', type=int, default=5, help='Operations per room')
+
+    def handle(self, *args, **options):
+        self.connection = RoomManager._get_redis_connection()
+        rooms = options['rooms']
+        participants = options['participants']
+        rounds = options['rounds']
+
+        legacy_ids = [f'bench-legacy-{i}' for i in range(rooms)]
+        field_ids = [f'bench-field-{i}' for i in range(rooms)]
+
+        try:
+            self._seed_legacy(legacy_ids, participants)
+            self._seed_fields(field_ids, participants)
+
+            results = [
+                ('legacy', 'read', self._measure(
+                    lambda room_id: cache.get(f'room_{room_id}'), legacy_ids, rounds)),
+                ('field', 'read', self._measure(
+                    lambda room_id: RoomManager.get_room_by_id(
+                        room_id,
+                        fields=('room_id', 'is_active', 'expires_at', 'participant_count')
+                    ), field_ids, rounds)),
+                ('legacy', 'join', self._measure(
+                    self._legacy_join, legacy_ids, rounds)),
+                ('field', 'join', self._measure(
+                    lambda room_id: RoomManager._execute_join(room_id, self._next_participant()),
+                    field_ids, rounds)),
+            ]
+        finally:
+            self._cleanup(legacy_ids, field_ids)
+
+        self.stdout.write(f'{"layout":<8} {"op":<6} {"ops/sec":>10} {"bytes/op":>10}')
+        for layout, op, (ops_per_sec, bytes_per_op) in results:
+            bytes_text = f'{bytes_per_op:>10.0f}' if bytes_per_op is not None else f'{"n/a":>10}'
+            self.stdout.write(f'{layout:<8} {op:<6} {ops_per_sec:>10.0f} {bytes_text}')
+
+    def _next_participant(self):
+        self._counter = getattr(self, '_counter', 0) + 1
+        return f'bench-participant-{self._counter}'
+
+    def _room_template(self, room_id, participants):
+        expires_at = timezone.now() + timedelta(hours=1)
+        return {
+            'room_id': room_id,
+            'short_code': room_id[-6:],
+            'created_at': timezone.now().isoformat(),
+            'participants': [f'{room_id}-p{i}' for i in range(participants)],
+            'is_active': True,
+            'expires_at': expires_at.isoformat(),
+            'expires_ts': int(expires_at.timestamp()),
+            'creator_ip': '127.0.0.1',
+            'max_participants': 1000000,
+        }
+
+    def _seed_legacy(self, room_ids, participants):
+        for room_id in room_ids:
+            cache.set(f'room_{room_id}', self._room_template(room_id, participants), timeout=3600)
+
+    def _seed_fields(self, room_ids, participants):
+        pipe = self.connection.pipeline()
+        for room_id in room_ids:
+            room_data = self._room_template(room_id, participants)
+            pipe.hset(RoomManager._room_key(room_id), mapping=RoomManager._encode_room(room_data))
+            pipe.expire(RoomManager._room_key(room_id), 3600)
+            pipe.sadd(RoomManager._participants_key(room_id), *room_data['participants'])
+            pipe.expire(RoomManager._participants_key(room_id), 3600)
+        pipe.execute()
+
+    def _legacy_join(self, room_id):
+        """Read-modify-write cycle of the legacy join_room"""
+        room_data = cache.get(f'room_{room_id}')
+        room_data['participants'].append(self._next_participant())
+        cache.set(f'room_{room_id}', room_data, timeout=3600)
+
+    def _network_bytes(self):
+        try:
+            stats = self.connection.info('stats')
+        except ResponseError:
+            return None
+        if 'total_net_input_bytes' not in stats:
+            return None
+        return stats['total_net_input_bytes'] + stats['total_net_output_bytes']
+
+    def _measure(self, operation, room_ids, rounds):
+        # INFO itself moves bytes; measure it so it can be subtracted
+        baseline = self._network_bytes()
+        info_cost = self._network_bytes() - baseline if baseline is not None else 0
+
+        before = self._network_bytes()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for room_id in room_ids:
+                operation(room_id)
+        elapsed = time.perf_counter() - started
+        after = self._network_bytes()
+
+        total_ops = rounds * len(room_ids)
+        bytes_per_op = None
+        if before is not None:
+            bytes_per_op = (after - before - info_cost) / total_ops
+        return total_ops / elapsed, bytes_per_op
+
+    def _cleanup(self, legacy_ids, field_ids):
+        keys = [cache.make_key(f'room_{room_id}') for room_id in legacy_ids]
+        for room_id in field_ids:
+            keys.append(RoomManager._room_key(room_id))
+            keys.append(RoomManager._room_key(room_id) + PARTICIPANTS_SUFFIX)
+        self.connection.delete(*keys)
@@ -0,0 +1,143 @@
+# rooms/management/commands/bench_signaling_codec.py - JSON vs MessagePack frame benchmark
+import time
+from django.core.management.base import BaseCommand
+from apps.rooms.protocol import decode_json, decode_msgpack, encode_json, encode_msgpack
+
+CODECS = {
+    'json': (encode_json, decode_json),
+    'msgpack': (encode_msgpack, decode_msgpack),
+}
+
+
+def _media_section(kind, mid, port, payload_types, codecs):
+    """One m= section the way a browser writes it in an offer"""
+    lines = [
+        f'm={kind} {port} UDP/TLS/RTP/SAVPF {" ".join(str(pt) for pt in payload_types)}',
+        'c=IN IP4 0.0.0.0',
+        'a=rtcp:9 IN IP4 0.0.0.0',
+        'a=ice-ufrag:Vx3j',
+        'a=ice-pwd:q7JZpV1n6sD0kHsWcF3m4fL+',
+        'a=ice-options:trickle',
+        'a=fingerprint:sha-256 5C:8F:2B:1E:6A:9D:43:70:B2:1F:E4:88:0C:3A:D6:51:'
+        '97:2E:4B:C0:19:7F:A3:6D:85:E2:01:5B:9C:34:DA:E7',
+        'a=setup:actpass',
+        f'a=mid:{mid}',
+        'a=extmap:1 urn:ietf:params:rtp-hdrext:ssrc-audio-level',
+        'a=extmap:2 http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time',
+        'a=extmap:3 http://www.ietf.org/id/draft-holmer-rmcat-transport-wide-cc-extensions-01',
+        'a=sendrecv',
+        'a=msid:3d1b6f2e-6b3c-4a5e-9d2f-0c7a8e4b1f9a 8a7c2e5d-1b4f-4c3e-a6d9-2f0e7b5c3a1d',
+        'a=rtcp-mux',
+    ]
+    for payload_type, codec in zip(payload_types, codecs):
+        lines.append(f'a=rtpmap:{payload_type} {codec}')
+        lines.append(f'a=rtcp-fb:{payload_type} transport-cc')
+        if kind == 'video':
+            lines.append(f'a=rtcp-fb:{payload_type} nack')
+            lines.append(f'a=rtcp-fb:{payload_type} nack pli')
+            lines.append(f'a=rtcp-fb:{payload_type} ccm fir')
+    lines.append('a=ssrc:2891634457 cname:f3Ykq0M6xg5zB8rL')
+    return lines
+
+
+def _sdp():
+    lines = [
+        'v=0',
+        'o=- 4611731400430051336 2 IN IP4 127.0.0.1',
+        's=-',
+        't=0 0',
+        'a=group:BUNDLE 0 1',
+        'a=extmap-allow-mixed',
+        'a=msid-semantic: WMS 3d1b6f2e-6b3c-4a5e-9d2f-0c7a8e4b1f9a',
+    ]
+    lines += _media_section('audio', 0, 9, [111, 63, 9, 0, 8, 13, 110, 126],
+                            ['opus/48000/2', 'red/48000/2', 'G722/8000', 'PCMU/8000',
+                             'PCMA/8000', 'CN/8000', 'telephone-event/48000',
+                             'telephone-event/8000'])
+    lines += _media_section('video', 1, 9, [96, 97, 102, 103, 104, 105, 106, 107, 108, 109],
+                            ['VP8/90000', 'rtx/90000', 'H264/90000', 'rtx/90000',
+                             'H264/90000', 'rtx/90000', 'VP9/90000', 'rtx/90000',
+                             'AV1/90000', 'rtx/90000'])
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def _candidate(index):
+    return {
+        'candidate': f'candidate:{842163049 + index} 1 udp {2122260223 - index * 256} '
+                     f'192.168.1.{10 + index} {50000 + index} typ host generation 0 '
+                     f'ufrag Vx3j network-id 1',
+        'sdpMid': '0',
+        'sdpMLineIndex': 0,
+        'usernameFragment': 'Vx3j',
+    }
+
+
+def sample_payloads():
+    """Signaling messages as clients receive them during a call setup"""
+    sender = 'k2m9x1q8w7e6r5t4y3u2i1o0p9a8s7d6'
+    timestamp = '2025-01-01T12:00:00.000000+00:00'
+    return {
+        'offer': {
+            'type': 'webrtc_offer',
+            'offer': {'type': 'offer', 'sdp': _sdp()},
+            'sender': sender,
+            'timestamp': timestamp,
+        },
+        'answer': {
+            'type': 'webrtc_answer',
+            'answer': {'type': 'answer', 'sdp': _sdp().replace('a=setup:actpass', 'a=setup:active')},
+            'sender': sender,
+            'timestamp': timestamp,
+        },
+        'ice_candidate': {
+            'type': 'ice_candidate',
+            'candidate': _candidate(0),
+            'sender': sender,
+            'timestamp': timestamp,
+        },
+        'ice_candidates': {
+            'type': 'ice_candidates',
+            'candidates': [_candidate(i) for i in range(8)],
+            'sender': sender,
+            'timestamp': timestamp,
+        },
+        'media_state': {
+            'type': 'media_state_update',
+            'participant_id': sender,
+            'state': {'audio': True, 'video': False, 'screen': False},
+            'timestamp': timestamp,
+        },
+    }
+
+
+class Command(BaseCommand):
+    """
+    Compare JSON text frames with MessagePack binary frames on realistic
+    signaling payloads: frame size and encode/decode throughput.
+    """
+    help = 'Benchmark JSON and MessagePack signaling frame size and throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000,
+                            help='Encode/decode operations per payload and codec')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        self.stdout.write(
+            f'{"payload":<15} {"codec":<8} {"bytes":>7} {"encode/s":>10} {"decode/s":>10}'
+        )
+        for name, message in sample_payloads().items():
+            for codec, (encode, decode) in CODECS.items():
+                frame = encode(message)
+                self.stdout.write(
+                    f'{name:<15} {codec:<8} {len(frame):>7} '
+                    f'{self._rate(encode, message, iterations):>10.0f} '
+                    f'{self._rate(decode, frame, iterations):>10.0f}'
+                )
+
+    def _rate(self, operation, argument, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            operation(argument)
+        return iterations / (time.perf_counter() - started)
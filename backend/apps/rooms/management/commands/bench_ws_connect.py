@@ -0,0 +1,166 @@
+# rooms/management/commands/bench_ws_connect.py - WebSocket connection storm benchmark
+import asyncio
+import logging
+import secrets
+import statistics
+import time
+from collections import Counter
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.urls import path
+from apps.rooms.consumers import VideoCallConsumer
+from apps.rooms.models import AsyncRoomManager, RoomManager
+
+
+class CheckThenActConsumer(VideoCallConsumer):
+    """
+    Consumer variant admitting sockets the way connect used to: read the
+    room, compare its occupancy with the capacity, then register the channel
+    and create the resume token in separate round trips. Nothing is reserved
+    between the check and the registration.
+    """
+
+    async def admit(self, resume_token):
+        room_data = await sync_to_async(RoomManager.get_room_by_id, thread_sensitive=False)(
+            self.room_id,
+            fields=('participants', 'live_participant_count', 'max_participants', 'expires_ts')
+        )
+        if not room_data:
+            return {'status': 'not_found'}
+
+        participants = room_data['participants']
+        if room_data['live_participant_count'] >= room_data['max_participants'] \
+                and self.participant_id not in participants:
+            return {'status': 'full'}
+
+        channels = await self.register_channel(room_data['expires_ts'])
+        is_member = self.participant_id in participants and await AsyncRoomManager.refresh_presence(
+            self.room_id, self.participant_id, room_data['expires_ts']
+        )
+        return {
+            'status': 'admitted',
+            'participant_id': self.participant_id,
+            'resumed': False,
+            'is_member': is_member,
+            'expires_ts': room_data['expires_ts'],
+            'resume_token': await self.create_resume_token(room_data['expires_ts']),
+            'channels': channels
+        }
+
+    async def register_channel(self, expires_ts):
+        """Record this socket's channel and read back the room's registry"""
+        key = RoomManager._channels_key(self.room_id)
+        pipe = AsyncRoomManager._get_redis_connection(self.room_id).pipeline()
+        pipe.hset(key, self.participant_id, self.channel_name)
+        pipe.expireat(key, expires_ts)
+        pipe.hgetall(key)
+        _, _, channels = await pipe.execute()
+        return {participant.decode(): channel.decode() for participant, channel in channels.items()}
+
+    async def create_resume_token(self, expires_ts):
+        token = secrets.token_urlsafe(24)
+        key = RoomManager._resume_key(token)
+        pipe = AsyncRoomManager._get_redis_connection(self.room_id).pipeline()
+        pipe.hset(key, mapping={'room_id': self.room_id, 'participant_id': self.participant_id})
+        pipe.expireat(key, expires_ts)
+        await pipe.execute()
+        return token
+
+
+CONSUMERS = {
+    'check-then-act': CheckThenActConsumer,
+    'atomic': VideoCallConsumer,
+}
+
+
+class Command(BaseCommand):
+    """
+    Open many WebSocket connections at the same moment, more per room than
+    the room holds, and report handshake latency percentiles and how many
+    rooms admitted more sockets than their capacity. Compares the old
+    check-then-act admission with the single-step atomic one.
+    """
+    help = 'Measure WebSocket handshake latency and over-admission under a connection storm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000,
+                            help='Simultaneous connections (default: 1000)')
+        parser.add_argument('--per-room', type=int, default=4,
+                            help='Connections racing for each room (default: 4)')
+        parser.add_argument('--mode', choices=['check-then-act', 'atomic', 'both'], default='both')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Per-connection connect timeout in seconds')
+
+    def handle(self, *args, **options):
+        connections = options['connections']
+        # Per-connection INFO logging would dominate the measurement
+        logging.getLogger('apps.rooms').setLevel(logging.WARNING)
+
+        capacity = getattr(settings, 'MAX_PARTICIPANTS_PER_ROOM', 2)
+        room_count = -(-connections // max(options['per_room'], 1))
+        modes = ['check-then-act', 'atomic'] if options['mode'] == 'both' else [options['mode']]
+
+        self.stdout.write(
+            f'{"mode":<15} {"conns":>6} {"ok":>6} {"full":>6} {"p50 ms":>8} {"p95 ms":>8} '
+            f'{"p99 ms":>8} {"max ms":>8} {"over-admitted":>14} {"wall s":>7}'
+        )
+        for mode in modes:
+            # Fresh rooms per mode, so every mode races for empty rooms
+            room_ids = [RoomManager.create_room()['room_id'] for _ in range(room_count)]
+            try:
+                result = asyncio.run(
+                    self._storm(CONSUMERS[mode], room_ids, connections, capacity, options['timeout'])
+                )
+            finally:
+                for room_id in room_ids:
+                    RoomManager.delete_room(room_id)
+            self.stdout.write(self._format(mode, connections, *result))
+
+    async def _storm(self, consumer_class, room_ids, connections, capacity, timeout):
+        application = URLRouter([
+            path('ws/room/<str:room_id>/', consumer_class.as_asgi()),
+        ])
+        targets = [room_ids[i % len(room_ids)] for i in range(connections)]
+        communicators = [
+            WebsocketCommunicator(application, f'/ws/room/{room_id}/')
+            for room_id in targets
+        ]
+
+        async def connect(communicator):
+            started = time.perf_counter()
+            try:
+                connected, code = await communicator.connect(timeout=timeout)
+            except asyncio.TimeoutError:
+                connected, code = False, None
+            return connected, code, (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(connect(c) for c in communicators))
+        wall = time.perf_counter() - started
+
+        await asyncio.gather(
+            *(c.disconnect() for c in communicators),
+            return_exceptions=True
+        )
+
+        admitted = Counter(room_id for room_id, (connected, _, _) in zip(targets, results) if connected)
+        over_admitted = sum(1 for count in admitted.values() if count > capacity)
+        full = sum(1 for connected, code, _ in results if not connected and code == 4003)
+        latencies = sorted(latency for connected, code, latency in results if connected or code == 4003)
+        return latencies, sum(admitted.values()), full, over_admitted, wall
+
+    def _format(self, mode, connections, latencies, ok, full, over_admitted, wall):
+        if not latencies:
+            return f'{mode:<15} {connections:>6} {0:>6} (no completed handshakes)'
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return (
+            f'{mode:<15} {connections:>6} {ok:>6} {full:>6} '
+            f'{statistics.median(latencies):>8.1f} {percentile(0.95):>8.1f} '
+            f'{percentile(0.99):>8.1f} {latencies[-1]:>8.1f} {over_admitted:>14} {wall:>7.2f}'
+        )
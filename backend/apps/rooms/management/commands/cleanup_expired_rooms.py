@@ -0,0 +1,57 @@
+# rooms/management/commands/cleanup_expired_rooms.py - Expired room sweeper
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.rooms.models import RoomManager
+
+
+class Command(BaseCommand):
+    """
+    Drain expired rooms from the expiry index and reap participants whose
+    presence lapsed. Suitable for cron; use --interval to keep running as a
+    standalone sweeper process.
+    """
+    help = 'Delete expired rooms and remove stale participants'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'ROOM_SWEEPER_BATCH_SIZE', 500),
+            help='Rooms claimed per batch'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Stop after this many batches per run (default: drain everything)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Repeat every N seconds instead of running once'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            stats = RoomManager.cleanup_expired_rooms(
+                batch_size=options['batch_size'],
+                max_batches=options['max_batches']
+            )
+            self.stdout.write(
+                f"expired={stats['expired']} keys_deleted={stats['keys_deleted']} "
+                f"batches={stats['batches']} duration_ms={stats['duration_ms']}"
+            )
+            stats = RoomManager.reap_stale_participants(
+                batch_size=options['batch_size'],
+                max_batches=options['max_batches']
+            )
+            self.stdout.write(
+                f"reaped={stats['reaped']} rooms={stats['rooms']} rooms_deleted={stats['deleted']} "
+                f"duration_ms={stats['duration_ms']}"
+            )
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,39 @@
+# rooms/management/commands/migrate_room_storage.py - Convert legacy room blobs
+from django.core.management.base import BaseCommand
+from apps.rooms.models import RoomManager
+
+
+class Command(BaseCommand):
+    """
+    Convert rooms stored as a single pickled/JSON blob into the hash/set
+    layout. Rooms are also converted lazily on first access, so running
+    this command after a deploy is optional.
+    """
+    help = 'Convert rooms stored in the legacy blob format to the hash/set layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='SCAN batch size (default: 500)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report legacy keys without converting them'
+        )
+
+    def handle(self, *args, **options):
+        found = converted = 0
+
+        for key in RoomManager.iter_legacy_keys(batch_size=options['batch_size']):
+            found += 1
+            if options['dry_run']:
+                self.stdout.write(key.decode())
+            elif RoomManager.migrate_legacy_key(key):
+                converted += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Legacy keys found: {found}, converted: {converted}'
+        ))
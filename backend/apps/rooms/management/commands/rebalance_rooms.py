@@ -0,0 +1,93 @@
+# rooms/management/commands/rebalance_rooms.py - Move rooms after REDIS_SHARD_URLS changed
+from django.core.management.base import BaseCommand
+from apps.rooms.models import RoomManager
+from apps.rooms.sharding import get_ring
+
+
+class Command(BaseCommand):
+    """
+    Move rooms to the shard the hash ring assigns them after a Redis node
+    was added to or removed from REDIS_SHARD_URLS. Each shard's expiry index
+    lists the rooms it holds; rooms the ring now places elsewhere are copied
+    key by key (DUMP/RESTORE, keeping their TTL) with their index entries and
+    removed from the old node. Only about 1/N of the rooms move.
+
+    Run it with the deploy that changes the shard list: workers reconnect
+    their sockets, which join the room group on its new shard. Resume tokens
+    of moved rooms are not carried over, so dropped clients rejoin afresh.
+    Rooms created before sharding whose short code falls in another slot
+    than their ID stay reachable by ID only; they expire within
+    ROOM_EXPIRY_HOURS.
+    """
+    help = 'Move rooms to their shard after REDIS_SHARD_URLS changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='ZSCAN batch size (default: 500)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report rooms that would move'
+        )
+
+    def handle(self, *args, **options):
+        ring = get_ring()
+        checked = moved = 0
+
+        for shard in range(len(ring.nodes)):
+            source = RoomManager._get_redis_connection(shard=shard)
+            rooms = list(source.zscan_iter(RoomManager._expiry_index_key(), count=options['batch_size']))
+
+            for room_id, expires_ts in rooms:
+                room_id = room_id.decode()
+                checked += 1
+                target_shard = ring.shard_for(room_id)
+                if target_shard == shard:
+                    continue
+
+                moved += 1
+                if options['dry_run']:
+                    self.stdout.write(f'{room_id}: shard {shard} -> {target_shard}')
+                    continue
+                self._move_room(
+                    room_id, expires_ts, source, RoomManager._get_redis_connection(shard=target_shard)
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rooms checked: {checked}, {"to move" if options["dry_run"] else "moved"}: {moved}'
+        ))
+
+    def _move_room(self, room_id, expires_ts, source, target):
+        keys = RoomManager._room_data_keys(room_id)
+        short_code = source.hget(keys[0], 'short_code')
+        if short_code:
+            keys.append(RoomManager._code_key(short_code.decode()))
+        keys.extend(source.scan_iter(match=RoomManager._replay_key(room_id, '*')))
+
+        pipe = source.pipeline(transaction=False)
+        for key in keys:
+            pipe.dump(key)
+            pipe.pttl(key)
+        pipe.zscore(RoomManager._presence_index_key(), room_id)
+        replies = pipe.execute()
+        presence_deadline = replies.pop()
+
+        pipe = target.pipeline()
+        for key, dumped, ttl in zip(keys, replies[::2], replies[1::2]):
+            # Keys that expired meanwhile dump as None
+            if dumped is not None:
+                pipe.restore(key, max(ttl, 0), dumped, replace=True)
+        pipe.zadd(RoomManager._expiry_index_key(), {room_id: expires_ts})
+        if presence_deadline is not None:
+            pipe.zadd(RoomManager._presence_index_key(), {room_id: presence_deadline})
+        pipe.execute()
+
+        pipe = source.pipeline()
+        pipe.delete(*keys)
+        pipe.zrem(RoomManager._expiry_index_key(), room_id)
+        pipe.zrem(RoomManager._presence_index_key(), room_id)
+        pipe.execute()
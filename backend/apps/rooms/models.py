@@ -1,24 +1,327 @@
 # rooms/models.py - Room management models
+import asyncio
+import json
+import logging
+import time
+import weakref
 import uuid
 import string
 import secrets
+import redis
 from datetime import timedelta
 from django.conf import settings
 from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from redis import asyncio as aioredis
+from redis.exceptions import ResponseError
+from apps.rooms.activity import buffer_activity, log_activity, write_activity_rows
+from apps.rooms.scripts import (
+    ADMIT_SOCKET_SCRIPT,
+    CLAIM_EXPIRED_ROOMS_SCRIPT,
+    CLAIM_ROOM_WORKER_SCRIPT,
+    JOIN_ROOM_SCRIPT,
+    LEAVE_ROOM_SCRIPT,
+    REAP_STALE_PARTICIPANTS_SCRIPT,
+    REFRESH_PRESENCE_SCRIPT,
+    RELEASE_ROOM_WORKER_SCRIPT,
+    TAKE_ROOM_TOKENS_SCRIPT,
+    UNREGISTER_CHANNEL_SCRIPT,
+)
+from apps.rooms.sharding import get_ring, is_room_id, room_slot, shard_url
+
+logger = logging.getLogger(__name__)
+
+JOIN_MESSAGES = {
+    'not_found': "Room not found",
+    'inactive': "Room is not active",
+    'expired': "Room has expired",
+    'full': "Room is full",
+}
+
+# Scalar room fields stored in the room hash
+ROOM_FIELDS = (
+    'room_id',
+    'short_code',
+    'created_at',
+    'is_active',
+    'expires_at',
+    'expires_ts',
+    'creator_ip',
+    'max_participants',
+)
+
+# Decoders for hash values that are not plain strings
+ROOM_FIELD_DECODERS = {
+    'is_active': lambda value: value == '1',
+    'expires_ts': int,
+    'max_participants': int,
+    'creator_ip': lambda value: value or None,
+}
+
+PARTICIPANTS_SUFFIX = '_participants'
+CHANNELS_SUFFIX = '_channels'
+PRESENCE_SUFFIX = '_presence'
+RESERVATIONS_SUFFIX = '_reservations'
+RATE_SUFFIX = '_rate'
+WORKER_SUFFIX = '_worker'
+
+# Suffixes of every per-room key, deleted together with the room
+ROOM_KEY_SUFFIXES = (
+    PARTICIPANTS_SUFFIX, CHANNELS_SUFFIX, PRESENCE_SUFFIX, RESERVATIONS_SUFFIX, RATE_SUFFIX, WORKER_SUFFIX
+)
 
 
 class RoomManager:
     """
     Manager class for room operations using Redis for temporary storage.
     Implements all CRUD operations for video call rooms.
+
+    Each room is stored field by field: scalar fields in a hash, participants
+    in a set and the expiry as an epoch timestamp, so updates only touch the
+    fields that change. Joins and leaves are executed atomically by
+    server-side scripts (see apps.rooms.scripts).
+
+    Rooms are spread over the Redis nodes in REDIS_SHARD_URLS by their ID
+    (see apps.rooms.sharding). Every key of a room, its short code mapping
+    included, lives on the room's shard, and each shard keeps its own expiry
+    and presence indexes.
     """
 
+    _scripts = {}
+    _shard_connections = {}
+
     @staticmethod
     def _get_redis_client():
         """Get Redis client instance"""
         from django.core.cache import cache
         return cache
 
+    @classmethod
+    def _get_redis_connection(cls, room_identifier=None, shard=None):
+        """
+        Get the raw Redis connection of the shard holding a room, found by its
+        ID or short code, or of shard number `shard` (the first by default)
+        """
+        url = shard_url(room_identifier, shard)
+        if url == settings.REDIS_URL:
+            # Share the cache's connection pool
+            from django_redis import get_redis_connection
+            return get_redis_connection('default')
+
+        connection = cls._shard_connections.get(url)
+        if connection is None:
+            connection = redis.Redis.from_url(url)
+            cls._shard_connections[url] = connection
+        return connection
+
+    @staticmethod
+    def _shards():
+        """Indexes of all room storage shards"""
+        return range(len(get_ring().nodes))
+
+    @classmethod
+    def _get_script(cls, name, source):
+        """Register a Lua script once per process"""
+        script = cls._scripts.get(name)
+        if script is None:
+            script = cls._get_redis_connection().register_script(source)
+            cls._scripts[name] = script
+        return script
+
+    @classmethod
+    def _room_key(cls, room_id=''):
+        """Redis key holding scalar room fields"""
+        return cls._get_redis_client().make_key(f'room_{room_id}')
+
+    @classmethod
+    def _participants_key(cls, room_id):
+        """Redis key holding the set of room participants"""
+        return cls._room_key(room_id) + PARTICIPANTS_SUFFIX
+
+    @classmethod
+    def _channels_key(cls, room_id):
+        """Redis key mapping participant IDs to their WebSocket channel names"""
+        return cls._room_key(room_id) + CHANNELS_SUFFIX
+
+    @classmethod
+    def _presence_key(cls, room_id):
+        """Redis sorted set of participant IDs scored by presence deadline"""
+        return cls._room_key(room_id) + PRESENCE_SUFFIX
+
+    @classmethod
+    def _reservations_key(cls, room_id):
+        """Redis sorted set of sockets admitted without joining, scored by presence deadline"""
+        return cls._room_key(room_id) + RESERVATIONS_SUFFIX
+
+    @classmethod
+    def _rate_key(cls, room_id):
+        """Redis hash holding the room-wide signaling rate bucket"""
+        return cls._room_key(room_id) + RATE_SUFFIX
+
+    @classmethod
+    def _worker_key(cls, room_id):
+        """Redis hash naming the worker that owns the room's sockets"""
+        return cls._room_key(room_id) + WORKER_SUFFIX
+
+    @classmethod
+    def _replay_key(cls, room_id, participant_id):
+        """Redis stream buffering signaling messages sent to a participant"""
+        return cls._room_key(room_id) + f'_replay_{participant_id}'
+
+    @classmethod
+    def _resume_key(cls, token):
+        """Redis hash identifying the participant a resume token belongs to"""
+        return cls._get_redis_client().make_key(f'resume_{token}')
+
+    @classmethod
+    def _room_data_keys(cls, room_id):
+        """All per-room keys except the short code mapping"""
+        room_key = cls._room_key(room_id)
+        return [room_key] + [room_key + suffix for suffix in ROOM_KEY_SUFFIXES]
+
+    @classmethod
+    def _code_key(cls, short_code=''):
+        """Redis key mapping a short code to its room ID"""
+        return cls._get_redis_client().make_key(f'room_code_{short_code}')
+
+    @classmethod
+    def _expiry_index_key(cls):
+        """Redis sorted set of room IDs scored by expiry timestamp"""
+        return cls._get_redis_client().make_key('room_expiry_index')
+
+    @classmethod
+    def _presence_index_key(cls):
+        """Redis sorted set of room IDs scored by their earliest presence deadline"""
+        return cls._get_redis_client().make_key('room_presence_index')
+
+    @classmethod
+    def _worker_registry_key(cls):
+        """Redis hash of worker IDs to their published room distribution (first shard)"""
+        return cls._get_redis_client().make_key('room_workers')
+
+    @staticmethod
+    def _encode_room(room_data):
+        """Convert scalar room fields to hash values"""
+        return {
+            'room_id': room_data['room_id'],
+            'short_code': room_data['short_code'],
+            'created_at': room_data['created_at'],
+            'is_active': '1' if room_data.get('is_active', False) else '0',
+            'expires_at': room_data['expires_at'],
+            'expires_ts': int(room_data['expires_ts']),
+            'creator_ip': room_data.get('creator_ip') or '',
+            'max_participants': int(room_data.get('max_participants', 2)),
+        }
+
+    @staticmethod
+    def _decode_fields(fields):
+        """Convert hash values back to room fields"""
+        room_data = {}
+        for field, value in fields.items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            if value is None:
+                room_data[field] = None
+                continue
+            if isinstance(value, bytes):
+                value = value.decode()
+            decoder = ROOM_FIELD_DECODERS.get(field)
+            room_data[field] = decoder(value) if decoder else value
+        return room_data
+
+    @classmethod
+    def _decode_room(cls, fields, participants):
+        """Build the room dict from a flattened hash reply and participant set"""
+        if isinstance(fields, list):
+            fields = dict(zip(fields[::2], fields[1::2]))
+        if not fields:
+            return None
+
+        room_data = cls._decode_fields(fields)
+        room_data['participants'] = [
+            p.decode() if isinstance(p, bytes) else p for p in participants
+        ]
+        return room_data
+
+    @classmethod
+    def _decode_legacy_value(cls, raw):
+        """Decode a room blob written by an older release"""
+        try:
+            return json.loads(raw)
+        except (UnicodeDecodeError, ValueError):
+            return cls._get_redis_client().client.decode(raw)
+
+    @classmethod
+    def migrate_legacy_key(cls, key):
+        """
+        Convert a room blob (pickled or JSON) into the hash/set layout, or a
+        pickled short code mapping into a plain string.
+        Returns True if the key was converted.
+        """
+        if isinstance(key, bytes):
+            key = key.decode()
+        # Key names end with the room ID or short code, which pick the shard
+        prefix = cls._code_key() if key.startswith(cls._code_key()) else cls._room_key()
+        connection = cls._get_redis_connection(key[len(prefix):])
+        if connection.type(key) != b'string':
+            return False
+
+        raw = connection.get(key)
+        if raw is None:
+            return False
+
+        if key.startswith(cls._code_key()):
+            if raw[0] != 0x80:
+                return False
+            value = cls._get_redis_client().client.decode(raw)
+            connection.set(key, value, keepttl=True)
+            return True
+
+        room_data = cls._decode_legacy_value(raw)
+        if 'expires_ts' not in room_data:
+            expires_at = timezone.datetime.fromisoformat(
+                room_data['expires_at'].replace('Z', '+00:00')
+            )
+            room_data['expires_ts'] = int(expires_at.timestamp())
+
+        participants = list(room_data.get('participants') or [])
+        participants_key = key + PARTICIPANTS_SUFFIX
+
+        pipe = connection.pipeline()
+        pipe.delete(key, participants_key)
+        pipe.hset(key, mapping=cls._encode_room(room_data))
+        pipe.expireat(key, room_data['expires_ts'])
+        if participants:
+            pipe.sadd(participants_key, *participants)
+            pipe.expireat(participants_key, room_data['expires_ts'])
+        pipe.zadd(cls._expiry_index_key(), {room_data['room_id']: room_data['expires_ts']})
+        pipe.execute()
+        return True
+
+    @classmethod
+    def iter_legacy_keys(cls, batch_size=500):
+        """Yield room and short code keys still stored in the pre-hash format"""
+        code_prefix = cls._code_key().encode()
+        for shard in cls._shards():
+            connection = cls._get_redis_connection(shard=shard)
+            for key in connection.scan_iter(match=cls._room_key('*'), count=batch_size):
+                if key.endswith(tuple(suffix.encode() for suffix in ROOM_KEY_SUFFIXES)):
+                    continue
+                if key.startswith(code_prefix):
+                    value = connection.get(key)
+                    if value and value[0] == 0x80:
+                        yield key
+                elif connection.type(key) == b'string':
+                    yield key
+
+    @staticmethod
+    def participant_id_for(session_key):
+        """
+        Participant ID of a session: peers see it in every announcement, so it
+        is an HMAC of the session key rather than the key itself
+        """
+        return salted_hmac('apps.rooms.participant', session_key).hexdigest()[:32]
+
     @classmethod
     def generate_short_code(cls, length=None):
         """Generate a unique short code for room access"""
@@ -26,52 +329,59 @@ class RoomManager:
         characters = string.ascii_uppercase + string.digits
 
         # Ensure uniqueness by checking existing codes
-        cache = cls._get_redis_client()
         max_attempts = 100
 
         for _ in range(max_attempts):
             code = ''.join(secrets.choice(characters) for _ in range(length))
-            if not cache.get(f'room_code_{code}'):
+            if not cls._get_redis_connection(code).exists(cls._code_key(code)):
                 return code
 
         raise ValueError("Unable to generate unique short code")
 
+    @staticmethod
+    def _new_room_id(slot):
+        """Random room ID (a version 4 UUID) whose last byte is the given slot"""
+        return str(uuid.UUID(bytes=secrets.token_bytes(15) + bytes([slot]), version=4))
+
     @classmethod
-    def create_room(cls, creator_ip=None):
-        """Create a new video call room"""
-        cache = cls._get_redis_client()
+    def create_room(cls, creator_ip=None, max_participants=None):
+        """
+        Create a new video call room. max_participants defaults to
+        MAX_PARTICIPANTS_PER_ROOM; callers validate it against MAX_ROOM_SIZE.
+        """
+        now = timezone.now()
+        expires_at = now + timedelta(hours=getattr(settings, 'ROOM_EXPIRY_HOURS', 24))
 
+        # The room ID is drawn from the short code's slot, so both lead to
+        # the same shard whichever nodes are added later
+        short_code = cls.generate_short_code()
         room_data = {
-            'room_id': str(uuid.uuid4()),
-            'short_code': cls.generate_short_code(),
-            'created_at': timezone.now().isoformat(),
+            'room_id': cls._new_room_id(room_slot(short_code)),
+            'short_code': short_code,
+            'created_at': now.isoformat(),
             'participants': [],
             'is_active': True,
-            'expires_at': (
-                timezone.now() +
-                timedelta(hours=getattr(settings, 'ROOM_EXPIRY_HOURS', 24))
-            ).isoformat(),
+            'expires_at': expires_at.isoformat(),
+            'expires_ts': int(expires_at.timestamp()),
             'creator_ip': creator_ip,
-            'max_participants': getattr(settings, 'MAX_PARTICIPANTS_PER_ROOM', 2)
+            'max_participants': max_participants or getattr(settings, 'MAX_PARTICIPANTS_PER_ROOM', 2)
         }
 
-        # Store room data with expiration
-        cache.set(
-            f'room_{room_data["room_id"]}',
-            room_data,
-            timeout=getattr(settings, 'ROOM_EXPIRY_HOURS', 24) * 3600
-        )
+        # Store room fields, code mapping and expiry index entry in one
+        # round trip. The participants set is created by the first join.
+        room_key = cls._room_key(room_data['room_id'])
+        code_key = cls._code_key(room_data['short_code'])
 
-        # Create code mapping for easy lookup
-        cache.set(
-            f'room_code_{room_data["short_code"]}',
-            room_data["room_id"],
-            timeout=getattr(settings, 'ROOM_EXPIRY_HOURS', 24) * 3600
-        )
+        pipe = cls._get_redis_connection(room_data['room_id']).pipeline()
+        pipe.hset(room_key, mapping=cls._encode_room(room_data))
+        pipe.expireat(room_key, room_data['expires_ts'])
+        pipe.set(code_key, room_data['room_id'])
+        pipe.expireat(code_key, room_data['expires_ts'])
+        pipe.zadd(cls._expiry_index_key(), {room_data['room_id']: room_data['expires_ts']})
+        pipe.execute()
 
         # Log room creation
-        from apps.core.models import RoomActivityLog
-        RoomActivityLog.objects.create(
+        log_activity(
             room_id=room_data["room_id"],
             action='created',
             ip_address=creator_ip
@@ -80,73 +390,197 @@ class RoomManager:
         return room_data
 
     @classmethod
-    def get_room_by_id(cls, room_id):
-        """Retrieve room data by room ID"""
-        cache = cls._get_redis_client()
-        return cache.get(f'room_{room_id}')
+    def _queue_room_fetch(cls, pipe, room_id, fields):
+        """Queue the commands fetching a room on a pipeline, return the scalar fields"""
+        room_key = cls._room_key(room_id)
+        participants_key = cls._participants_key(room_id)
+
+        if fields is None:
+            pipe.hgetall(room_key)
+            pipe.smembers(participants_key)
+            return None
+
+        scalar_fields = [f for f in fields if f in ROOM_FIELDS]
+        if 'room_id' not in scalar_fields:
+            scalar_fields.append('room_id')
+
+        pipe.hmget(room_key, scalar_fields)
+        if 'participants' in fields:
+            pipe.smembers(participants_key)
+        if 'participant_count' in fields:
+            pipe.scard(participants_key)
+        if 'live_participant_count' in fields:
+            pipe.scard(participants_key)
+            pipe.zcount(cls._presence_key(room_id), '-inf', f'({int(time.time())}')
+        return scalar_fields
+
+    @classmethod
+    def _parse_room_fetch(cls, replies, fields, scalar_fields):
+        """Build room data from the replies of _queue_room_fetch"""
+        if fields is None:
+            return cls._decode_room(*replies)
+
+        values = replies.pop(0)
+        if values[scalar_fields.index('room_id')] is None:
+            return None
+
+        room_data = cls._decode_fields(dict(zip(scalar_fields, values)))
+        if 'participants' in fields:
+            room_data['participants'] = [p.decode() for p in replies.pop(0)]
+        if 'participant_count' in fields:
+            room_data['participant_count'] = replies.pop(0)
+        if 'live_participant_count' in fields:
+            room_data['live_participant_count'] = replies.pop(0) - replies.pop(0)
+        return room_data
+
+    @classmethod
+    def get_room_by_id(cls, room_id, fields=None):
+        """
+        Retrieve room data by room ID.
+
+        fields limits the reply to the given room fields. Besides the
+        scalar fields, 'participants' returns the participant list,
+        'participant_count' only its size and 'live_participant_count' the
+        number of participants whose presence has not lapsed. Without
+        fields the whole room is returned.
+        """
+        pipe = cls._get_redis_connection(room_id).pipeline(transaction=False)
+        scalar_fields = cls._queue_room_fetch(pipe, room_id, fields)
+
+        try:
+            replies = pipe.execute()
+        except ResponseError:
+            # Room still stored in the pre-hash format
+            if not cls.migrate_legacy_key(cls._room_key(room_id)):
+                raise
+            return cls.get_room_by_id(room_id, fields)
+
+        return cls._parse_room_fetch(replies, fields, scalar_fields)
 
     @classmethod
-    def get_room_by_code(cls, short_code):
+    def get_room_by_code(cls, short_code, fields=None):
         """Retrieve room data by short code"""
-        cache = cls._get_redis_client()
-        room_id = cache.get(f'room_code_{short_code}')
+        connection = cls._get_redis_connection(short_code)
+        code_key = cls._code_key(short_code)
+        room_id = connection.get(code_key)
+
+        if room_id and room_id[0] == 0x80:
+            # Mapping still pickled by an older release
+            cls.migrate_legacy_key(code_key)
+            room_id = connection.get(code_key)
 
         if room_id:
-            return cls.get_room_by_id(room_id)
+            return cls.get_room_by_id(room_id.decode(), fields)
         return None
 
     @classmethod
-    def join_room(cls, room_identifier, participant_id, participant_ip=None):
+    def _join_script_params(cls, room_id, participant_id):
+        """KEYS and ARGV for JOIN_ROOM_SCRIPT"""
+        keys = [
+            cls._room_key(room_id),
+            cls._participants_key(room_id),
+            cls._presence_key(room_id),
+            cls._reservations_key(room_id),
+            cls._expiry_index_key(),
+            cls._presence_index_key(),
+            *cls._room_data_keys(room_id)
+        ]
+        args = [room_id, participant_id, int(time.time()), getattr(settings, 'PRESENCE_TTL', 45)]
+        return keys, args
+
+    @classmethod
+    def _parse_join_reply(cls, reply):
+        """Turn a JOIN_ROOM_SCRIPT reply into (status, room_data, short code or legacy key)"""
+        status, payload, participants = reply
+        status = status.decode()
+
+        if status in ('joined', 'member'):
+            return status, cls._decode_room(payload, participants), None
+        if status in ('expired', 'legacy'):
+            return status, None, payload.decode()
+        return status, None, None
+
+    @classmethod
+    def _leave_script_params(cls, room_id, participant_id):
+        """KEYS and ARGV for LEAVE_ROOM_SCRIPT"""
+        keys = [
+            cls._room_key(room_id),
+            cls._participants_key(room_id),
+            cls._presence_key(room_id),
+            cls._reservations_key(room_id),
+            cls._expiry_index_key(),
+            cls._presence_index_key(),
+            *cls._room_data_keys(room_id)
+        ]
+        return keys, [participant_id, room_id]
+
+    @classmethod
+    def _execute_join(cls, room_identifier, participant_id):
         """
-        Add participant to room.
-        room_identifier can be either room_id or short_code
+        Run the join script and return (status, room_data).
+        A short code is resolved to its room ID first, as the script only
+        touches the keys it is given. Rooms in the pre-hash format are
+        migrated once and retried.
         """
-        cache = cls._get_redis_client()
+        script = cls._get_script('join_room', JOIN_ROOM_SCRIPT)
+        connection = cls._get_redis_connection(room_identifier)
 
-        # Try to get room by ID first, then by code
-        room_data = cls.get_room_by_id(room_identifier)
-        if not room_data:
-            room_data = cls.get_room_by_code(room_identifier)
+        for _ in range(3):
+            room_id = room_identifier
+            if not is_room_id(room_identifier):
+                code_key = cls._code_key(room_identifier)
+                value = connection.get(code_key)
+                if value is None:
+                    return 'not_found', None
+                if value[0] == 0x80:
+                    cls.migrate_legacy_key(code_key)
+                    continue
+                room_id = value.decode()
 
-        if not room_data:
-            return None, "Room not found"
+            keys, args = cls._join_script_params(room_id, participant_id)
+            status, room_data, payload = cls._parse_join_reply(
+                script(keys=keys, args=args, client=connection)
+            )
+            if status == 'expired':
+                # The script deleted everything but the short code mapping
+                if payload:
+                    connection.delete(cls._code_key(payload))
+                return status, {'room_id': room_id}
+            if status != 'legacy':
+                return status, room_data
+            cls.migrate_legacy_key(payload)
 
-        # Check if room is active and not expired
-        if not room_data.get('is_active', False):
-            return None, "Room is not active"
+        return status, None
 
-        expires_at = timezone.datetime.fromisoformat(
-            room_data['expires_at'].replace('Z', '+00:00')
-        )
-        if timezone.now() > expires_at:
-            cls.delete_room(room_data['room_id'])
-            return None, "Room has expired"
-
-        # Check participant limit
-        current_participants = room_data.get('participants', [])
-        max_participants = room_data.get('max_participants', 2)
-
-        if len(current_participants) >= max_participants:
-            return None, "Room is full"
-
-        # Add participant if not already in room
-        if participant_id not in current_participants:
-            current_participants.append(participant_id)
-            room_data['participants'] = current_participants
-
-            # Update room data
-            cache.set(
-                f'room_{room_data["room_id"]}',
-                room_data,
-                timeout=getattr(settings, 'ROOM_EXPIRY_HOURS', 24) * 3600
+    @classmethod
+    def join_room(cls, room_identifier, participant_id, participant_ip=None):
+        """
+        Add participant to room.
+        room_identifier can be either room_id or short_code
+
+        Lookup, active/expiry/capacity checks and the participant update
+        run as a single atomic script, so concurrent joins cannot
+        overfill a room or overwrite each other's updates.
+        """
+        status, room_data = cls._execute_join(room_identifier, participant_id)
+
+        if status == 'expired':
+            # Room data was already removed by the script
+            log_activity(
+                room_id=room_data['room_id'],
+                action='deleted'
             )
+            return None, JOIN_MESSAGES[status]
 
+        if status not in ('joined', 'member'):
+            return None, JOIN_MESSAGES.get(status, "Room not found")
+
+        if status == 'joined':
             # Log participant join
-            from apps.core.models import RoomActivityLog
-            RoomActivityLog.objects.create(
+            log_activity(
                 room_id=room_data["room_id"],
                 action='joined',
-                participant_count=len(current_participants),
+                participant_count=len(room_data['participants']),
                 ip_address=participant_ip
             )
 
@@ -155,58 +589,61 @@ class RoomManager:
     @classmethod
     def leave_room(cls, room_id, participant_id):
         """Remove participant from room"""
-        cache = cls._get_redis_client()
-        room_data = cls.get_room_by_id(room_id)
+        script = cls._get_script('leave_room', LEAVE_ROOM_SCRIPT)
+        keys, args = cls._leave_script_params(room_id, participant_id)
+
+        connection = cls._get_redis_connection(room_id)
+        for _ in range(2):
+            status, participant_count, short_code = script(keys=keys, args=args, client=connection)
+            status = status.decode()
+            if status != 'legacy':
+                break
+            cls.migrate_legacy_key(keys[0])
 
-        if not room_data:
+        if status not in ('left', 'deleted'):
             return False
 
-        participants = room_data.get('participants', [])
-        if participant_id in participants:
-            participants.remove(participant_id)
-            room_data['participants'] = participants
+        if short_code:
+            # The script deleted everything but the short code mapping
+            connection.delete(cls._code_key(short_code.decode()))
 
-            # Update room data
-            cache.set(
-                f'room_{room_id}',
-                room_data,
-                timeout=getattr(settings, 'ROOM_EXPIRY_HOURS', 24) * 3600
-            )
+        # Log participant leave
+        log_activity(
+            room_id=room_id,
+            action='left',
+            participant_count=participant_count
+        )
 
-            # Log participant leave
-            from apps.core.models import RoomActivityLog
-            RoomActivityLog.objects.create(
+        # Room was deleted by the script when no participants were left
+        if status == 'deleted':
+            log_activity(
                 room_id=room_id,
-                action='left',
-                participant_count=len(participants)
+                action='deleted'
             )
 
-            # Delete room if no participants left
-            if not participants:
-                cls.delete_room(room_id)
-
-            return True
-
-        return False
+        return True
 
     @classmethod
     def delete_room(cls, room_id):
         """Delete room and clean up all associated data"""
-        cache = cls._get_redis_client()
-        room_data = cls.get_room_by_id(room_id)
+        connection = cls._get_redis_connection(room_id)
+        room_data = cls.get_room_by_id(room_id, fields=('short_code',))
 
         if room_data:
-            # Remove code mapping
+            # Remove room data, code mapping and expiry index entry
+            keys = cls._room_data_keys(room_id)
             short_code = room_data.get('short_code')
             if short_code:
-                cache.delete(f'room_code_{short_code}')
+                keys.append(cls._code_key(short_code))
 
-            # Remove room data
-            cache.delete(f'room_{room_id}')
+            pipe = connection.pipeline()
+            pipe.delete(*keys)
+            pipe.zrem(cls._expiry_index_key(), room_id)
+            pipe.zrem(cls._presence_index_key(), room_id)
+            pipe.execute()
 
             # Log room deletion
-            from apps.core.models import RoomActivityLog
-            RoomActivityLog.objects.create(
+            log_activity(
                 room_id=room_id,
                 action='deleted'
             )
@@ -216,8 +653,486 @@ class RoomManager:
         return False
 
     @classmethod
-    def cleanup_expired_rooms(cls):
-        """Clean up expired rooms (to be called by scheduled task)"""
-        # This would typically be implemented as a management command
-        # or scheduled task using Django-Q or Celery
-        pass
+    def cleanup_expired_rooms(cls, batch_size=None, max_batches=None):
+        """
+        Remove rooms whose expiry timestamp has passed.
+
+        Expired rooms are claimed from each shard's expiry index in batches
+        of batch_size. Each batch costs two pipelined round trips to Redis
+        and one bulk INSERT of 'expired' activity rows. Safe to run from
+        several processes at once. Returns per-run counts and timings.
+        """
+        batch_size = batch_size or getattr(settings, 'ROOM_SWEEPER_BATCH_SIZE', 500)
+        script = cls._get_script('claim_expired_rooms', CLAIM_EXPIRED_ROOMS_SCRIPT)
+
+        from apps.core.models import RoomActivityLog
+
+        stats = {'batches': 0, 'expired': 0, 'keys_deleted': 0}
+        started = time.monotonic()
+
+        for shard in cls._shards():
+            connection = cls._get_redis_connection(shard=shard)
+
+            while max_batches is None or stats['batches'] < max_batches:
+                room_ids = script(
+                    keys=[cls._expiry_index_key()],
+                    args=[int(time.time()), batch_size],
+                    client=connection
+                )
+                if not room_ids:
+                    break
+                room_ids = [room_id.decode() for room_id in room_ids]
+
+                # Rooms may already be gone if Redis expired their keys first
+                pipe = connection.pipeline(transaction=False)
+                for room_id in room_ids:
+                    pipe.hget(cls._room_key(room_id), 'short_code')
+                    pipe.scard(cls._participants_key(room_id))
+                replies = pipe.execute()
+
+                pipe = connection.pipeline(transaction=False)
+                logs = []
+                for room_id, short_code, participant_count in zip(
+                    room_ids, replies[::2], replies[1::2]
+                ):
+                    keys = cls._room_data_keys(room_id)
+                    if short_code:
+                        keys.append(cls._code_key(short_code.decode()))
+                    pipe.delete(*keys)
+                    logs.append(RoomActivityLog(
+                        room_id=room_id,
+                        action='expired',
+                        participant_count=participant_count
+                    ))
+                pipe.zrem(cls._presence_index_key(), *room_ids)
+                stats['keys_deleted'] += sum(pipe.execute()[:-1])
+
+                write_activity_rows(logs)
+
+                stats['batches'] += 1
+                stats['expired'] += len(room_ids)
+
+                if len(room_ids) < batch_size:
+                    break
+
+        stats['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+        if stats['expired']:
+            logger.info(
+                f"Expired rooms cleaned up: {stats['expired']} rooms, "
+                f"{stats['keys_deleted']} keys, {stats['batches']} batches "
+                f"in {stats['duration_ms']} ms"
+            )
+        return stats
+
+    @classmethod
+    def get_worker_distribution(cls):
+        """
+        Room distribution published by the workers holding sockets (see
+        apps.rooms.affinity), by worker ID. Workers silent for three
+        heartbeat intervals are left out.
+        """
+        connection = cls._get_redis_connection()
+        registry_key = cls._worker_registry_key()
+        stale_before = int(time.time()) - 3 * getattr(settings, 'HEARTBEAT_INTERVAL', 15)
+
+        workers, stale = {}, []
+        for worker, snapshot in connection.hgetall(registry_key).items():
+            snapshot = json.loads(snapshot)
+            if snapshot['updated'] >= stale_before:
+                workers[worker.decode()] = snapshot
+            else:
+                stale.append(worker)
+        if stale:
+            # Workers that stopped or went idle; they publish again with their next socket
+            connection.hdel(registry_key, *stale)
+        return workers
+
+    @classmethod
+    def _announce_departure(cls, room_id, participant_id):
+        """Tell the room's connected consumers that a participant is gone"""
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from apps.rooms.protocol import build_event
+
+        async_to_sync(get_channel_layer().group_send)(
+            f'room_{room_id}',
+            build_event(
+                {
+                    'type': 'user_left',
+                    'participant_id': participant_id,
+                    'timestamp': timezone.now().isoformat()
+                },
+                participant_id=participant_id
+            )
+        )
+
+    @classmethod
+    def reap_stale_participants(cls, batch_size=None, max_batches=None):
+        """
+        Remove participants whose presence lapsed, e.g. browsers that vanished
+        without closing their WebSocket or workers that died.
+
+        Rooms are found through each shard's presence index, so only rooms
+        with a lapsed presence are touched. Participants that still had a
+        channel registered are announced to the room with `user_left`; rooms
+        left empty are deleted. Safe to run from several processes at once.
+        """
+        batch_size = batch_size or getattr(settings, 'ROOM_SWEEPER_BATCH_SIZE', 500)
+        script = cls._get_script('reap_stale_participants', REAP_STALE_PARTICIPANTS_SCRIPT)
+        now = int(time.time())
+
+        from apps.core.models import RoomActivityLog
+
+        stats = {'batches': 0, 'rooms': 0, 'reaped': 0, 'deleted': 0}
+        started = time.monotonic()
+
+        for shard in cls._shards():
+            connection = cls._get_redis_connection(shard=shard)
+
+            while max_batches is None or stats['batches'] < max_batches:
+                room_ids = connection.zrangebyscore(
+                    cls._presence_index_key(), '-inf', f'({now}', start=0, num=batch_size
+                )
+                if not room_ids:
+                    break
+
+                logs = []
+                for room_id in (room_id.decode() for room_id in room_ids):
+                    status, reaped, announce, participant_count, short_code = script(
+                        keys=[
+                            cls._room_key(room_id),
+                            cls._participants_key(room_id),
+                            cls._presence_key(room_id),
+                            cls._channels_key(room_id),
+                            cls._presence_index_key(),
+                            cls._expiry_index_key(),
+                            cls._reservations_key(room_id),
+                            *cls._room_data_keys(room_id)
+                        ],
+                        args=[now, room_id],
+                        client=connection
+                    )
+                    status = status.decode()
+                    if status == 'not_found':
+                        continue
+                    if short_code:
+                        # The script deleted everything but the short code mapping
+                        connection.delete(cls._code_key(short_code.decode()))
+
+                    stats['rooms'] += 1
+                    stats['reaped'] += len(reaped)
+                    logs.extend(
+                        RoomActivityLog(room_id=room_id, action='left', participant_count=participant_count)
+                        for _ in reaped
+                    )
+                    if status == 'deleted':
+                        stats['deleted'] += 1
+                        logs.append(RoomActivityLog(room_id=room_id, action='deleted'))
+
+                    for participant_id in announce:
+                        try:
+                            cls._announce_departure(room_id, participant_id.decode())
+                        except Exception as e:
+                            logger.error(f"Failed to announce reaped participant in room {room_id}: {e}")
+
+                write_activity_rows(logs)
+                stats['batches'] += 1
+
+                if len(room_ids) < batch_size:
+                    break
+
+        stats['duration_ms'] = round((time.monotonic() - started) * 1000, 1)
+        if stats['reaped']:
+            logger.info(
+                f"Stale participants reaped: {stats['reaped']} participants in "
+                f"{stats['rooms']} rooms, {stats['deleted']} rooms deleted "
+                f"in {stats['duration_ms']} ms"
+            )
+        return stats
+
+
+class AsyncRoomManager:
+    """
+    Asyncio counterpart of RoomManager for code running on the event loop,
+    such as WebSocket consumers. Uses the same keys and scripts over an
+    asyncio Redis client, so room lookups never block or hop to a worker
+    thread. Activity rows are written in the background.
+    """
+
+    # Asyncio clients are bound to the loop they were created on
+    _clients = weakref.WeakKeyDictionary()
+    _scripts = {}
+    _pending_logs = set()
+
+    @classmethod
+    def _get_redis_connection(cls, room_identifier=None, shard=None):
+        """
+        Get the asyncio Redis client of a room's shard (see
+        RoomManager._get_redis_connection) for the running event loop
+        """
+        url = shard_url(room_identifier, shard)
+        clients = cls._clients.setdefault(asyncio.get_running_loop(), {})
+        client = clients.get(url)
+        if client is None:
+            client = aioredis.Redis.from_url(url)
+            clients[url] = client
+        return client
+
+    @classmethod
+    def _get_script(cls, name, source):
+        """Register a Lua script once per process"""
+        script = cls._scripts.get(name)
+        if script is None:
+            script = cls._get_redis_connection().register_script(source)
+            cls._scripts[name] = script
+        return script
+
+    @staticmethod
+    async def _migrate_legacy_key(key):
+        """Convert a pre-hash room key; rare enough to run in a thread"""
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(
+            RoomManager.migrate_legacy_key, thread_sensitive=False
+        )(key)
+
+    @classmethod
+    def _log_activity(cls, **fields):
+        """
+        Record a RoomActivityLog row without making the caller wait: queued
+        for the writer thread, or written from a thread when the buffer is
+        full or disabled
+        """
+        row = buffer_activity(**fields)
+        if row is None:
+            return
+
+        from channels.db import database_sync_to_async
+
+        task = asyncio.ensure_future(
+            database_sync_to_async(write_activity_rows, thread_sensitive=False)([row])
+        )
+        cls._pending_logs.add(task)
+        task.add_done_callback(cls._log_done)
+
+    @classmethod
+    def _log_done(cls, task):
+        cls._pending_logs.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Failed to write room activity log: {task.exception()}")
+
+    @classmethod
+    async def leave_room(cls, room_id, participant_id):
+        """Remove participant from room, see RoomManager.leave_room"""
+        script = cls._get_script('leave_room', LEAVE_ROOM_SCRIPT)
+        keys, args = RoomManager._leave_script_params(room_id, participant_id)
+
+        connection = cls._get_redis_connection(room_id)
+        for _ in range(2):
+            status, participant_count, short_code = await script(keys=keys, args=args, client=connection)
+            status = status.decode()
+            if status != 'legacy':
+                break
+            await cls._migrate_legacy_key(keys[0])
+
+        if status not in ('left', 'deleted'):
+            return False
+
+        if short_code:
+            await connection.delete(RoomManager._code_key(short_code.decode()))
+
+        cls._log_activity(room_id=room_id, action='left', participant_count=participant_count)
+        if status == 'deleted':
+            cls._log_activity(room_id=room_id, action='deleted')
+
+        return True
+
+    @classmethod
+    async def admit_socket(cls, room_id, participant_id, channel_name, resume_token=None):
+        """
+        Admit a WebSocket into a room in a single round trip: check the room
+        and its capacity, resume the session of `resume_token` if it is still
+        valid, register `channel_name` and refresh the participant's presence.
+        A socket that is not a member reserves its slot until its presence
+        deadline instead; the heartbeat extends it and the reaper frees it
+        once it lapsed.
+
+        Returns a dict with 'status' ('admitted', 'full' or 'not_found').
+        Admitted sockets also get 'participant_id', 'resumed', 'is_member',
+        'expires_ts', 'resume_token' and 'channels', the room's channel
+        registry including this socket. Resume tokens are stored on the
+        room's shard, next to the participant they resume.
+        """
+        script = cls._get_script('admit_socket', ADMIT_SOCKET_SCRIPT)
+        new_token = secrets.token_urlsafe(24)
+        keys = [
+            RoomManager._room_key(room_id),
+            RoomManager._participants_key(room_id),
+            RoomManager._presence_key(room_id),
+            RoomManager._channels_key(room_id),
+            RoomManager._presence_index_key(),
+            RoomManager._resume_key(resume_token) if resume_token else '',
+            RoomManager._resume_key(new_token),
+            RoomManager._reservations_key(room_id)
+        ]
+        args = [
+            int(time.time()),
+            participant_id,
+            channel_name,
+            room_id,
+            getattr(settings, 'PRESENCE_TTL', 45)
+        ]
+
+        for _ in range(2):
+            status, participant, resumed, is_member, expires_ts, channels = await script(
+                keys=keys, args=args, client=cls._get_redis_connection(room_id)
+            )
+            status = status.decode()
+            if status != 'legacy':
+                break
+            await cls._migrate_legacy_key(keys[0])
+
+        if status != 'admitted':
+            return {'status': status}
+
+        return {
+            'status': status,
+            'participant_id': participant.decode(),
+            'resumed': bool(resumed),
+            'is_member': bool(is_member),
+            'expires_ts': expires_ts,
+            'resume_token': resume_token if resumed else new_token,
+            'channels': {
+                channels[i].decode(): channels[i + 1].decode()
+                for i in range(0, len(channels), 2)
+            }
+        }
+
+    @classmethod
+    async def unregister_channel(cls, room_id, participant_id, channel_name):
+        """Forget a participant's channel unless it was already replaced"""
+        script = cls._get_script('unregister_channel', UNREGISTER_CHANNEL_SCRIPT)
+        return await script(
+            keys=[
+                RoomManager._channels_key(room_id),
+                RoomManager._presence_key(room_id),
+                RoomManager._reservations_key(room_id),
+                RoomManager._presence_index_key()
+            ],
+            args=[participant_id, channel_name, room_id],
+            client=cls._get_redis_connection(room_id)
+        )
+
+    @classmethod
+    async def refresh_presence(cls, room_id, participant_id, expires_ts, is_member=True):
+        """
+        Extend a participant's presence by PRESENCE_TTL, or the reservation
+        of a socket admitted without joining if not `is_member`. Returns
+        False if the member is no longer in the room or the socket's
+        reservation was reaped.
+        """
+        script = cls._get_script('refresh_presence', REFRESH_PRESENCE_SCRIPT)
+        deadline = int(time.time()) + getattr(settings, 'PRESENCE_TTL', 45)
+        refreshed = await script(
+            keys=[
+                RoomManager._participants_key(room_id),
+                RoomManager._presence_key(room_id),
+                RoomManager._presence_index_key(),
+                RoomManager._channels_key(room_id),
+                RoomManager._reservations_key(room_id)
+            ],
+            args=[participant_id, deadline, room_id, expires_ts, int(is_member)],
+            client=cls._get_redis_connection(room_id)
+        )
+        return bool(refreshed)
+
+    @classmethod
+    async def take_room_tokens(cls, room_id, count):
+        """
+        Take up to `count` tokens from the room's signaling budget shared by
+        all workers (SIGNALING_ROOM_RATE_LIMIT messages per second, bursts of
+        SIGNALING_ROOM_RATE_BURST). Returns the number of tokens granted.
+        """
+        script = cls._get_script('take_room_tokens', TAKE_ROOM_TOKENS_SCRIPT)
+        return await script(
+            keys=[RoomManager._rate_key(room_id)],
+            args=[
+                time.time(),
+                settings.SIGNALING_ROOM_RATE_LIMIT,
+                settings.SIGNALING_ROOM_RATE_BURST,
+                count
+            ],
+            client=cls._get_redis_connection(room_id)
+        )
+
+    @classmethod
+    async def claim_room_worker(cls, room_id, worker_id, worker_url):
+        """
+        Make `worker_id` the owner of the room's sockets for PRESENCE_TTL
+        seconds unless another worker holds the lease; the owner extends its
+        lease with every call. Returns (owner ID, owner URL).
+        """
+        script = cls._get_script('claim_room_worker', CLAIM_ROOM_WORKER_SCRIPT)
+        owner, url = await script(
+            keys=[RoomManager._worker_key(room_id)],
+            args=[worker_id, worker_url, getattr(settings, 'PRESENCE_TTL', 45)],
+            client=cls._get_redis_connection(room_id)
+        )
+        return owner.decode(), url.decode()
+
+    @classmethod
+    async def release_room_worker(cls, room_id, worker_id):
+        """Give up the room's lease after the worker's last socket of it closed"""
+        script = cls._get_script('release_room_worker', RELEASE_ROOM_WORKER_SCRIPT)
+        await script(
+            keys=[RoomManager._worker_key(room_id)],
+            args=[worker_id],
+            client=cls._get_redis_connection(room_id)
+        )
+
+    @classmethod
+    async def publish_worker(cls, worker_id, snapshot):
+        """Publish a worker's room distribution, see get_worker_distribution"""
+        await cls._get_redis_connection().hset(
+            RoomManager._worker_registry_key(), worker_id, json.dumps(snapshot)
+        )
+
+    @classmethod
+    async def drop_resume_token(cls, room_id, token):
+        """Invalidate a resume token after a clean close"""
+        await cls._get_redis_connection(room_id).delete(RoomManager._resume_key(token))
+
+    @classmethod
+    async def buffer_events(cls, room_id, events):
+        """
+        Append (participant_id, message) pairs to the participants' replay
+        buffers in one round trip. Messages carry the `seq` their sender gave
+        them. A buffer keeps the last REPLAY_BUFFER_SIZE messages and expires
+        REPLAY_TTL seconds after the last one.
+        """
+        from apps.rooms.protocol import encode_msgpack
+
+        maxlen = getattr(settings, 'REPLAY_BUFFER_SIZE', 64)
+        ttl = getattr(settings, 'REPLAY_TTL', 120)
+        pipe = cls._get_redis_connection(room_id).pipeline(transaction=False)
+        for participant_id, message in events:
+            key = RoomManager._replay_key(room_id, participant_id)
+            pipe.xadd(key, {'message': encode_msgpack(message)}, maxlen=maxlen, approximate=False)
+            pipe.expire(key, ttl)
+        await pipe.execute()
+
+    @classmethod
+    async def replay_events(cls, room_id, participant_id, after=None):
+        """
+        Buffered messages of a participant that came after the one with
+        sequence ID `after`, oldest first. All of them are returned without
+        it, or when it is no longer buffered.
+        """
+        from apps.rooms.protocol import decode_msgpack
+
+        key = RoomManager._replay_key(room_id, participant_id)
+        entries = await cls._get_redis_connection(room_id).xrange(key, '-', '+')
+        events = [decode_msgpack(fields[b'message']) for _, fields in entries]
+        for index, message in enumerate(events):
+            if message.get('seq') == after:
+                return events[index + 1:]
+        return events
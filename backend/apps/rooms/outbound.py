@@ -0,0 +1,146 @@
+# rooms/outbound.py - Bounded per-connection queue of outgoing signaling frames
+import asyncio
+import time
+from collections import deque
+
+# Delivery lanes, highest priority first. Control frames go ahead of
+# signaling, which goes ahead of state that a newer frame replaces. Room
+# membership shares the signaling lane: a peer's user_left must not overtake
+# the offers and candidates it sent before leaving.
+CONTROL, SIGNALING, STATE = range(3)
+
+PRIORITIES = {
+    'session': CONTROL,
+    'error': CONTROL,
+    'pong': CONTROL,
+    'user_joined': SIGNALING,
+    'user_left': SIGNALING,
+    'webrtc_offer': SIGNALING,
+    'webrtc_answer': SIGNALING,
+    'ice_candidate': SIGNALING,
+    'ice_candidates': SIGNALING,
+    'media_state_update': STATE,
+    'heartbeat': STATE,
+}
+
+# Frame types of which only the latest pending one per participant is worth
+# sending; they can also be shed when the queue is full
+COALESCED = {'media_state_update', 'heartbeat'}
+
+# Worker-wide counters, exported by the metrics endpoint
+OUTBOUND_STATS = {
+    'connections': 0,
+    'queued_frames': 0,
+    'queued_bytes': 0,
+    'peak_frames': 0,
+    'sent': 0,
+    'coalesced': 0,
+    'dropped': 0,
+    'slow_disconnects': 0,
+}
+
+
+def outbound_metrics():
+    """Snapshot of the outbound queue counters of this worker"""
+    return dict(OUTBOUND_STATS)
+
+
+def frame_size(frame):
+    """Size of a frame on the wire; text frames go out as UTF-8"""
+    return len(frame.encode()) if isinstance(frame, str) else len(frame)
+
+
+class _Entry:
+    __slots__ = ('frame', 'size', 'key', 'queued_at')
+
+    def __init__(self, frame, key, size):
+        self.frame = frame
+        self.size = size
+        self.key = key
+        self.queued_at = time.monotonic()
+
+
+class OutboundQueue:
+    """
+    Frames waiting to be written to one client. Frames leave in priority
+    order, FIFO within a lane; a coalesced frame replaces its pending
+    predecessor in place. The queue holds at most `max_frames` frames and
+    `max_bytes` bytes.
+    """
+
+    def __init__(self, max_frames, max_bytes):
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.lanes = [deque() for _ in range(STATE + 1)]
+        self.pending = {}
+        self.frames = 0
+        self.bytes = 0
+        self.ready = asyncio.Event()
+        self.closed = False
+        OUTBOUND_STATS['connections'] += 1
+
+    def put(self, message_type, frame, participant_id=None):
+        """
+        Queue a frame. Returns False when a frame that can't be shed does
+        not fit, i.e. the client has fallen too far behind.
+        """
+        key = (message_type, participant_id) if message_type in COALESCED else None
+        size = frame_size(frame)
+        entry = self.pending.get(key) if key else None
+        if entry is not None:
+            self._account(0, size - entry.size)
+            entry.frame, entry.size = frame, size
+            OUTBOUND_STATS['coalesced'] += 1
+            return True
+
+        if self.frames >= self.max_frames or self.bytes + size > self.max_bytes:
+            if key:
+                OUTBOUND_STATS['dropped'] += 1
+                return True
+            return False
+
+        entry = _Entry(frame, key, size)
+        self.lanes[PRIORITIES.get(message_type, SIGNALING)].append(entry)
+        if key:
+            self.pending[key] = entry
+        self._account(1, entry.size)
+        OUTBOUND_STATS['peak_frames'] = max(OUTBOUND_STATS['peak_frames'], self.frames)
+        self.ready.set()
+        return True
+
+    async def get(self):
+        """Wait for the next frame in priority order"""
+        while not self.frames:
+            self.ready.clear()
+            await self.ready.wait()
+        for lane in self.lanes:
+            if lane:
+                entry = lane.popleft()
+                break
+        if entry.key:
+            del self.pending[entry.key]
+        self._account(-1, -entry.size)
+        OUTBOUND_STATS['sent'] += 1
+        return entry.frame
+
+    def lag(self):
+        """Seconds the oldest pending frame has been waiting"""
+        oldest = min((lane[0].queued_at for lane in self.lanes if lane), default=None)
+        return time.monotonic() - oldest if oldest is not None else 0
+
+    def close(self):
+        """Discard pending frames and release this queue from the counters"""
+        if self.closed:
+            return
+        self.closed = True
+        for lane in self.lanes:
+            lane.clear()
+        self.pending.clear()
+        self._account(-self.frames, -self.bytes)
+        OUTBOUND_STATS['connections'] -= 1
+
+    def _account(self, frames, size):
+        self.frames += frames
+        self.bytes += size
+        OUTBOUND_STATS['queued_frames'] += frames
+        OUTBOUND_STATS['queued_bytes'] += size
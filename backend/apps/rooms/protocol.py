@@ -0,0 +1,82 @@
+# rooms/protocol.py - Wire formats of the signaling WebSocket
+import json
+import msgpack
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import orjson
+except ImportError:  # optional, see SIGNALING_JSON_BACKEND
+    orjson = None
+
+# WebSocket subprotocol under which a client exchanges MessagePack binary
+# frames. Clients that don't offer it keep using JSON text frames.
+MSGPACK_SUBPROTOCOL = 'videocall.msgpack.v1'
+
+
+def _stdlib_dumps(message):
+    return json.dumps(message)
+
+
+def _orjson_dumps(message):
+    return orjson.dumps(message).decode()
+
+
+def get_json_backend(name=None):
+    """Return the (dumps, loads) pair of the configured JSON backend"""
+    name = name or getattr(settings, 'SIGNALING_JSON_BACKEND', 'json')
+    if name == 'json':
+        return _stdlib_dumps, json.loads
+    if name == 'orjson':
+        if orjson is None:
+            raise ImproperlyConfigured("SIGNALING_JSON_BACKEND is 'orjson' but orjson is not installed")
+        return _orjson_dumps, orjson.loads
+    raise ImproperlyConfigured(f"Unknown SIGNALING_JSON_BACKEND: {name}")
+
+
+encode_json, decode_json = get_json_backend()
+
+
+def encode_msgpack(message):
+    """Encode a signaling message as a MessagePack binary frame"""
+    return msgpack.packb(message, use_bin_type=True)
+
+
+def decode_msgpack(bytes_data):
+    """Decode a MessagePack binary frame; malformed ones raise msgpack.UnpackException"""
+    try:
+        return msgpack.unpackb(bytes_data, raw=False)
+    except msgpack.UnpackException:
+        raise
+    except ValueError as e:
+        # Truncated frames and non-string map keys raise a bare ValueError
+        raise msgpack.UnpackException(str(e)) from e
+
+
+def text_frame_size(text_data, limit):
+    """
+    Size of a text frame for comparing against a `limit` in bytes. UTF-8
+    takes 1 to 4 bytes a character, so the frame is only encoded when its
+    length alone can't tell which side of the limit it is on.
+    """
+    length = len(text_data)
+    if length > limit or length * 4 <= limit:
+        return length
+    return len(text_data.encode())
+
+
+def encode_frames(message):
+    """
+    Encode a message once per wire format, so a broadcast can be forwarded
+    to every client as-is whatever format it negotiated.
+    """
+    return {'text': encode_json(message), 'bytes': encode_msgpack(message)}
+
+
+def build_event(message, **routing):
+    """
+    Channel layer event for a client message. The message is encoded once
+    per wire format here instead of once per receiving consumer; `routing`
+    holds the fields receivers check before forwarding.
+    """
+    return {'type': message['type'], **routing, **encode_frames(message)}
@@ -0,0 +1,77 @@
+# rooms/ratelimit.py - Token buckets limiting inbound signaling messages
+import time
+
+# Worker-wide counters, exported by the metrics endpoint
+RATE_LIMIT_STATS = {
+    'rejected': 0,
+    'room_rejected': 0,
+    'disconnects': 0,
+}
+
+
+def rate_limit_metrics():
+    """Snapshot of the inbound rate limit counters of this worker"""
+    return dict(RATE_LIMIT_STATS)
+
+
+class TokenBucket:
+    """
+    Holds up to `burst` tokens, refilled at `rate` tokens per second. Refill
+    is computed lazily when tokens are taken, so an idle bucket costs nothing.
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def take(self, cost=1, now=None):
+        """Take `cost` tokens if available; returns False otherwise"""
+        if now is None:
+            now = time.monotonic()
+        tokens = self.tokens + (now - self.updated) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self.updated = now
+        if tokens < cost:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - cost
+        return True
+
+
+class MessageRateLimiter:
+    """
+    Inbound budgets of one connection: a bucket per rate class, given as
+    {rate_class: (rate, burst)}. Classes without a budget of their own share
+    the '*' one, if configured. Rejected messages draw from a strike bucket
+    of `max_violations` strikes refilled at one per second; a connection that
+    runs out of strikes should be closed.
+    """
+
+    __slots__ = ('buckets', 'default', 'strikes')
+
+    def __init__(self, limits, max_violations, now=None):
+        self.buckets = {
+            rate_class: TokenBucket(rate, burst, now)
+            for rate_class, (rate, burst) in limits.items()
+            if rate_class != '*'
+        }
+        default = limits.get('*')
+        self.default = TokenBucket(*default, now) if default else None
+        self.strikes = TokenBucket(1, max_violations, now)
+
+    def allow(self, rate_class, cost=1, now=None):
+        """Charge a message against its budget; returns False if it is over"""
+        bucket = self.buckets.get(rate_class, self.default)
+        if bucket is None or bucket.take(cost, now):
+            return True
+        RATE_LIMIT_STATS['rejected'] += 1
+        return False
+
+    def strike(self, now=None):
+        """Record a violation; returns False once the connection used up its strikes"""
+        return self.strikes.take(1, now)
@@ -0,0 +1,120 @@
+# rooms/router.py - Registry of inbound signaling message types
+
+# Python types accepted for declared fields, with their name in error messages
+FIELD_TYPES = {
+    str: 'a string',
+    dict: 'an object',
+    list: 'a list',
+    bool: 'a boolean',
+}
+
+
+def compile_validator(message_type, required, optional=None):
+    """
+    Build a function checking the shape of a decoded message. Fields are
+    declared as {name: type}, where the type is one of FIELD_TYPES or a
+    nested declaration of required fields of an object. Required fields
+    must be non-empty; optional ones may be missing or null. The function
+    returns the first problem found, or None.
+    """
+    checks = []
+    for name, kind in required.items():
+        checks.append((name, True, _compile_field(message_type, name, kind)))
+    for name, kind in (optional or {}).items():
+        checks.append((name, False, _compile_field(message_type, name, kind)))
+    checks = tuple(checks)
+
+    def validate(data):
+        for name, is_required, check in checks:
+            value = data.get(name)
+            if value is None or value == '':
+                if is_required:
+                    return f"Invalid {message_type} message: '{name}' is required"
+                continue
+            error = check(value)
+            if error:
+                return error
+        return None
+
+    return validate
+
+
+def _compile_field(message_type, name, kind):
+    if isinstance(kind, dict):
+        nested = compile_validator(message_type, kind)
+
+        def check_object(value):
+            if not isinstance(value, dict):
+                return f"Invalid {message_type} message: '{name}' must be an object"
+            return nested(value)
+
+        return check_object
+
+    error = f"Invalid {message_type} message: '{name}' must be {FIELD_TYPES[kind]}"
+
+    def check_value(value):
+        # Lists and objects must not be empty either
+        if not isinstance(value, kind) or (kind in (dict, list) and not value):
+            return error
+        return None
+
+    return check_value
+
+
+class MessageRoute:
+    """
+    Declaration of one inbound message type: its handler, accepted shape,
+    largest frame and the rate limit budget it draws from. `cost` maps a
+    message to the number of tokens it takes; `relayed` marks messages that
+    reach peers over the channel layer and so count towards the room budget.
+    """
+
+    __slots__ = ('message_type', 'handler', 'validate', 'max_size', 'rate_class', 'cost', 'relayed')
+
+    def __init__(self, message_type, handler, validate, max_size, rate_class, cost, relayed):
+        self.message_type = message_type
+        self.handler = handler
+        self.validate = validate
+        self.max_size = max_size
+        self.rate_class = rate_class
+        self.cost = cost
+        self.relayed = relayed
+
+
+class MessageRouter:
+    """
+    Maps message types to their routes. Handlers register with the `route`
+    decorator when their class is defined, so validators are compiled once
+    and dispatch is a single dict lookup however many types there are.
+    `max_size` is the largest frame any route accepts; anything bigger can
+    be rejected before it is decoded.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.max_size = 0
+
+    def route(self, message_type, required=None, optional=None, max_size=4096,
+              rate_class=None, cost=None, relayed=False):
+        """Register the decorated consumer method as the handler of a message type"""
+        if message_type in self.routes:
+            raise ValueError(f"Message type already routed: {message_type}")
+
+        def register(handler):
+            self.routes[message_type] = MessageRoute(
+                message_type,
+                handler,
+                compile_validator(message_type, required or {}, optional),
+                max_size,
+                rate_class or message_type,
+                cost,
+                relayed
+            )
+            self.max_size = max(self.max_size, max_size)
+            return handler
+
+        return register
+
+    def get(self, message_type):
+        """Route of a message type, or None if it is unknown"""
+        return self.routes.get(message_type)
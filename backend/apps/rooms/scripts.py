@@ -0,0 +1,424 @@
+# rooms/scripts.py - Server-side Redis scripts for atomic room operations
+#
+# Each script runs as a single atomic step on the Redis server, so the
+# capacity/expiry checks and the participant update can never interleave
+# with another client's join or leave.
+#
+# Room layout (see RoomManager):
+#   room_{id}               HASH   scalar room fields, expires_ts as epoch
+#   room_{id}_participants  SET    participant IDs
+#   room_{id}_channels      HASH   participant ID -> channel name
+#   room_{id}_presence      ZSET   participant IDs scored by presence deadline
+#   room_{id}_reservations  ZSET   IDs of sockets admitted without joining,
+#                                  scored by presence deadline
+#   room_{id}_rate          HASH   room-wide signaling rate bucket (own expiry)
+#   room_{id}_worker        HASH   worker owning the room's sockets (lease, own expiry)
+#   room_code_{code}        STRING room ID
+#   room_expiry_index       ZSET   room IDs scored by expires_ts
+#   room_presence_index     ZSET   room IDs scored by their earliest presence or
+#                                  reservation deadline
+# All other keys of a room expire at expires_ts.
+
+# Re-scores a room in the presence index after its presence or
+# reservations changed
+INDEX_PRESENCE_FUNCTION = """
+local function index_presence(index_key, presence_key, reservations_key, room_id)
+    local deadline
+    for _, key in ipairs({presence_key, reservations_key}) do
+        local first = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        if #first > 0 and (not deadline or tonumber(first[2]) < deadline) then
+            deadline = tonumber(first[2])
+        end
+    end
+    if deadline then
+        redis.call('ZADD', index_key, deadline, room_id)
+    else
+        redis.call('ZREM', index_key, room_id)
+    end
+end
+"""
+
+# KEYS[1] - room key
+# KEYS[2] - participants key
+# KEYS[3] - presence key
+# KEYS[4] - reservations key
+# KEYS[5] - expiry index
+# KEYS[6] - presence index
+# KEYS[7..] - every per-room key, deleted when the room has expired
+# ARGV[1] - room ID
+# ARGV[2] - participant ID
+# ARGV[3] - current unix timestamp
+# ARGV[4] - presence TTL in seconds
+#
+# Short codes are resolved to the room ID before the script runs, so that
+# it only touches the keys it is given.
+#
+# Participants whose presence deadline has passed don't count towards the
+# capacity. The joining participant's presence is (re)started and replaces
+# the reservation of a socket it already had open.
+#
+# Returns {status, payload, participants}:
+#   'joined' / 'member'  -> flattened room hash and participant IDs
+#   'expired'            -> short code of the deleted room ('' without one),
+#                           whose mapping the caller deletes
+#   'legacy'             -> room key holding a value in the pre-hash format
+#   'not_found' / 'inactive' / 'full'
+JOIN_ROOM_SCRIPT = INDEX_PRESENCE_FUNCTION + """
+local room_type = redis.call('TYPE', KEYS[1])['ok']
+if room_type == 'none' then
+    return {'not_found', '', {}}
+end
+if room_type ~= 'hash' then
+    return {'legacy', KEYS[1], {}}
+end
+
+local room = redis.call('HMGET', KEYS[1], 'short_code', 'is_active', 'expires_ts', 'max_participants')
+
+if room[2] ~= '1' then
+    return {'inactive', '', {}}
+end
+
+local now = tonumber(ARGV[3])
+if now > tonumber(room[3]) then
+    redis.call('DEL', unpack(KEYS, 7))
+    redis.call('ZREM', KEYS[5], ARGV[1])
+    redis.call('ZREM', KEYS[6], ARGV[1])
+    return {'expired', room[1] or '', {}}
+end
+
+local status = 'member'
+if redis.call('SISMEMBER', KEYS[2], ARGV[2]) == 0 then
+    local count = redis.call('SCARD', KEYS[2])
+    local stale = redis.call('ZCOUNT', KEYS[3], '-inf', '(' .. ARGV[3])
+    if count - stale >= tonumber(room[4]) then
+        return {'full', '', {}}
+    end
+    redis.call('SADD', KEYS[2], ARGV[2])
+    if count == 0 then
+        redis.call('EXPIREAT', KEYS[2], room[3])
+    end
+    status = 'joined'
+end
+
+redis.call('ZADD', KEYS[3], now + tonumber(ARGV[4]), ARGV[2])
+redis.call('EXPIREAT', KEYS[3], room[3])
+redis.call('ZREM', KEYS[4], ARGV[2])
+index_presence(KEYS[6], KEYS[3], KEYS[4], ARGV[1])
+
+return {status, redis.call('HGETALL', KEYS[1]), redis.call('SMEMBERS', KEYS[2])}
+"""
+
+# KEYS[1] - room key
+# KEYS[2] - participants key
+# KEYS[3] - presence key
+# KEYS[4] - reservations key
+# KEYS[5] - expiry index
+# KEYS[6] - presence index
+# KEYS[7..] - every per-room key, deleted with the room
+# ARGV[1] - participant ID
+# ARGV[2] - room ID
+#
+# Returns {status, participant_count, short_code}:
+#   'left'     -> participant removed, room still has participants
+#   'deleted'  -> last participant removed and room deleted; short_code
+#                 ('' without one) is the mapping the caller deletes
+#   'legacy' / 'not_found' / 'not_member'
+LEAVE_ROOM_SCRIPT = INDEX_PRESENCE_FUNCTION + """
+local room_type = redis.call('TYPE', KEYS[1])['ok']
+if room_type == 'none' then
+    return {'not_found', 0, ''}
+end
+if room_type ~= 'hash' then
+    return {'legacy', 0, ''}
+end
+
+if redis.call('SREM', KEYS[2], ARGV[1]) == 0 then
+    return {'not_member', redis.call('SCARD', KEYS[2]), ''}
+end
+
+redis.call('ZREM', KEYS[3], ARGV[1])
+
+local count = redis.call('SCARD', KEYS[2])
+if count == 0 then
+    local short_code = redis.call('HGET', KEYS[1], 'short_code') or ''
+    redis.call('DEL', unpack(KEYS, 7))
+    redis.call('ZREM', KEYS[5], ARGV[2])
+    redis.call('ZREM', KEYS[6], ARGV[2])
+    return {'deleted', 0, short_code}
+end
+
+index_presence(KEYS[6], KEYS[3], KEYS[4], ARGV[2])
+return {'left', count, ''}
+"""
+
+# KEYS[1] - expiry index
+# ARGV[1] - current unix timestamp
+# ARGV[2] - maximum number of rooms to claim
+#
+# Atomically removes up to ARGV[2] expired room IDs from the index and
+# returns them, so concurrent sweepers never process the same room twice.
+CLAIM_EXPIRED_ROOMS_SCRIPT = """
+local room_ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #room_ids > 0 then
+    redis.call('ZREM', KEYS[1], unpack(room_ids))
+end
+return room_ids
+"""
+
+# KEYS[1] - channel registry of the room
+# KEYS[2] - presence key
+# KEYS[3] - reservations key
+# KEYS[4] - presence index
+# ARGV[1] - participant ID
+# ARGV[2] - channel name being closed
+# ARGV[3] - room ID
+#
+# Removes the registry entry and the socket's reservation only if the entry
+# still points at the closing channel, so a participant who already
+# reconnected keeps the new ones.
+UNREGISTER_CHANNEL_SCRIPT = INDEX_PRESENCE_FUNCTION + """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    if redis.call('ZREM', KEYS[3], ARGV[1]) == 1 then
+        index_presence(KEYS[4], KEYS[2], KEYS[3], ARGV[3])
+    end
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# KEYS[1] - participants key
+# KEYS[2] - presence key
+# KEYS[3] - presence index
+# KEYS[4] - channel registry
+# KEYS[5] - reservations key
+# ARGV[1] - participant ID
+# ARGV[2] - new presence deadline
+# ARGV[3] - room ID
+# ARGV[4] - room expiry timestamp
+# ARGV[5] - 1 if the socket was admitted as a member, 0 otherwise
+#
+# Extends a participant's presence, or the reservation of a socket that
+# did not join. Returns 0 if a member is no longer in the room (left or
+# reaped) or the socket's reservation was reaped, 1 otherwise.
+REFRESH_PRESENCE_SCRIPT = INDEX_PRESENCE_FUNCTION + """
+local deadlines = KEYS[2]
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 0 then
+    if ARGV[5] == '1' or redis.call('HEXISTS', KEYS[4], ARGV[1]) == 0 then
+        return 0
+    end
+    deadlines = KEYS[5]
+end
+redis.call('ZADD', deadlines, ARGV[2], ARGV[1])
+redis.call('EXPIREAT', deadlines, ARGV[4])
+index_presence(KEYS[3], KEYS[2], KEYS[5], ARGV[3])
+return 1
+"""
+
+# KEYS[1] - room key
+# KEYS[2] - participants key
+# KEYS[3] - presence key
+# KEYS[4] - channel registry
+# KEYS[5] - presence index
+# KEYS[6] - resume key of the token presented by the client ('' without one)
+# KEYS[7] - resume key of a new token
+# KEYS[8] - reservations key
+# ARGV[1] - current unix timestamp
+# ARGV[2] - participant ID of the connecting session
+# ARGV[3] - channel name of the socket
+# ARGV[4] - room ID
+# ARGV[5] - presence TTL in seconds
+#
+# Admits a WebSocket into a room in one step: checks the room, resolves a
+# resume token, checks capacity and registers the socket's channel.
+# Occupants are the participants whose presence has not lapsed plus the
+# sockets holding a reservation, i.e. admitted without joining over the
+# REST API, so two sockets racing for the last slot can't both get it.
+# Reservations have a presence deadline too: the socket's heartbeat
+# extends it, and once it lapses the slot is free again. A member's
+# presence is refreshed, and a new resume token is issued unless one was
+# resumed.
+#
+# Returns {status, participant_id, resumed, is_member, expires_ts, channels}:
+#   'admitted' -> channels is the flattened registry {participant: channel}
+#   'legacy'   -> room still stored in the pre-hash format
+#   'not_found' / 'full'
+ADMIT_SOCKET_SCRIPT = INDEX_PRESENCE_FUNCTION + """
+local room_type = redis.call('TYPE', KEYS[1])['ok']
+if room_type == 'none' then
+    return {'not_found', '', 0, 0, 0, {}}
+end
+if room_type ~= 'hash' then
+    return {'legacy', '', 0, 0, 0, {}}
+end
+
+local room = redis.call('HMGET', KEYS[1], 'is_active', 'expires_ts', 'max_participants')
+local now = tonumber(ARGV[1])
+if room[1] ~= '1' or now > tonumber(room[2]) then
+    return {'not_found', '', 0, 0, 0, {}}
+end
+
+local participant = ARGV[2]
+local resumed = 0
+if KEYS[6] ~= '' then
+    local session = redis.call('HMGET', KEYS[6], 'room_id', 'participant_id')
+    if session[1] == ARGV[4] then
+        participant = session[2]
+        if redis.call('SISMEMBER', KEYS[2], participant) == 1 then
+            resumed = 1
+        else
+            -- Reaped in the meantime: the connection starts afresh
+            redis.call('DEL', KEYS[6])
+        end
+    end
+end
+
+local is_member = redis.call('SISMEMBER', KEYS[2], participant)
+local reserved = redis.call('ZSCORE', KEYS[8], participant)
+if is_member == 0 and not (reserved and tonumber(reserved) >= now) then
+    local occupants = redis.call('SCARD', KEYS[2])
+        - redis.call('ZCOUNT', KEYS[3], '-inf', '(' .. ARGV[1])
+    for _, occupant in ipairs(redis.call('ZRANGEBYSCORE', KEYS[8], ARGV[1], '+inf')) do
+        if redis.call('SISMEMBER', KEYS[2], occupant) == 0 then
+            occupants = occupants + 1
+        end
+    end
+    if occupants >= tonumber(room[3]) then
+        return {'full', participant, 0, 0, 0, {}}
+    end
+end
+
+redis.call('HSET', KEYS[4], participant, ARGV[3])
+redis.call('EXPIREAT', KEYS[4], room[2])
+
+local deadlines = is_member == 1 and KEYS[3] or KEYS[8]
+redis.call('ZADD', deadlines, now + tonumber(ARGV[5]), participant)
+redis.call('EXPIREAT', deadlines, room[2])
+index_presence(KEYS[5], KEYS[3], KEYS[8], ARGV[4])
+
+if resumed == 0 then
+    redis.call('HSET', KEYS[7], 'room_id', ARGV[4], 'participant_id', participant)
+    redis.call('EXPIREAT', KEYS[7], room[2])
+end
+
+return {'admitted', participant, resumed, is_member, tonumber(room[2]), redis.call('HGETALL', KEYS[4])}
+"""
+
+# KEYS[1] - room key
+# KEYS[2] - participants key
+# KEYS[3] - presence key
+# KEYS[4] - channel registry
+# KEYS[5] - presence index
+# KEYS[6] - expiry index
+# KEYS[7] - reservations key
+# KEYS[8..] - every per-room key, deleted with the room
+# ARGV[1] - current unix timestamp
+# ARGV[2] - room ID
+#
+# Removes participants whose presence deadline has passed, and the channels
+# of sockets whose reservation lapsed, e.g. because their worker died. A
+# room left without participants is deleted like on the last leave.
+#
+# Returns {status, reaped, announce, participant_count, short_code}:
+#   'reaped' / 'deleted' -> reaped participant IDs; announce lists those and
+#                           the lapsed sockets that still had a channel
+#                           registered, i.e. vanished without a clean
+#                           WebSocket close. A deleted room's
+#                           short_code ('' without one) is the mapping the
+#                           caller deletes
+#   'not_found'          -> room already gone, index entry removed
+REAP_STALE_PARTICIPANTS_SCRIPT = INDEX_PRESENCE_FUNCTION + """
+if redis.call('TYPE', KEYS[1])['ok'] ~= 'hash' then
+    redis.call('ZREM', KEYS[5], ARGV[2])
+    return {'not_found', {}, {}, 0, ''}
+end
+
+local stale = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', '(' .. ARGV[1])
+local announce = {}
+if #stale > 0 then
+    for _, participant in ipairs(stale) do
+        if redis.call('HEXISTS', KEYS[4], participant) == 1 then
+            table.insert(announce, participant)
+        end
+    end
+    redis.call('SREM', KEYS[2], unpack(stale))
+    redis.call('ZREM', KEYS[3], unpack(stale))
+    redis.call('HDEL', KEYS[4], unpack(stale))
+end
+
+local lapsed = redis.call('ZRANGEBYSCORE', KEYS[7], '-inf', '(' .. ARGV[1])
+if #lapsed > 0 then
+    for _, participant in ipairs(lapsed) do
+        if redis.call('SISMEMBER', KEYS[2], participant) == 0
+                and redis.call('HDEL', KEYS[4], participant) == 1 then
+            table.insert(announce, participant)
+        end
+    end
+    redis.call('ZREM', KEYS[7], unpack(lapsed))
+end
+
+local count = redis.call('SCARD', KEYS[2])
+if count == 0 and #stale > 0 then
+    local short_code = redis.call('HGET', KEYS[1], 'short_code') or ''
+    redis.call('DEL', unpack(KEYS, 8))
+    redis.call('ZREM', KEYS[6], ARGV[2])
+    redis.call('ZREM', KEYS[5], ARGV[2])
+    return {'deleted', stale, announce, 0, short_code}
+end
+
+index_presence(KEYS[5], KEYS[3], KEYS[7], ARGV[2])
+return {'reaped', stale, announce, count, ''}
+"""
+
+# KEYS[1] - rate bucket of the room
+# ARGV[1] - current unix timestamp with fractions
+# ARGV[2] - refill rate in tokens per second
+# ARGV[3] - bucket capacity
+# ARGV[4] - number of tokens requested
+#
+# Token bucket shared by every worker serving the room. Grants as many of
+# the requested tokens as are available and returns that number; workers
+# lease a few tokens at a time instead of asking for every message. The
+# bucket is dropped once it would have refilled completely anyway.
+TAKE_ROOM_TOKENS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+if now > updated then
+    tokens = math.min(burst, tokens + (now - updated) * rate)
+end
+local granted = math.min(math.floor(tokens), tonumber(ARGV[4]))
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - granted), 'updated', ARGV[1])
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return granted
+"""
+
+# KEYS[1] - room worker key
+# ARGV[1] - worker ID
+# ARGV[2] - worker URL clients can reconnect to ('' if none)
+# ARGV[3] - lease in seconds
+#
+# Makes the worker the room's owner unless another worker holds the lease,
+# and extends the lease of the owner. Returns {owner ID, owner URL}.
+CLAIM_ROOM_WORKER_SCRIPT = """
+local owner = redis.call('HMGET', KEYS[1], 'worker', 'url')
+if owner[1] and owner[1] ~= ARGV[1] then
+    return owner
+end
+redis.call('HSET', KEYS[1], 'worker', ARGV[1], 'url', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {ARGV[1], ARGV[2]}
+"""
+
+# KEYS[1] - room worker key
+# ARGV[1] - worker ID
+#
+# Drops the lease if the worker still holds it.
+RELEASE_ROOM_WORKER_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'worker') == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
@@ -0,0 +1,92 @@
+# rooms/sharding.py - Placement of rooms on Redis shards
+import bisect
+import hashlib
+import zlib
+from django.conf import settings
+
+# Every room belongs to one of ROOM_SLOTS slots, and slots are placed on
+# shards by consistent hashing. A short code's slot is picked by its CRC32;
+# a room ID carries its slot in its last byte, set to the slot of the
+# room's short code (see RoomManager.create_room), so either identifier
+# leads to the shard holding all of the room's keys.
+ROOM_SLOTS = 256
+
+# Points per shard on the hash ring; more points spread slots more evenly
+VIRTUAL_NODES = 160
+
+# Channel layer group of a room, see VideoCallConsumer
+ROOM_GROUP_PREFIX = 'room_'
+
+
+def is_room_id(identifier):
+    """Whether a room identifier is a room ID (a UUID) rather than a short code"""
+    return len(identifier) == 36
+
+
+def room_slot(identifier):
+    """Slot of a room ID or short code"""
+    if is_room_id(identifier):
+        return int(identifier[-2:], 16)
+    return zlib.crc32(identifier.encode()) % ROOM_SLOTS
+
+
+def _ring_point(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping room slots to shards, given as a list of
+    Redis URLs. Shards are placed on the ring by their URL, not their
+    position in the list, so adding a shard moves only the slots the new
+    shard takes over (about 1/N of them) and removing one only moves its own.
+    """
+
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        self.nodes = list(nodes)
+        points = sorted(
+            (_ring_point(f'{node}#{replica}'), index)
+            for index, node in enumerate(self.nodes)
+            for replica in range(virtual_nodes)
+        )
+        hashes = [point for point, _ in points]
+        # Slots are few, so each is resolved once up front
+        self.slots = [
+            points[bisect.bisect(hashes, _ring_point(f'slot#{slot}')) % len(points)][1]
+            for slot in range(ROOM_SLOTS)
+        ]
+
+    def shard_for(self, identifier):
+        """Index in `nodes` of the shard holding a room, by its ID or short code"""
+        return self.slots[room_slot(identifier)]
+
+
+_ring = None
+
+
+def get_ring():
+    """The ring over REDIS_SHARD_URLS, rebuilt when the setting changes"""
+    global _ring
+
+    nodes = getattr(settings, 'REDIS_SHARD_URLS', None) or [settings.REDIS_URL]
+    if _ring is None or _ring.nodes != nodes:
+        _ring = HashRing(nodes)
+    return _ring
+
+
+def shard_url(room_identifier=None, shard=None):
+    """
+    URL of the shard holding a room, found by its ID or short code, or of
+    shard number `shard`. Without either, the first shard.
+    """
+    ring = get_ring()
+    if shard is None:
+        shard = ring.shard_for(room_identifier) if room_identifier else 0
+    return ring.nodes[shard]
+
+
+def room_group_shard(group):
+    """Shard of a room's channel layer group, or None for other groups"""
+    if group.startswith(ROOM_GROUP_PREFIX):
+        return get_ring().shard_for(group[len(ROOM_GROUP_PREFIX):])
+    return None
@@ -0,0 +1,72 @@
+# rooms/sweeper.py - Optional in-process periodic cleanup of expired rooms and stale participants
+import logging
+import threading
+from django.conf import settings
+from django.db import close_old_connections
+from apps.rooms.models import RoomManager
+
+logger = logging.getLogger(__name__)
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+class ExpiredRoomSweeper(threading.Thread):
+    """
+    Daemon thread that periodically drains expired rooms and reaps
+    participants whose presence lapsed. Several workers may run a sweeper;
+    rooms are claimed atomically.
+    """
+
+    def __init__(self, interval, batch_size=None, max_batches=None):
+        super().__init__(name='expired-room-sweeper', daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._stop_event = threading.Event()
+
+    def run(self):
+        logger.info(f"Expired room sweeper started (every {self.interval}s)")
+        while not self._stop_event.wait(self.interval):
+            try:
+                RoomManager.cleanup_expired_rooms(
+                    batch_size=self.batch_size,
+                    max_batches=self.max_batches
+                )
+            except Exception as e:
+                logger.error(f"Expired room sweep failed: {e}")
+            try:
+                RoomManager.reap_stale_participants(
+                    batch_size=self.batch_size,
+                    max_batches=self.max_batches
+                )
+            except Exception as e:
+                logger.error(f"Stale participant sweep failed: {e}")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_sweeper():
+    """Start the sweeper thread once per process if ROOM_SWEEPER_INTERVAL is set"""
+    global _sweeper
+
+    interval = getattr(settings, 'ROOM_SWEEPER_INTERVAL', 0)
+    if not interval:
+        logger.warning(
+            "ROOM_SWEEPER_INTERVAL is 0: dropped participants are only reaped "
+            "by the cleanup_expired_rooms management command"
+        )
+        return None
+
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = ExpiredRoomSweeper(
+                interval,
+                batch_size=getattr(settings, 'ROOM_SWEEPER_BATCH_SIZE', 500),
+                max_batches=getattr(settings, 'ROOM_SWEEPER_MAX_BATCHES', 10)
+            )
+            _sweeper.start()
+    return _sweeper
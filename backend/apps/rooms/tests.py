@@ -1,3 +1,997 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import runpy
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.exceptions import ChannelFull
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from channels_redis.pubsub import RedisPubSubChannelLayer
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.core.models import RoomActivityLog
+from apps.rooms import activity, sweeper
+from apps.rooms.activity import ActivityLogWriter, flush_activity_log, log_activity
+from apps.rooms.consumers import MAX_SDP_FRAME_SIZE, signaling_router
+from apps.rooms.layers import LocalFirstChannelLayer
+from apps.rooms.models import JOIN_MESSAGES, AsyncRoomManager, RoomManager
+from apps.rooms.outbound import OutboundQueue
+from apps.rooms.protocol import MSGPACK_SUBPROTOCOL, decode_msgpack, encode_msgpack, text_frame_size
+from apps.rooms.ratelimit import MessageRateLimiter, TokenBucket
+from apps.rooms.router import MessageRouter
+from apps.rooms.routing import websocket_urlpatterns
+from apps.rooms.sharding import HashRing, get_ring, room_group_shard, room_slot
+from apps.rooms.sweeper import ExpiredRoomSweeper
+from videocall_app import settings as settings_module
+
+
+class RoomManagerConcurrencyTests(TransactionTestCase):
+    """Join/leave must stay consistent when many clients hit one room at once"""
+
+    workers = 32
+
+    def setUp(self):
+        self.room = RoomManager.create_room(creator_ip='127.0.0.1')
+
+    def tearDown(self):
+        RoomManager.delete_room(self.room['room_id'])
+
+    def _run_concurrently(self, func, args):
+        def call(arg):
+            try:
+                return func(arg)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(call, args))
+
+    def test_concurrent_joins_never_exceed_capacity(self):
+        participants = [f'participant_{i}' for i in range(self.workers * 4)]
+
+        results = self._run_concurrently(
+            lambda participant_id: RoomManager.join_room(self.room['short_code'], participant_id),
+            participants
+        )
+
+        joined = [room for room, _ in results if room]
+        messages = {message for room, message in results if not room}
+        room_data = RoomManager.get_room_by_id(self.room['room_id'])
+
+        self.assertEqual(len(joined), self.room['max_participants'])
+        self.assertEqual(messages, {"Room is full"})
+        self.assertEqual(len(room_data['participants']), self.room['max_participants'])
+        flush_activity_log()
+        self.assertEqual(
+            RoomActivityLog.objects.filter(room_id=self.room['room_id'], action='joined').count(),
+            self.room['max_participants']
+        )
+
+    @override_settings(MAX_PARTICIPANTS_PER_ROOM=64)
+    def test_concurrent_join_and_leave_keep_every_update(self):
+        RoomManager.delete_room(self.room['room_id'])
+        self.room = RoomManager.create_room()
+        staying = [f'staying_{i}' for i in range(self.workers)]
+        leaving = [f'leaving_{i}' for i in range(self.workers)]
+        for participant_id in leaving:
+            RoomManager.join_room(self.room['room_id'], participant_id)
+
+        def churn(item):
+            action, participant_id = item
+            if action == 'join':
+                return RoomManager.join_room(self.room['room_id'], participant_id)[0] is not None
+            return RoomManager.leave_room(self.room['room_id'], participant_id)
+
+        results = self._run_concurrently(
+            churn,
+            [('join', p) for p in staying] + [('leave', p) for p in leaving]
+        )
+
+        room_data = RoomManager.get_room_by_id(self.room['room_id'])
+        self.assertTrue(all(results))
+        self.assertCountEqual(room_data['participants'], staying)
+
+    def test_repeated_join_is_idempotent(self):
+        first, _ = RoomManager.join_room(self.room['room_id'], 'participant')
+        second, message = RoomManager.join_room(self.room['room_id'], 'participant')
+
+        self.assertEqual(first['participants'], ['participant'])
+        self.assertEqual(second['participants'], ['participant'])
+        self.assertEqual(message, "Successfully joined room")
+
+    def test_room_size_is_set_per_room(self):
+        RoomManager.delete_room(self.room['room_id'])
+        self.room = RoomManager.create_room(max_participants=4)
+
+        results = [RoomManager.join_room(self.room['room_id'], f'participant_{i}') for i in range(5)]
+
+        self.assertEqual([room is not None for room, _ in results], [True] * 4 + [False])
+        self.assertEqual(results[-1][1], "Room is full")
+
+    def test_short_code_lives_on_the_room_shard(self):
+        ring = get_ring()
+
+        self.assertEqual(room_slot(self.room['room_id']), room_slot(self.room['short_code']))
+        self.assertEqual(uuid.UUID(self.room['room_id']).version, 4)
+        self.assertEqual(ring.shard_for(self.room['short_code']), ring.shard_for(self.room['room_id']))
+        self.assertEqual(room_group_shard(f"room_{self.room['room_id']}"), ring.shard_for(self.room['room_id']))
+        self.assertEqual(
+            RoomManager.get_room_by_code(self.room['short_code'], fields=('room_id',))['room_id'],
+            self.room['room_id']
+        )
+
+    def test_last_leave_deletes_room(self):
+        RoomManager.join_room(self.room['room_id'], 'participant')
+
+        self.assertTrue(RoomManager.leave_room(self.room['room_id'], 'participant'))
+        self.assertIsNone(RoomManager.get_room_by_id(self.room['room_id']))
+        self.assertIsNone(RoomManager.get_room_by_code(self.room['short_code']))
+        self.assertFalse(RoomManager.leave_room(self.room['room_id'], 'participant'))
+
+    def test_last_leave_deletes_room_without_short_code(self):
+        RoomManager.join_room(self.room['room_id'], 'participant')
+        RoomManager._get_redis_connection(self.room['room_id']).hdel(
+            RoomManager._room_key(self.room['room_id']), 'short_code'
+        )
+
+        self.assertTrue(RoomManager.leave_room(self.room['room_id'], 'participant'))
+        self.assertIsNone(RoomManager.get_room_by_id(self.room['room_id']))
+
+
+class RoomPresenceTests(TransactionTestCase):
+    """Participants whose presence lapsed must not hold on to room slots"""
+
+    def setUp(self):
+        self.room = RoomManager.create_room()
+
+    def tearDown(self):
+        RoomManager.delete_room(self.room['room_id'])
+
+    def test_lapsed_participants_do_not_count_towards_capacity(self):
+        with override_settings(PRESENCE_TTL=-1):
+            for i in range(self.room['max_participants']):
+                RoomManager.join_room(self.room['room_id'], f'ghost_{i}')
+
+        room_data, message = RoomManager.join_room(self.room['room_id'], 'participant')
+
+        self.assertIsNotNone(room_data, message)
+        self.assertEqual(
+            RoomManager.get_room_by_id(
+                self.room['room_id'], fields=('live_participant_count',)
+            )['live_participant_count'],
+            1
+        )
+
+    def test_reaper_removes_lapsed_participants(self):
+        RoomManager.join_room(self.room['room_id'], 'participant')
+        with override_settings(PRESENCE_TTL=-1):
+            RoomManager.join_room(self.room['room_id'], 'ghost')
+
+        stats = RoomManager.reap_stale_participants()
+
+        self.assertEqual(stats['reaped'], 1)
+        self.assertEqual(
+            RoomManager.get_room_by_id(self.room['room_id'])['participants'],
+            ['participant']
+        )
+        self.assertEqual(RoomManager.reap_stale_participants()['reaped'], 0)
+
+    def test_reaper_deletes_rooms_left_empty(self):
+        with override_settings(PRESENCE_TTL=-1):
+            RoomManager.join_room(self.room['room_id'], 'ghost')
+
+        stats = RoomManager.reap_stale_participants()
+
+        self.assertEqual(stats['deleted'], 1)
+        self.assertIsNone(RoomManager.get_room_by_id(self.room['room_id']))
+        self.assertIsNone(RoomManager.get_room_by_code(self.room['short_code']))
+
+
+class LegacyRoomMigrationTests(TransactionTestCase):
+    """Rooms pickled by the cache-based release are upgraded on first use"""
+
+    def setUp(self):
+        # Stored the way the old release did: one pickled blob per room and
+        # a pickled room ID under the short code
+        self.room_id = str(uuid.uuid4())
+        self.short_code = RoomManager.generate_short_code()
+        room_data = {
+            'room_id': self.room_id,
+            'short_code': self.short_code,
+            'created_at': timezone.now().isoformat(),
+            'participants': ['first', 'second'],
+            'is_active': True,
+            'expires_at': (timezone.now() + timedelta(hours=1)).isoformat(),
+            'creator_ip': '127.0.0.1',
+            'max_participants': 3
+        }
+        client = RoomManager._get_redis_client().client
+        RoomManager._get_redis_connection(self.room_id).set(
+            RoomManager._room_key(self.room_id), client.encode(room_data), ex=3600
+        )
+        RoomManager._get_redis_connection(self.short_code).set(
+            RoomManager._code_key(self.short_code), client.encode(self.room_id), ex=3600
+        )
+
+    def tearDown(self):
+        RoomManager._get_redis_connection(self.room_id).delete(RoomManager._room_key(self.room_id))
+        RoomManager._get_redis_connection(self.short_code).delete(RoomManager._code_key(self.short_code))
+        RoomManager.delete_room(self.room_id)
+
+    def assertRoomUpgraded(self):
+        self.assertEqual(
+            RoomManager._get_redis_connection(self.room_id).type(RoomManager._room_key(self.room_id)),
+            b'hash'
+        )
+
+    def assertCodeUpgraded(self):
+        self.assertEqual(
+            RoomManager._get_redis_connection(self.short_code).get(RoomManager._code_key(self.short_code)),
+            self.room_id.encode()
+        )
+
+    def test_read_upgrades_legacy_room(self):
+        room_data = RoomManager.get_room_by_code(self.short_code)
+
+        self.assertEqual(room_data['room_id'], self.room_id)
+        self.assertEqual(sorted(room_data['participants']), ['first', 'second'])
+        self.assertEqual(room_data['max_participants'], 3)
+        self.assertRoomUpgraded()
+        self.assertCodeUpgraded()
+
+    def test_join_upgrades_legacy_room(self):
+        room_data, message = RoomManager.join_room(self.short_code, 'third')
+
+        self.assertIsNotNone(room_data, message)
+        self.assertEqual(sorted(room_data['participants']), ['first', 'second', 'third'])
+        self.assertEqual(RoomManager.join_room(self.room_id, 'fourth'), (None, JOIN_MESSAGES['full']))
+        self.assertRoomUpgraded()
+        self.assertCodeUpgraded()
+
+    def test_leave_upgrades_legacy_room(self):
+        self.assertTrue(RoomManager.leave_room(self.room_id, 'first'))
+
+        self.assertEqual(RoomManager.get_room_by_id(self.room_id)['participants'], ['second'])
+        self.assertRoomUpgraded()
+
+
+class ExpiredRoomCleanupTests(TransactionTestCase):
+    """Expired rooms are claimed in batches, each by exactly one sweeper"""
+
+    def setUp(self):
+        self.rooms = [RoomManager.create_room() for _ in range(5)]
+        self.expired = self.rooms[:3]
+        # Past their expiry as far as their shard's index is concerned
+        for room in self.expired:
+            RoomManager._get_redis_connection(room['room_id']).zadd(
+                RoomManager._expiry_index_key(), {room['room_id']: int(time.time()) - 10}
+            )
+
+    def tearDown(self):
+        for room in self.rooms:
+            RoomManager.delete_room(room['room_id'])
+
+    def assertExpiredRoomsRemoved(self):
+        for room in self.expired:
+            self.assertIsNone(RoomManager.get_room_by_id(room['room_id']))
+            self.assertIsNone(RoomManager.get_room_by_code(room['short_code']))
+        for room in self.rooms[3:]:
+            self.assertIsNotNone(RoomManager.get_room_by_id(room['room_id']))
+
+    def test_cleanup_claims_expired_rooms_in_batches(self):
+        stats = RoomManager.cleanup_expired_rooms(batch_size=2)
+
+        self.assertEqual((stats['batches'], stats['expired']), (2, 3))
+        self.assertExpiredRoomsRemoved()
+        self.assertEqual(
+            RoomActivityLog.objects.filter(
+                room_id__in=[room['room_id'] for room in self.expired], action='expired'
+            ).count(),
+            3
+        )
+        self.assertEqual(RoomManager.cleanup_expired_rooms()['expired'], 0)
+
+    def test_max_batches_leaves_the_rest_for_the_next_run(self):
+        self.assertEqual(RoomManager.cleanup_expired_rooms(batch_size=1, max_batches=2)['expired'], 2)
+        self.assertEqual(RoomManager.cleanup_expired_rooms(batch_size=1)['expired'], 1)
+
+    def test_concurrent_sweepers_claim_each_room_once(self):
+        def sweep(_):
+            try:
+                return RoomManager.cleanup_expired_rooms(batch_size=1)['expired']
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(sum(executor.map(sweep, range(4))), 3)
+        self.assertExpiredRoomsRemoved()
+
+    def test_sweeper_thread_removes_expired_rooms(self):
+        thread = ExpiredRoomSweeper(0.05, batch_size=2)
+        thread.start()
+        try:
+            deadline = time.monotonic() + 5
+            while RoomManager.get_room_by_id(self.expired[-1]['room_id']) and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            thread.stop()
+            thread.join()
+
+        self.assertExpiredRoomsRemoved()
+
+    def test_sweeper_starts_once_per_process_when_enabled(self):
+        with mock.patch.object(sweeper, '_sweeper', None), \
+                mock.patch.object(ExpiredRoomSweeper, 'start') as start:
+            with override_settings(ROOM_SWEEPER_INTERVAL=0):
+                self.assertIsNone(sweeper.start_sweeper())
+            with override_settings(ROOM_SWEEPER_INTERVAL=30):
+                first = sweeper.start_sweeper()
+                self.assertIs(sweeper.start_sweeper(), first)
+
+        self.assertEqual(first.interval, 30)
+        start.assert_called_once_with()
+
+
+class SocketAdmissionTests(TransactionTestCase):
+    """Sockets racing for a room never get in beyond its capacity"""
+
+    def setUp(self):
+        self.room = RoomManager.create_room()
+
+    def tearDown(self):
+        RoomManager.delete_room(self.room['room_id'])
+
+    def _admit(self, *sockets, resume_token=None):
+        async def admit():
+            return await asyncio.gather(*(
+                AsyncRoomManager.admit_socket(
+                    self.room['room_id'], participant_id, f'channel_{participant_id}', resume_token
+                )
+                for participant_id in sockets
+            ))
+        return asyncio.run(admit())
+
+    def test_concurrent_sockets_never_exceed_capacity(self):
+        results = self._admit(*(f'socket_{i}' for i in range(16)))
+
+        statuses = [result['status'] for result in results]
+        self.assertEqual(statuses.count('admitted'), self.room['max_participants'])
+        self.assertEqual(statuses.count('full'), 16 - self.room['max_participants'])
+
+    def test_members_are_admitted_into_a_full_room(self):
+        RoomManager.join_room(self.room['room_id'], 'member')
+        self._admit('stranger')
+        self.assertEqual(self._admit('late')[0]['status'], 'full')
+
+        admission, = self._admit('member')
+
+        self.assertEqual(admission['status'], 'admitted')
+        self.assertTrue(admission['is_member'])
+        self.assertEqual(set(admission['channels']), {'member', 'stranger'})
+
+    def test_lapsed_reservations_free_their_slots(self):
+        with override_settings(PRESENCE_TTL=-1):
+            self._admit(*(f'ghost_{i}' for i in range(self.room['max_participants'])))
+
+        self.assertEqual(self._admit('late')[0]['status'], 'admitted')
+
+        RoomManager.reap_stale_participants()
+
+        channels = RoomManager._get_redis_connection(self.room['room_id']).hkeys(
+            RoomManager._channels_key(self.room['room_id'])
+        )
+        self.assertEqual(channels, [b'late'])
+        self.assertIsNotNone(RoomManager.get_room_by_id(self.room['room_id']))
+
+    def test_heartbeat_extends_reservation(self):
+        with override_settings(PRESENCE_TTL=-1):
+            self._admit('stranger')
+        self.assertFalse(asyncio.run(AsyncRoomManager.refresh_presence(
+            self.room['room_id'], 'stranger', self.room['expires_ts']
+        )))
+
+        refreshed = asyncio.run(AsyncRoomManager.refresh_presence(
+            self.room['room_id'], 'stranger', self.room['expires_ts'], is_member=False
+        ))
+        RoomManager.reap_stale_participants()
+
+        self.assertTrue(refreshed)
+        channels = RoomManager._get_redis_connection(self.room['room_id']).hkeys(
+            RoomManager._channels_key(self.room['room_id'])
+        )
+        self.assertEqual(channels, [b'stranger'])
+
+    def test_resume_token_restores_participant(self):
+        RoomManager.join_room(self.room['room_id'], 'member')
+        first, = self._admit('member')
+
+        resumed, = self._admit('other_session', resume_token=first['resume_token'])
+
+        self.assertTrue(resumed['resumed'])
+        self.assertEqual(resumed['participant_id'], 'member')
+        self.assertEqual(resumed['resume_token'], first['resume_token'])
+
+    def test_missing_room_is_not_found(self):
+        RoomManager.delete_room(self.room['room_id'])
+
+        self.assertEqual(self._admit('socket')[0]['status'], 'not_found')
+
+    @override_settings(REPLAY_BUFFER_SIZE=3)
+    def test_replay_returns_buffered_events_after_sequence(self):
+        events = [('member', {'type': 'ice_candidate', 'seq': f'seq-{n}'}) for n in range(4)]
+
+        async def buffer_and_replay():
+            await AsyncRoomManager.buffer_events(self.room['room_id'], events)
+            return [
+                await AsyncRoomManager.replay_events(self.room['room_id'], 'member', after)
+                for after in ('seq-1', None, 'seq-0')
+            ]
+
+        after_second, everything, evicted = asyncio.run(buffer_and_replay())
+
+        self.assertEqual(after_second, [message for _, message in events[2:]])
+        # Only the last REPLAY_BUFFER_SIZE events are kept
+        self.assertEqual([event['seq'] for event in everything], ['seq-1', 'seq-2', 'seq-3'])
+        self.assertEqual(evicted, everything)
+
+
+class RoomAffinityTests(TransactionTestCase):
+    """A room is owned by one worker at a time until it lets go"""
+
+    def setUp(self):
+        self.room = RoomManager.create_room()
+
+    def tearDown(self):
+        RoomManager.delete_room(self.room['room_id'])
+
+    def test_first_worker_keeps_the_room(self):
+        async def claim():
+            first = await AsyncRoomManager.claim_room_worker(self.room['room_id'], 'worker_a', 'wss://a')
+            second = await AsyncRoomManager.claim_room_worker(self.room['room_id'], 'worker_b', 'wss://b')
+            await AsyncRoomManager.release_room_worker(self.room['room_id'], 'worker_b')
+            third = await AsyncRoomManager.claim_room_worker(self.room['room_id'], 'worker_b', 'wss://b')
+            return first, second, third
+
+        first, second, third = asyncio.run(claim())
+
+        self.assertEqual(first, ('worker_a', 'wss://a'))
+        self.assertEqual(second, ('worker_a', 'wss://a'))
+        self.assertEqual(third, ('worker_a', 'wss://a'))
+
+    def test_released_room_goes_to_the_next_worker(self):
+        async def claim():
+            await AsyncRoomManager.claim_room_worker(self.room['room_id'], 'worker_a', 'wss://a')
+            await AsyncRoomManager.release_room_worker(self.room['room_id'], 'worker_a')
+            return await AsyncRoomManager.claim_room_worker(self.room['room_id'], 'worker_b', 'wss://b')
+
+        self.assertEqual(asyncio.run(claim()), ('worker_b', 'wss://b'))
+
+
+@override_settings(NEGOTIATION_PACE_MS=0)
+class VideoCallConsumerTests(TransactionTestCase):
+    """Signaling between clients connected to one room"""
+
+    def setUp(self):
+        self.room = RoomManager.create_room(max_participants=3)
+
+    def tearDown(self):
+        RoomManager.delete_room(self.room['room_id'])
+
+    async def _connect(self, session_key=None, query='', subprotocols=None):
+        """Open a socket into the room and return it with its session message"""
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f"/ws/room/{self.room['room_id']}/?{query}",
+            subprotocols=subprotocols
+        )
+        if session_key:
+            communicator.scope['session'] = SimpleNamespace(session_key=session_key)
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        if subprotocol == MSGPACK_SUBPROTOCOL:
+            session = decode_msgpack(await communicator.receive_from())
+        else:
+            session = await communicator.receive_json_from()
+        self.assertEqual(session['type'], 'session')
+        return communicator, session
+
+    def _join(self, session_key):
+        return RoomManager.join_room(self.room['room_id'], RoomManager.participant_id_for(session_key))
+
+    async def test_participant_id_does_not_reveal_session_key(self):
+        first, first_session = await self._connect('first-session-key')
+        second, second_session = await self._connect('second-session-key')
+
+        joined = await first.receive_json_from()
+
+        self.assertEqual(joined['type'], 'user_joined')
+        self.assertEqual(joined['participant_id'], second_session['participant_id'])
+        self.assertEqual(joined['participant_id'], RoomManager.participant_id_for('second-session-key'))
+        self.assertNotIn('session-key', joined['participant_id'])
+        self.assertNotIn('session-key', first_session['participant_id'])
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_signaling_reaches_only_its_target(self):
+        first, first_session = await self._connect('first-session-key')
+        second, second_session = await self._connect('second-session-key')
+        await first.receive_json_from()  # user_joined
+        third, _ = await self._connect('third-session-key')
+        await first.receive_json_from()  # user_joined
+        await second.receive_json_from()  # user_joined
+        first_id, second_id = first_session['participant_id'], second_session['participant_id']
+
+        offer = {'type': 'offer', 'sdp': 'v=0 offer'}
+        await first.send_json_to({'type': 'offer', 'offer': offer, 'target': second_id})
+        received = await second.receive_json_from()
+        self.assertEqual(
+            (received['type'], received['offer'], received['sender']), ('webrtc_offer', offer, first_id)
+        )
+
+        answer = {'type': 'answer', 'sdp': 'v=0 answer'}
+        await second.send_json_to({'type': 'answer', 'answer': answer, 'target': first_id})
+        received = await first.receive_json_from()
+        self.assertEqual(
+            (received['type'], received['answer'], received['sender']), ('webrtc_answer', answer, second_id)
+        )
+
+        candidate = {'candidate': 'candidate:1 1 udp 1 10.0.0.1 9 typ host', 'sdpMid': '0'}
+        await first.send_json_to({'type': 'ice_candidate', 'candidate': candidate, 'target': second_id})
+        received = await second.receive_json_from()
+        self.assertEqual(
+            (received['type'], received['candidate'], received['sender']), ('ice_candidate', candidate, first_id)
+        )
+
+        self.assertTrue(await third.receive_nothing())
+        self.assertTrue(await first.receive_nothing())
+        for communicator in (first, second, third):
+            await communicator.disconnect()
+
+    async def _pair(self, second_query=''):
+        """Two connected clients, the first already told about the second"""
+        first, first_session = await self._connect('first-session-key')
+        second, second_session = await self._connect('second-session-key', query=second_query)
+        await first.receive_json_from()  # user_joined
+        return first, second, first_session['participant_id'], second_session['participant_id']
+
+    @override_settings(ICE_BATCH_WINDOW_MS=60000)
+    async def test_batched_candidates_are_flushed_on_disconnect(self):
+        first, second, first_id, second_id = await self._pair(second_query='ice_batch=1')
+        candidates = [{'candidate': f'candidate:{n}'} for n in range(3)]
+
+        for candidate in candidates:
+            await first.send_json_to({'type': 'ice_candidate', 'candidate': candidate, 'target': second_id})
+        await first.send_json_to({'type': 'ping'})
+        self.assertEqual((await first.receive_json_from())['type'], 'pong')
+        # Still waiting for the batch window to close
+        self.assertTrue(await second.receive_nothing())
+
+        await first.disconnect()
+
+        batch = await second.receive_json_from()
+        self.assertEqual((batch['type'], batch['candidates'], batch['sender']), ('ice_candidates', candidates, first_id))
+        self.assertEqual((await second.receive_json_from())['type'], 'user_left')
+        await second.disconnect()
+
+    @override_settings(ICE_BATCH_WINDOW_MS=60000, ICE_BATCH_MAX_CANDIDATES=2)
+    async def test_full_batch_and_offer_flush_candidates(self):
+        first, second, _, second_id = await self._pair()
+
+        await first.send_json_to({
+            'type': 'ice_candidates',
+            'candidates': [{'candidate': 'candidate:0'}, {'candidate': 'candidate:1'}],
+            'target': second_id
+        })
+        await first.send_json_to({'type': 'ice_candidate', 'candidate': {'candidate': 'candidate:2'}, 'target': second_id})
+        await first.send_json_to({'type': 'offer', 'offer': {'type': 'offer', 'sdp': 'v=0'}, 'target': second_id})
+
+        # A client without batch support gets the batch one candidate at a time
+        received = [await second.receive_json_from() for _ in range(4)]
+        self.assertEqual(
+            [(message['type'], message.get('candidate')) for message in received],
+            [
+                ('ice_candidate', {'candidate': 'candidate:0'}),
+                ('ice_candidate', {'candidate': 'candidate:1'}),
+                ('ice_candidate', {'candidate': 'candidate:2'}),
+                ('webrtc_offer', None),
+            ]
+        )
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_msgpack_clients_exchange_binary_frames_with_json_clients(self):
+        binary, binary_session = await self._connect('first-session-key', subprotocols=[MSGPACK_SUBPROTOCOL])
+        text, text_session = await self._connect('second-session-key')
+        joined = decode_msgpack(await binary.receive_from())
+        self.assertEqual((joined['type'], joined['participant_id']), ('user_joined', text_session['participant_id']))
+
+        offer = {'type': 'offer', 'sdp': 'v=0 from json'}
+        await text.send_json_to({'type': 'offer', 'offer': offer, 'target': binary_session['participant_id']})
+        received = decode_msgpack(await binary.receive_from())
+        self.assertEqual((received['type'], received['offer']), ('webrtc_offer', offer))
+
+        answer = {'type': 'answer', 'sdp': 'v=0 from msgpack'}
+        await binary.send_to(bytes_data=encode_msgpack(
+            {'type': 'answer', 'answer': answer, 'target': text_session['participant_id']}
+        ))
+        received = await text.receive_json_from()
+        self.assertEqual((received['type'], received['answer']), ('webrtc_answer', answer))
+
+        await binary.send_to(bytes_data=encode_msgpack({'type': 'ping'}))
+        self.assertEqual(decode_msgpack(await binary.receive_from())['type'], 'pong')
+        await binary.disconnect()
+        await text.disconnect()
+
+    async def test_binary_frames_need_the_msgpack_subprotocol(self):
+        communicator, _ = await self._connect('first-session-key')
+
+        await communicator.send_to(bytes_data=encode_msgpack({'type': 'ping'}))
+
+        error = await communicator.receive_json_from()
+        self.assertEqual(
+            (error['type'], error['message']), ('error', 'Binary frames require the msgpack subprotocol')
+        )
+        await communicator.disconnect()
+
+    async def test_frame_limits_count_bytes(self):
+        communicator, _ = await self._connect('first-session-key')
+
+        # Under the 256 byte limit of pings in characters, not in UTF-8 bytes
+        frame = json.dumps({'type': 'ping', 'padding': '\u00e9' * 120}, ensure_ascii=False)
+        self.assertLess(len(frame), 256)
+        self.assertEqual(text_frame_size(frame, 256), len(frame.encode()))
+        # Frames that fit even at 4 bytes a character are not encoded
+        self.assertEqual(text_frame_size(frame, 1024), len(frame))
+        await communicator.send_to(text_data=frame)
+        error = await communicator.receive_json_from()
+
+        self.assertEqual((error['type'], error['message']), ('error', 'Message too large for ping'))
+        await communicator.disconnect()
+
+    async def test_malformed_msgpack_frames_are_rejected(self):
+        communicator, _ = await self._connect('first-session-key', subprotocols=[MSGPACK_SUBPROTOCOL])
+
+        for frame in (b'\x92\x01', b'\xc1'):
+            await communicator.send_to(bytes_data=frame)
+            error = decode_msgpack(await communicator.receive_from())
+            self.assertEqual((error['type'], error['message']), ('error', 'Invalid MessagePack format'))
+        await communicator.disconnect()
+
+    async def test_clean_close_leaves_the_room(self):
+        await sync_to_async(self._join)('first-session-key')
+        await sync_to_async(self._join)('second-session-key')
+        first, first_session = await self._connect('first-session-key')
+        second, _ = await self._connect('second-session-key')
+        await first.receive_json_from()  # user_joined
+
+        await first.disconnect(code=1000)
+
+        left = await second.receive_json_from()
+        self.assertEqual(left['type'], 'user_left')
+        self.assertEqual(left['participant_id'], first_session['participant_id'])
+        room = await sync_to_async(RoomManager.get_room_by_id)(self.room['room_id'], fields=('participants',))
+        self.assertEqual(room['participants'], [RoomManager.participant_id_for('second-session-key')])
+
+        await second.disconnect(code=1001)
+        self.assertIsNone(await sync_to_async(RoomManager.get_room_by_id)(self.room['room_id']))
+
+    async def test_resumed_participant_gets_messages_sent_while_dropped(self):
+        await sync_to_async(self._join)('first-session-key')
+        await sync_to_async(self._join)('second-session-key')
+        first, _ = await self._connect('first-session-key')
+        second, second_session = await self._connect('second-session-key')
+        await first.receive_json_from()  # user_joined
+        target = second_session['participant_id']
+
+        await first.send_json_to({'type': 'offer', 'offer': {'type': 'offer', 'sdp': 'v=0 1'}, 'target': target})
+        seen = await second.receive_json_from()
+        await second.disconnect(code=1006)
+
+        await first.send_json_to({'type': 'offer', 'offer': {'type': 'offer', 'sdp': 'v=0 2'}, 'target': target})
+        await first.send_json_to({'type': 'ice_candidate', 'candidate': {'candidate': 'c'}, 'target': target})
+        # Written to the replay buffer behind delivery
+        for _ in range(50):
+            if len(await AsyncRoomManager.replay_events(self.room['room_id'], target)) == 3:
+                break
+            await asyncio.sleep(0.01)
+
+        resumed, session = await self._connect(
+            'other-session-key', query=f"resume={second_session['resume_token']}&last_seq={seen['seq']}"
+        )
+        offer = await resumed.receive_json_from()
+        candidate = await resumed.receive_json_from()
+
+        self.assertTrue(session['resumed'])
+        self.assertEqual(session['participant_id'], target)
+        self.assertEqual((offer['type'], offer['offer']['sdp']), ('webrtc_offer', 'v=0 2'))
+        self.assertEqual((candidate['type'], candidate['candidate']), ('ice_candidate', {'candidate': 'c'}))
+        self.assertTrue(await resumed.receive_nothing())
+        await first.disconnect()
+        await resumed.disconnect()
+
+
+class ActivityLogBufferTests(TransactionTestCase):
+    """Activity rows leave the request path and reach the database in batches"""
+
+    def test_flush_writes_queued_rows(self):
+        for action in ('created', 'joined', 'left'):
+            log_activity(room_id='buffered_room', action=action)
+        flush_activity_log()
+
+        self.assertEqual(RoomActivityLog.objects.filter(room_id='buffered_room').count(), 3)
+
+    def test_full_buffer_drops_rows_only_when_allowed(self):
+        # Not started, so nothing leaves the queue until flushed
+        writer = ActivityLogWriter(1, batch_size=10, interval=1)
+
+        with mock.patch.object(activity, '_writer', writer):
+            with override_settings(ACTIVITY_LOG_DROP_ON_OVERLOAD=True):
+                log_activity(room_id='full_room', action='joined')
+                log_activity(room_id='full_room', action='left')
+            with override_settings(ACTIVITY_LOG_DROP_ON_OVERLOAD=False):
+                log_activity(room_id='full_room', action='deleted')
+            writer.flush()
+
+        self.assertEqual(
+            sorted(RoomActivityLog.objects.filter(room_id='full_room').values_list('action', flat=True)),
+            ['deleted', 'joined']
+        )
+
+
+class OutboundQueueTests(SimpleTestCase):
+    """A slow client's queue stays bounded and keeps only what is worth sending"""
+
+    def setUp(self):
+        self.queue = OutboundQueue(max_frames=3, max_bytes=1024)
+
+    def tearDown(self):
+        self.queue.close()
+
+    def _drain(self):
+        async def drain():
+            return [await self.queue.get() for _ in range(self.queue.frames)]
+        return asyncio.run(drain())
+
+    def test_media_state_is_coalesced_per_participant(self):
+        self.queue.put('media_state_update', 'a1', 'a')
+        self.queue.put('media_state_update', 'b1', 'b')
+        self.queue.put('media_state_update', 'a2', 'a')
+
+        self.assertEqual(self._drain(), ['a2', 'b1'])
+
+    def test_control_frames_go_first(self):
+        self.queue.put('media_state_update', 'state', 'a')
+        self.queue.put('ice_candidate', 'ice')
+        self.queue.put('error', 'error')
+
+        self.assertEqual(self._drain(), ['error', 'ice', 'state'])
+
+    def test_membership_keeps_its_place_among_signaling(self):
+        self.queue.put('webrtc_offer', 'offer', 'a')
+        self.queue.put('user_left', 'left', 'a')
+        self.queue.put('pong', 'pong')
+
+        self.assertEqual(self._drain(), ['pong', 'offer', 'left'])
+
+    def test_full_queue_sheds_state_and_rejects_signaling(self):
+        for index in range(3):
+            self.assertTrue(self.queue.put('ice_candidate', f'ice{index}'))
+
+        self.assertTrue(self.queue.put('media_state_update', 'state', 'a'))
+        self.assertFalse(self.queue.put('webrtc_offer', 'offer'))
+        self.assertEqual(self._drain(), ['ice0', 'ice1', 'ice2'])
+
+    def test_byte_budget_counts_utf8(self):
+        # 400 characters, 800 bytes
+        self.assertTrue(self.queue.put('webrtc_offer', '\u00e9' * 400))
+        self.assertFalse(self.queue.put('webrtc_offer', '\u00e9' * 200))
+        self.assertEqual(self.queue.bytes, 800)
+
+
+class MessageRateLimiterTests(SimpleTestCase):
+    """Inbound messages are limited per type and refill over time"""
+
+    def setUp(self):
+        self.limiter = MessageRateLimiter(
+            {'offer': (1, 2), 'ice_candidate': (10, 10), '*': (1, 1)},
+            max_violations=2,
+            now=0
+        )
+
+    def test_bucket_refills_up_to_burst(self):
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+
+        self.assertTrue(bucket.take(3, now=0))
+        self.assertFalse(bucket.take(1, now=0.1))
+        self.assertTrue(bucket.take(1, now=0.5))
+        self.assertTrue(bucket.take(3, now=100))
+        self.assertFalse(bucket.take(1, now=100))
+
+    def test_budgets_are_per_type(self):
+        self.assertTrue(self.limiter.allow('offer', now=0))
+        self.assertTrue(self.limiter.allow('offer', now=0))
+        self.assertFalse(self.limiter.allow('offer', now=0))
+        self.assertTrue(self.limiter.allow('ice_candidate', now=0))
+        self.assertTrue(self.limiter.allow('ping', now=0))
+        self.assertFalse(self.limiter.allow('media_state', now=0))
+
+    def test_repeated_violations_use_up_strikes(self):
+        self.assertTrue(self.limiter.strike(now=0))
+        self.assertTrue(self.limiter.strike(now=0))
+        self.assertFalse(self.limiter.strike(now=0))
+        self.assertTrue(self.limiter.strike(now=5))
+
+
+class MessageRouterTests(SimpleTestCase):
+    """Inbound messages are checked against the declaration of their type"""
+
+    def test_session_description_shape_is_checked(self):
+        route = signaling_router.get('offer')
+
+        self.assertIsNone(route.validate({'offer': {'type': 'offer', 'sdp': 'v=0'}, 'target': 'peer'}))
+        self.assertIsNotNone(route.validate({}))
+        self.assertIsNotNone(route.validate({'offer': 'v=0'}))
+        self.assertIsNotNone(route.validate({'offer': {'type': 'offer'}}))
+        self.assertIsNotNone(route.validate({'offer': {'type': 'offer', 'sdp': 'v=0'}, 'target': 1}))
+
+    def test_batches_draw_from_the_single_candidate_budget(self):
+        route = signaling_router.get('ice_candidates')
+
+        self.assertEqual(route.rate_class, 'ice_candidate')
+        self.assertEqual(route.cost({'candidates': [{}, {}, {}]}), 3)
+        self.assertIsNotNone(route.validate({'candidates': []}))
+
+    def test_largest_frame_is_a_session_description(self):
+        self.assertEqual(signaling_router.max_size, MAX_SDP_FRAME_SIZE)
+        self.assertLess(signaling_router.get('ping').max_size, MAX_SDP_FRAME_SIZE)
+        self.assertIsNone(signaling_router.get('unknown'))
+
+    def test_message_type_is_routed_once(self):
+        router = MessageRouter()
+        router.route('ping')(lambda consumer, data: None)
+
+        with self.assertRaises(ValueError):
+            router.route('ping')
+
+
+class HashRingTests(SimpleTestCase):
+    """
+    Rooms are spread over shards and stay put when shards are added. The
+    Redis-backed tests above run sharded when REDIS_SHARD_URLS lists several
+    local Redis servers.
+    """
+
+    nodes = [f'redis://localhost:{port}/0' for port in range(6379, 6383)]
+
+    def test_slots_are_spread_over_shards(self):
+        ring = HashRing(self.nodes)
+
+        for shard in range(len(self.nodes)):
+            self.assertGreater(ring.slots.count(shard), len(ring.slots) / len(self.nodes) / 2)
+
+    def test_adding_a_shard_only_moves_its_slots(self):
+        before = HashRing(self.nodes)
+        after = HashRing(self.nodes + ['redis://localhost:6383/0'])
+
+        moved = [slot for slot, shard in enumerate(before.slots) if after.slots[slot] != shard]
+
+        self.assertTrue(all(after.slots[slot] == len(self.nodes) for slot in moved))
+        self.assertLess(len(moved), len(before.slots) / len(self.nodes))
+
+    def test_order_of_shard_urls_does_not_move_rooms(self):
+        ring = HashRing(self.nodes)
+        reversed_ring = HashRing(self.nodes[::-1])
+
+        self.assertEqual(
+            [ring.nodes[shard] for shard in ring.slots],
+            [reversed_ring.nodes[shard] for shard in reversed_ring.slots]
+        )
+
+
+class ChannelLayerSettingsTests(SimpleTestCase):
+    """CHANNEL_LAYER_MODE and CHANNEL_LAYER_LOCAL_DELIVERY pick the channel layer"""
+
+    def _load_settings(self, **env):
+        with mock.patch.dict(os.environ, env):
+            return runpy.run_path(settings_module.__file__)
+
+    def test_list_layer_behind_local_delivery_by_default(self):
+        with mock.patch.dict(os.environ):
+            for name in ('CHANNEL_LAYER_MODE', 'CHANNEL_LAYER_LOCAL_DELIVERY'):
+                os.environ.pop(name, None)
+            layer = self._load_settings()['CHANNEL_LAYERS']['default']
+
+        self.assertEqual(layer['BACKEND'], 'apps.rooms.layers.LocalFirstChannelLayer')
+        self.assertEqual(layer['CONFIG']['backend'], 'apps.rooms.layers.ShardedRedisChannelLayer')
+
+    def test_pubsub_layer_without_local_delivery(self):
+        layer = self._load_settings(
+            CHANNEL_LAYER_MODE='pubsub', CHANNEL_LAYER_LOCAL_DELIVERY='False'
+        )['CHANNEL_LAYERS']['default']
+
+        self.assertEqual(layer['BACKEND'], 'apps.rooms.layers.ShardedRedisPubSubChannelLayer')
+        self.assertNotIn('backend', layer['CONFIG'])
+        self.assertTrue(issubclass(import_string(layer['BACKEND']), RedisPubSubChannelLayer))
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, 'Unknown CHANNEL_LAYER_MODE: kafka'):
+            self._load_settings(CHANNEL_LAYER_MODE='kafka')
+
+
+class LocalFirstChannelLayerTests(SimpleTestCase):
+    """Messages between consumers of one process skip the backend and stay in order"""
+
+    def _run(self, test, local_capacity=100):
+        async def run():
+            layer = LocalFirstChannelLayer(
+                backend='channels.layers.InMemoryChannelLayer', local_capacity=local_capacity
+            )
+            sent = []
+            backend_send = layer.backend.send
+
+            async def counted_send(channel, message):
+                sent.append(message['type'])
+                await backend_send(channel, message)
+
+            layer.backend.send = counted_send
+            await test(layer, await layer.new_channel(), sent)
+
+        asyncio.run(run())
+
+    def test_local_send_skips_the_backend(self):
+        async def test(layer, channel, sent):
+            await layer.send(channel, {'type': 'webrtc_offer'})
+
+            self.assertEqual((await layer.receive(channel))['type'], 'webrtc_offer')
+            self.assertEqual(sent, [])
+
+        self._run(test)
+
+    def test_group_and_direct_messages_keep_sender_order(self):
+        async def test(layer, channel, sent):
+            await layer.group_add('room_a', channel)
+            await layer.group_send('room_a', {'type': 'media_state_update'})
+            await layer.send(channel, {'type': 'ice_candidate'})
+
+            self.assertEqual((await layer.receive(channel))['type'], 'media_state_update')
+            self.assertEqual((await layer.receive(channel))['type'], 'ice_candidate')
+            # The group copy coming back through the backend is dropped
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(layer.receive(channel), 0.1)
+
+        self._run(test)
+
+    def test_messages_from_other_processes_are_delivered(self):
+        async def test(layer, channel, sent):
+            await layer.backend.send(channel, {'type': 'user_left'})
+
+            self.assertEqual(await layer.receive(channel), {'type': 'user_left'})
+
+        self._run(test)
+
+    def test_full_local_inbox_rejects_new_messages(self):
+        async def test(layer, channel, sent):
+            await layer.group_add('room_a', channel)
+            await layer.send(channel, {'type': 'webrtc_offer'})
+
+            with self.assertRaises(ChannelFull):
+                await layer.send(channel, {'type': 'webrtc_answer'})
+            # Group members over capacity are skipped, as with Redis
+            await layer.group_send('room_a', {'type': 'user_left'})
+
+            self.assertEqual((await layer.receive(channel))['type'], 'webrtc_offer')
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(layer.receive(channel), 0.1)
+
+        self._run(test, local_capacity=1)
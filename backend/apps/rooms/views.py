@@ -1,4 +1,5 @@
 # rooms/views.py - Room management API views
+from django.conf import settings
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, permission_classes
@@ -40,7 +41,21 @@ def create_room(request):
         client_ip = get_client_ip(request)
         logger.info(f"Creating room for IP: {client_ip}")
 
-        room_data = RoomManager.create_room(creator_ip=client_ip)
+        # Rooms hold two participants unless the creator asks for a mesh call
+        max_participants = request.data.get('max_participants')
+        if max_participants is not None:
+            max_size = getattr(settings, 'MAX_ROOM_SIZE', 8)
+            try:
+                max_participants = int(max_participants)
+            except (TypeError, ValueError):
+                max_participants = 0
+            if not 2 <= max_participants <= max_size:
+                return Response(
+                    {'error': f'max_participants must be between 2 and {max_size}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        room_data = RoomManager.create_room(creator_ip=client_ip, max_participants=max_participants)
 
         # Generate QR code for the room
         room_url = f"{request.build_absolute_uri('/')}join/{room_data['short_code']}"
@@ -82,7 +97,11 @@ def get_room(request, room_id):
     """Get room information by room ID"""
     try:
         logger.info(f"Getting room info for: {room_id}")
-        room_data = RoomManager.get_room_by_id(room_id)
+        room_data = RoomManager.get_room_by_id(
+            room_id,
+            fields=('room_id', 'short_code', 'is_active', 'expires_at',
+                    'max_participants', 'live_participant_count')
+        )
 
         if not room_data:
             logger.warning(f"Room not found: {room_id}")
@@ -107,12 +126,12 @@ def get_room(request, room_id):
             'room_id': room_data['room_id'],
             'short_code': room_data['short_code'],
             'is_active': room_data['is_active'],
-            'participant_count': len(room_data.get('participants', [])),
+            'participant_count': room_data['live_participant_count'],
             'max_participants': room_data.get('max_participants', 2),
             'expires_at': room_data['expires_at']
         }
 
-        logger.info(f"Room info retrieved: {room_id}, participants: {len(room_data.get('participants', []))}")
+        logger.info(f"Room info retrieved: {room_id}, participants: {room_data['live_participant_count']}")
         return Response(response_data)
 
     except Exception as e:
@@ -137,7 +156,7 @@ def join_room(request):
         if not request.session.session_key:
             request.session.create()
 
-        participant_id = request.session.session_key
+        participant_id = RoomManager.participant_id_for(request.session.session_key)
 
         if not room_identifier:
             return Response(
@@ -195,11 +214,11 @@ def leave_room(request, room_id):
                 {'success': True,  # Return success even if no session, as user wasn't in room anyway
                  'message': 'No active session found'})
 
-        participant_id = request.session.session_key
+        participant_id = RoomManager.participant_id_for(request.session.session_key)
         logger.info(f"Leaving room: {room_id} with participant: {participant_id}")
 
         # Check if room exists first
-        room_data = RoomManager.get_room_by_id(room_id)
+        room_data = RoomManager.get_room_by_id(room_id, fields=('participants',))
         if not room_data:
             logger.info(f"Room {room_id} not found when trying to leave")
             return Response({
@@ -249,7 +268,7 @@ def delete_room(request, room_id):
         logger.info(f"Deleting room: {room_id}")
 
         # Check if room exists
-        room_data = RoomManager.get_room_by_id(room_id)
+        room_data = RoomManager.get_room_by_id(room_id, fields=('room_id',))
         if not room_data:
             return Response(
                 {'error': 'Room not found'},
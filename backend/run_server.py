@@ -2,10 +2,26 @@
 """
 Server startup script with WebSocket support
 Use this instead of 'python manage.py runserver' for development
+
+Runs SERVER_WORKERS ASGI worker processes under a supervisor. The listening
+socket is bound here and inherited by every worker, so they share the port
+(with --port-per-worker each worker gets its own port instead, for room
+affinity behind nginx). Workers run Daphne or Uvicorn on uvloop, to compare
+the two. The supervisor restarts workers that crash, replaces workers past
+their request or memory limit, and drains workers on SIGTERM: they stop
+accepting connections, close WebSockets (1012, or 4012 under Daphne) so
+clients resume on a peer, and get SERVER_GRACEFUL_TIMEOUT seconds to finish requests in flight.
+SIGHUP replaces all workers, one new process for each old one.
 """
 
+import argparse
+import multiprocessing
 import os
+import random
+import signal
+import socket
 import sys
+import time
 import django
 from pathlib import Path
 
@@ -19,23 +35,322 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'videocall_app.settings')
 # Setup Django
 django.setup()
 
-def check_daphne_installed():
-    """Check if Daphne is installed"""
+from django.conf import settings  # noqa: E402
+
+SERVERS = ('daphne', 'uvicorn')
+
+# A worker exiting sooner than this after its start is crash looping: its
+# restarts are delayed, doubling up to MAX_RESTART_DELAY seconds
+MIN_UPTIME = 5
+MAX_RESTART_DELAY = 30
+
+# Time a draining worker gets past SERVER_GRACEFUL_TIMEOUT before SIGKILL
+KILL_GRACE = 5
+
+# WebSocket close code of a draining Daphne worker, after 1012 (Service
+# Restart) that Uvicorn sends but Daphne's WebSocket library refuses.
+# Clients resume their session on another worker.
+SERVICE_RESTART = 4012
+
+
+def check_server_installed(server):
+    """Check if the server (and uvloop for Uvicorn) is installed"""
     try:
-        import daphne
+        if server == 'uvicorn':
+            import uvicorn  # noqa: F401
+            import uvloop  # noqa: F401
+        else:
+            import daphne  # noqa: F401
         return True
     except ImportError:
         return False
 
-def run_with_daphne():
-    """Run server with Daphne (supports WebSocket)"""
-    print("🚀 Starting server with Daphne (WebSocket support enabled)")
-    print("   Backend: http://localhost:8000")
-    print("   WebSocket: ws://localhost:8000/ws/")
+
+def bind_socket(host, port):
+    """Listening socket for workers to inherit"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(socket.SOMAXCONN)
+    sock.set_inheritable(True)
+    return sock
+
+
+def rss_megabytes(pid):
+    """Resident memory of a process in MB, None where /proc is unavailable"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+
+
+# Worker process side
+
+class RequestCounter:
+    """ASGI middleware counting the HTTP requests and WebSockets of a worker"""
+
+    def __init__(self, application, counter):
+        self.application = application
+        self.counter = counter
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] in ('http', 'websocket'):
+            self.counter.value += 1
+        return await self.application(scope, receive, send)
+
+
+def serve(options, sock, counter):
+    """Body of a worker process: run the server on the inherited socket"""
+    # The supervisor's handlers came along with the fork
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    # Workers of one host must differ in the room-worker registry
+    if settings.WORKER_ID:
+        settings.WORKER_ID = f'{settings.WORKER_ID}-{os.getpid()}'
+    if '{port}' in settings.WORKER_URL:
+        settings.WORKER_URL = settings.WORKER_URL.format(port=sock.getsockname()[1])
+
+    from videocall_app.asgi import application
+
+    from apps.rooms.activity import stop_activity_writer
+
+    application = RequestCounter(application, counter)
+    if options.server == 'uvicorn':
+        run_uvicorn(application, sock, options)
+    else:
+        run_daphne(application, sock, options)
+    # Forked processes skip atexit handlers
+    stop_activity_writer()
+
+
+def run_uvicorn(application, sock, options):
+    """Uvicorn on uvloop; it drains by itself on SIGTERM and SIGINT"""
+    import uvicorn
+
+    config = uvicorn.Config(
+        application,
+        loop='uvloop',
+        ws='websockets',
+        lifespan='off',
+        access_log=options.access_log,
+        timeout_graceful_shutdown=options.graceful_timeout,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def run_daphne(application, sock, options):
+    """Daphne, with a drain on SIGTERM and SIGINT in place of its hard stop"""
+    # Importing the server installs the asyncio reactor, which has to
+    # happen in the worker
+    from daphne.access import AccessLogGenerator
+    from daphne.server import Server
+    from daphne.ws_protocol import WebSocketProtocol
+    from twisted.internet import reactor
+
+    class DrainingServer(Server):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.ports = []
+            self.draining = False
+
+        def listen_success(self, port):
+            self.ports.append(port)
+            super().listen_success(port)
+
+        def drain(self):
+            if self.draining:
+                return
+            self.draining = True
+            for port in self.ports:
+                # Closes this worker's copy of the socket only
+                port.stopListening()
+            for protocol in list(self.connections):
+                if isinstance(protocol, WebSocketProtocol) and protocol.state == protocol.STATE_OPEN:
+                    protocol.serverClose(code=SERVICE_RESTART)
+            self.wait_drained(time.monotonic() + options.graceful_timeout)
+
+        def wait_drained(self, deadline):
+            if time.monotonic() < deadline and any(
+                'disconnected' not in details for details in self.connections.values()
+            ):
+                reactor.callLater(0.5, self.wait_drained, deadline)
+                return
+            self.stop()
+
+    server = DrainingServer(
+        application=application,
+        # Twisted adopts a copy of the descriptor and closes the one given
+        endpoints=[f'fd:fileno={os.dup(sock.fileno())}'],
+        signal_handlers=False,
+        action_logger=AccessLogGenerator(sys.stdout) if options.access_log else None,
+    )
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: reactor.callFromThread(server.drain))
+    server.run()
+
+
+# Supervisor side
+
+class Worker:
+    """A worker process, its request counter and its request limit"""
+
+    def __init__(self, slot, process, counter, max_requests):
+        self.slot = slot
+        self.process = process
+        self.counter = counter
+        self.max_requests = max_requests
+        self.started = time.monotonic()
+        self.drain_deadline = None
+
+
+class Supervisor:
+    """Keeps `options.workers` workers running on their sockets"""
+
+    def __init__(self, options, sockets):
+        self.options = options
+        # Socket of each worker slot; all the same one unless --port-per-worker
+        self.sockets = sockets
+        self.context = multiprocessing.get_context('fork')
+        self.workers = {}
+        self.draining = []
+        self.quick_exits = [0] * options.workers
+        self.restart_at = [0] * options.workers
+        self.stopping = False
+        self.reloading = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+
+        for slot in range(self.options.workers):
+            self.spawn(slot)
+        while not self.stopping:
+            self.check_workers()
+            time.sleep(1)
+        self.shutdown()
+
+    def handle_stop(self, signum, frame):
+        if self.stopping:
+            # Second signal: no more waiting for the drain
+            for worker in self.draining:
+                worker.drain_deadline = 0
+        self.stopping = True
+
+    def handle_reload(self, signum, frame):
+        self.reloading = True
+
+    def spawn(self, slot):
+        counter = self.context.Value('Q', 0, lock=False)
+        process = self.context.Process(
+            target=serve,
+            args=(self.options, self.sockets[slot], counter),
+            name=f'{self.options.server}-worker-{slot}',
+        )
+        process.start()
+        max_requests = self.options.max_requests
+        if max_requests:
+            # Spread rotations so workers started together don't all drain at once
+            max_requests += random.randint(0, max_requests // 10)
+        self.workers[slot] = Worker(slot, process, counter, max_requests)
+        print(f"   Worker {slot} started (pid {process.pid})")
+
+    def drain(self, worker, reason):
+        print(f"   Worker {worker.slot} (pid {worker.process.pid}) draining: {reason}")
+        worker.process.terminate()
+        worker.drain_deadline = time.monotonic() + self.options.graceful_timeout + KILL_GRACE
+        self.draining.append(worker)
+
+    def rotation_reason(self, worker):
+        """Why a live worker should be replaced, or None"""
+        if self.reloading:
+            return 'reload'
+        if worker.max_requests and worker.counter.value >= worker.max_requests:
+            return f'served {worker.counter.value} requests'
+        if self.options.max_memory:
+            rss = rss_megabytes(worker.process.pid)
+            if rss is not None and rss > self.options.max_memory:
+                return f'uses {rss} MB'
+        return None
+
+    def reap_draining(self):
+        now = time.monotonic()
+        for worker in list(self.draining):
+            if not worker.process.is_alive():
+                worker.process.join()
+                self.draining.remove(worker)
+            elif now > worker.drain_deadline:
+                print(f"   Worker {worker.slot} (pid {worker.process.pid}) did not drain in time, killing")
+                worker.process.kill()
+
+    def check_workers(self):
+        self.reap_draining()
+        now = time.monotonic()
+
+        for slot in range(self.options.workers):
+            worker = self.workers.get(slot)
+            if worker is None:
+                if now >= self.restart_at[slot]:
+                    self.spawn(slot)
+                continue
+
+            if not worker.process.is_alive():
+                worker.process.join()
+                del self.workers[slot]
+                if now - worker.started < MIN_UPTIME:
+                    self.quick_exits[slot] += 1
+                else:
+                    self.quick_exits[slot] = 0
+                delay = min(2 ** self.quick_exits[slot] - 1, MAX_RESTART_DELAY)
+                print(f"❌ Worker {slot} (pid {worker.process.pid}) exited with code "
+                      f"{worker.process.exitcode}, restarting in {delay}s")
+                self.restart_at[slot] = now + delay
+                continue
+
+            reason = self.rotation_reason(worker)
+            if reason:
+                # The replacement accepts on the same socket before the old
+                # worker stops, so the slot never goes without a server
+                self.spawn(slot)
+                self.drain(worker, reason)
+
+        self.reloading = False
+
+    def shutdown(self):
+        print("🛑 Stopping workers...")
+        for worker in self.workers.values():
+            self.drain(worker, 'shutdown')
+        self.workers = {}
+        while self.draining:
+            self.reap_draining()
+            time.sleep(0.5)
+        for sock in set(self.sockets):
+            sock.close()
+
+
+def run_workers(options):
+    """Run supervised worker processes (supports WebSocket)"""
+    if options.port_per_worker:
+        sockets = [bind_socket(options.host, options.port + slot) for slot in range(options.workers)]
+        ports = f"{options.port}-{options.port + options.workers - 1}"
+    else:
+        sockets = [bind_socket(options.host, options.port)] * options.workers
+        ports = str(options.port)
+
+    print(f"🚀 Starting {options.workers} {options.server} worker(s) (WebSocket support enabled)")
+    print(f"   Backend: http://localhost:{ports}")
+    print(f"   WebSocket: ws://localhost:{ports}/ws/")
+    if options.max_requests or options.max_memory:
+        print(f"   Rotation: {options.max_requests or 'no'} requests, {options.max_memory or 'no'} MB limit")
     print("   Press Ctrl+C to stop")
     print()
 
-    os.system('daphne -b 0.0.0.0 -p 8000 videocall_app.asgi:application')
+    Supervisor(options, sockets).run()
+
 
 def run_with_runserver():
     """Run server with standard runserver (no WebSocket support)"""
@@ -48,13 +363,67 @@ def run_with_runserver():
 
     os.system('python manage.py runserver')
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the ASGI server workers')
+    parser.add_argument('--host', default='0.0.0.0', help='Address to bind (default: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=8000, help='Port to bind (default: 8000)')
+    parser.add_argument(
+        '--server',
+        choices=SERVERS,
+        default=settings.SERVER_BACKEND,
+        help='daphne, or uvicorn on uvloop (default: SERVER_BACKEND)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=settings.SERVER_WORKERS,
+        help='Number of worker processes (default: SERVER_WORKERS)'
+    )
+    parser.add_argument(
+        '--max-requests',
+        type=int,
+        default=settings.SERVER_MAX_REQUESTS,
+        help='Replace a worker after about this many requests, 0 for never (default: SERVER_MAX_REQUESTS)'
+    )
+    parser.add_argument(
+        '--max-memory',
+        type=int,
+        default=settings.SERVER_MAX_MEMORY_MB,
+        help='Replace a worker above this resident memory in MB, 0 for never (default: SERVER_MAX_MEMORY_MB)'
+    )
+    parser.add_argument(
+        '--graceful-timeout',
+        type=int,
+        default=settings.SERVER_GRACEFUL_TIMEOUT,
+        help='Seconds a stopping worker gets to finish requests (default: SERVER_GRACEFUL_TIMEOUT)'
+    )
+    parser.add_argument(
+        '--port-per-worker',
+        action='store_true',
+        help='Give worker N its own port, PORT + N, instead of sharing PORT'
+    )
+    parser.add_argument('--access-log', action='store_true', help='Log requests to stdout')
+
+    options = parser.parse_args()
+    if options.workers < 1:
+        parser.error('--workers must be at least 1')
+    return options
+
+
 def main():
     """Main function"""
+    options = parse_args()
+
     print("🔌 Video Call Application Server")
     print("=" * 40)
 
-    if check_daphne_installed():
-        run_with_daphne()
+    if check_server_installed(options.server):
+        run_workers(options)
+    elif options.server == 'uvicorn':
+        print("❌ Uvicorn or uvloop not found")
+        print("   Install them from requirements: pip install -r requirements.txt")
+        sys.exit(1)
     else:
         print("❌ Daphne not found - WebSocket support disabled")
         print("   Install it with: pip install daphne")
@@ -10,6 +10,10 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'videocall_app.settings')
 
 django_asgi_app = get_asgi_application()
 
+from apps.rooms.sweeper import start_sweeper  # noqa: E402
+
+start_sweeper()
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
@@ -1,6 +1,7 @@
 # videocall_app/settings.py - Django main settings configuration
 import os
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -92,15 +93,85 @@ DATABASES = {
 # Redis configuration
 REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
 
+# Redis nodes sharing room storage and the channel layer. Rooms are placed by
+# consistent hashing on their ID (see apps.rooms.sharding); adding a node
+# moves about 1/N of the rooms, relocated by `manage.py rebalance_rooms`.
+# Keep REDIS_URL in the list: it also serves the cache and sessions.
+REDIS_SHARD_URLS = [
+    url.strip() for url in config('REDIS_SHARD_URLS', default=REDIS_URL).split(',') if url.strip()
+]
+
 # Channels configuration for WebSockets
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        'CONFIG': {
-            'hosts': [REDIS_URL],
-        },
-    },
+# CHANNEL_LAYER_MODE picks the channel layer backend:
+#   'list'   - messages wait in per-channel Redis lists read with BLPOP, for up
+#              to a minute if the reader is slow
+#   'pubsub' - messages are published over Redis Pub/Sub: lower latency and
+#              nothing stored in Redis, but a message for a channel nobody
+#              listens on is dropped (targeted signaling is still recovered
+#              from the replay buffer on resume)
+# Compare them with `manage.py bench_channel_layer`
+CHANNEL_LAYER_BACKENDS = {
+    'list': 'apps.rooms.layers.ShardedRedisChannelLayer',
+    'pubsub': 'apps.rooms.layers.ShardedRedisPubSubChannelLayer',
 }
+CHANNEL_LAYER_MODE = config('CHANNEL_LAYER_MODE', default='list')
+if CHANNEL_LAYER_MODE not in CHANNEL_LAYER_BACKENDS:
+    raise ImproperlyConfigured(f"Unknown CHANNEL_LAYER_MODE: {CHANNEL_LAYER_MODE}")
+
+# CHANNEL_LAYER_LOCAL_DELIVERY hands messages between consumers of the same
+# worker over in memory and only sends the rest through the backend above
+CHANNEL_LAYER_LOCAL_DELIVERY = config('CHANNEL_LAYER_LOCAL_DELIVERY', default=True, cast=bool)
+
+if CHANNEL_LAYER_LOCAL_DELIVERY:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'apps.rooms.layers.LocalFirstChannelLayer',
+            'CONFIG': {
+                'backend': CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER_MODE],
+                'hosts': REDIS_SHARD_URLS,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER_MODE],
+            'CONFIG': {
+                'hosts': REDIS_SHARD_URLS,
+            },
+        },
+    }
+
+# Room-to-worker affinity with several workers (see apps.rooms.affinity):
+#   'off'      - a room's sockets may land on any worker
+#   'proxy'    - the proxy hashes WebSocket connections on the room ID (see
+#                nginx.conf); workers record which of them owns each room
+#   'redirect' - the first worker getting a socket of a room owns it, other
+#                workers tell clients to reconnect to the owner's WORKER_URL
+# Peers on one worker signal in memory (CHANNEL_LAYER_LOCAL_DELIVERY).
+ROOM_AFFINITY = config('ROOM_AFFINITY', default='off')
+if ROOM_AFFINITY not in ('off', 'proxy', 'redirect'):
+    raise ImproperlyConfigured(f"Unknown ROOM_AFFINITY: {ROOM_AFFINITY}")
+# ID of this worker in the registry (host name and process ID by default),
+# and the base URL clients reconnect to when redirected to it, such as
+# wss://example.com/w1 for a worker proxied at /w1/ws/. Under run_server.py
+# each worker process adds its PID to WORKER_ID and fills in {port} in
+# WORKER_URL.
+WORKER_ID = config('WORKER_ID', default='')
+WORKER_URL = config('WORKER_URL', default='')
+
+# run_server.py: number of worker processes and their server, 'daphne' or
+# 'uvicorn' (on uvloop). Workers are replaced after about
+# SERVER_MAX_REQUESTS requests or above SERVER_MAX_MEMORY_MB of resident
+# memory (0 disables either), and get SERVER_GRACEFUL_TIMEOUT seconds to
+# finish requests in flight when they stop.
+SERVER_WORKERS = config('SERVER_WORKERS', default=1, cast=int)
+SERVER_BACKEND = config('SERVER_BACKEND', default='daphne')
+if SERVER_BACKEND not in ('daphne', 'uvicorn'):
+    raise ImproperlyConfigured(f"Unknown SERVER_BACKEND: {SERVER_BACKEND}")
+SERVER_MAX_REQUESTS = config('SERVER_MAX_REQUESTS', default=0, cast=int)
+SERVER_MAX_MEMORY_MB = config('SERVER_MAX_MEMORY_MB', default=0, cast=int)
+SERVER_GRACEFUL_TIMEOUT = config('SERVER_GRACEFUL_TIMEOUT', default=30, cast=int)
 
 # Cache configuration
 CACHES = {
@@ -275,8 +346,111 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Application-specific settings
 ROOM_EXPIRY_HOURS = 24
 MAX_PARTICIPANTS_PER_ROOM = 2
+# Largest room a creator may ask for; rooms above two participants are full
+# meshes in which every pair negotiates its own peer connection
+MAX_ROOM_SIZE = config('MAX_ROOM_SIZE', default=8, cast=int)
+# When a participant joins, each peer already in the room is told in turn,
+# NEGOTIATION_PACE_MS apart, and sends the newcomer one targeted offer
+NEGOTIATION_PACE_MS = config('NEGOTIATION_PACE_MS', default=100, cast=int)
 SHORT_CODE_LENGTH = 6
 
+# Expired room sweeper: run every N seconds inside each ASGI worker. It also
+# reaps participants whose connection dropped without resuming; with 0 it is
+# disabled and the cleanup_expired_rooms management command must run instead
+ROOM_SWEEPER_INTERVAL = config('ROOM_SWEEPER_INTERVAL', default=60, cast=int)
+ROOM_SWEEPER_BATCH_SIZE = 500
+ROOM_SWEEPER_MAX_BATCHES = 10
+
+# Room activity log: rows are queued in memory (at most
+# ACTIVITY_LOG_BUFFER_SIZE rows, 0 writes each row on the spot) and written
+# by a background thread in batches of ACTIVITY_LOG_BATCH_SIZE, or
+# ACTIVITY_LOG_FLUSH_INTERVAL seconds after the first of a batch. On a full
+# buffer rows are dropped if ACTIVITY_LOG_DROP_ON_OVERLOAD, otherwise written
+# by the request that logged them. Workers write what is queued on shutdown.
+ACTIVITY_LOG_BUFFER_SIZE = config('ACTIVITY_LOG_BUFFER_SIZE', default=10000, cast=int)
+ACTIVITY_LOG_BATCH_SIZE = 500
+ACTIVITY_LOG_FLUSH_INTERVAL = config('ACTIVITY_LOG_FLUSH_INTERVAL', default=1.0, cast=float)
+ACTIVITY_LOG_DROP_ON_OVERLOAD = config('ACTIVITY_LOG_DROP_ON_OVERLOAD', default=False, cast=bool)
+# Activity counters of the metrics endpoint are kept per minute, per hour and
+# in total as rows are written. Minute rollups are pruned by the
+# compact_activity_rollups command after this many hours (at least 25, as
+# the last-day counters read them)
+ACTIVITY_ROLLUP_MINUTE_RETENTION_HOURS = 48
+# On PostgreSQL the activity log is partitioned by time, one partition per
+# 'day' or 'month'. The manage_activity_partitions command creates them
+# ACTIVITY_LOG_PARTITIONS_AHEAD periods ahead and drops those older than
+# ACTIVITY_LOG_RETENTION_DAYS, summarised into daily rollups first if
+# ACTIVITY_LOG_SUMMARISE_ON_DROP
+ACTIVITY_LOG_PARTITION = config('ACTIVITY_LOG_PARTITION', default='day')
+if ACTIVITY_LOG_PARTITION not in ('day', 'month'):
+    raise ImproperlyConfigured(f"Unknown ACTIVITY_LOG_PARTITION: {ACTIVITY_LOG_PARTITION}")
+ACTIVITY_LOG_PARTITIONS_AHEAD = config('ACTIVITY_LOG_PARTITIONS_AHEAD', default=7, cast=int)
+ACTIVITY_LOG_RETENTION_DAYS = config('ACTIVITY_LOG_RETENTION_DAYS', default=30, cast=int)
+ACTIVITY_LOG_SUMMARISE_ON_DROP = config('ACTIVITY_LOG_SUMMARISE_ON_DROP', default=True, cast=bool)
+# Activity log exports (the /api/activity/export/ endpoint and the
+# export_activity_log command) stream rows read ACTIVITY_LOG_EXPORT_CHUNK_SIZE
+# at a time, and stop ACTIVITY_LOG_EXPORT_LAG seconds before now so that rows
+# still buffered by workers land in the next export instead of being skipped
+ACTIVITY_LOG_EXPORT_CHUNK_SIZE = 2000
+ACTIVITY_LOG_EXPORT_LAG = 60
+# Activity log admin changelist: rows are counted exactly up to
+# ACTIVITY_ADMIN_EXACT_COUNT_LIMIT, estimated past it; the years, months and
+# days of its date hierarchy are cached for ACTIVITY_ADMIN_DATES_CACHE_SECONDS
+ACTIVITY_ADMIN_EXACT_COUNT_LIMIT = 10000
+ACTIVITY_ADMIN_DATES_CACHE_SECONDS = 300
+
+# Presence: connected participants are refreshed on every server heartbeat
+# (HEARTBEAT_INTERVAL seconds); after PRESENCE_TTL seconds without a refresh
+# they no longer count towards capacity and the sweeper removes them
+HEARTBEAT_INTERVAL = config('HEARTBEAT_INTERVAL', default=15, cast=int)
+PRESENCE_TTL = config('PRESENCE_TTL', default=45, cast=int)
+
+# Signaling resume: targeted signaling messages are kept in a per-participant
+# replay buffer (last REPLAY_BUFFER_SIZE messages, REPLAY_TTL seconds after the
+# last one) for clients resuming a dropped connection (0 disables the buffer)
+REPLAY_BUFFER_SIZE = config('REPLAY_BUFFER_SIZE', default=64, cast=int)
+REPLAY_TTL = config('REPLAY_TTL', default=120, cast=int)
+
+# Outbound backpressure: frames waiting to be written to a client are queued
+# per connection (at most OUTBOUND_QUEUE_MAX_FRAMES / OUTBOUND_QUEUE_MAX_BYTES,
+# superseded media state coalesced); a client lagging more than
+# OUTBOUND_MAX_LAG_MS behind or overflowing its queue is disconnected
+OUTBOUND_QUEUE_MAX_FRAMES = 256
+OUTBOUND_QUEUE_MAX_BYTES = config('OUTBOUND_QUEUE_MAX_BYTES', default=1048576, cast=int)
+OUTBOUND_MAX_LAG_MS = config('OUTBOUND_MAX_LAG_MS', default=5000, cast=int)
+
+# Inbound rate limits: each WebSocket connection gets a token bucket per rate
+# class (the message type unless its route in apps.rooms.consumers names
+# another), {class: (messages per second, burst)}; classes not listed share '*'.
+# ice_candidates batches are charged per candidate against ice_candidate.
+# Rejected messages get an error frame; after SIGNALING_RATE_LIMIT_MAX_VIOLATIONS
+# rejections in quick succession the connection is closed with 4029
+SIGNALING_RATE_LIMITS = {
+    'offer': (1, 10),
+    'answer': (1, 10),
+    'ice_candidate': (20, 100),
+    'media_state': (5, 20),
+    'ping': (1, 5),
+    '*': (5, 20),
+}
+SIGNALING_RATE_LIMIT_MAX_VIOLATIONS = 20
+
+# Optional room-wide budget for messages relayed over the channel layer, shared
+# by all workers through Redis (messages per second, 0 disables). Connections
+# lease SIGNALING_ROOM_RATE_LEASE tokens at a time from it
+SIGNALING_ROOM_RATE_LIMIT = config('SIGNALING_ROOM_RATE_LIMIT', default=0, cast=int)
+SIGNALING_ROOM_RATE_BURST = config('SIGNALING_ROOM_RATE_BURST', default=200, cast=int)
+SIGNALING_ROOM_RATE_LEASE = 5
+
+# Trickle ICE batching: candidates for the same target are collected for up to
+# ICE_BATCH_WINDOW_MS and sent as one `ice_candidates` message (0 disables)
+ICE_BATCH_WINDOW_MS = config('ICE_BATCH_WINDOW_MS', default=0, cast=int)
+ICE_BATCH_MAX_CANDIDATES = 16
+
+# JSON encoder for signaling frames: 'json' (stdlib) or 'orjson' (faster,
+# needs `pip install orjson`)
+SIGNALING_JSON_BACKEND = config('SIGNALING_JSON_BACKEND', default='json')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -8,8 +8,8 @@ export const useWebRTCStore = defineStore('webrtc', () => {
 
   // State
   const localStream = ref(null)
-  const remoteStream = ref(null)
-  const peerConnection = ref(null)
+  const remoteStream = ref(null) // Stream shown in the main view
+  const peerConnections = ref(new Map()) // Participant ID -> RTCPeerConnection
   const websocket = ref(null)
   const isConnected = ref(false)
   const isVideoEnabled = ref(true)
@@ -17,6 +17,17 @@ export const useWebRTCStore = defineStore('webrtc', () => {
   const connectionState = ref('new') // new, connecting, connected, disconnected, failed
   const remoteParticipants = ref([])
   const localParticipantId = ref(null)
+  const resumeToken = ref(null) // Lets a dropped socket resume the same session
+  const lastSeq = ref(null) // Sequence ID of the last buffered message received
+  const redirectUrl = ref(null) // Worker owning the room, when the server sends us there
+  let reconnectAttempts = 0
+  let reconnectTimer = null
+
+  // Close codes after which resuming makes no sense
+  const FINAL_CLOSE_CODES = [1000, 4003, 4004, 4008]
+  // Close code of a socket told to reconnect to the worker owning the room
+  const REDIRECT_CLOSE_CODE = 4010
+  const MAX_RECONNECT_ATTEMPTS = 6
 
   // Media constraints
   const mediaConstraints = ref({
@@ -33,6 +44,8 @@ export const useWebRTCStore = defineStore('webrtc', () => {
   })
 
   // Computed
+  // Connection to the first peer, the one whose stats are monitored
+  const peerConnection = computed(() => peerConnections.value.values().next().value || null)
   const hasLocalVideo = computed(() => localStream.value !== null)
   const hasRemoteVideo = computed(() => remoteStream.value !== null)
   const isCallActive = computed(
@@ -87,63 +100,143 @@ export const useWebRTCStore = defineStore('webrtc', () => {
     }
   }
 
-  const createPeerConnection = () => {
+  const updateConnectionState = (state) => {
+    // The call is up as long as any peer connection is
+    const states = [...peerConnections.value.values()].map((pc) => pc.connectionState)
+    connectionState.value = states.includes('connected') ? 'connected' : state
+    console.log('Connection state:', connectionState.value)
+
+    if (connectionState.value === 'connected') {
+      if (!isConnected.value) {
+        globalStore.addNotification('Video call connected', 'success', 3000)
+      }
+      isConnected.value = true
+    } else if (connectionState.value === 'disconnected' || connectionState.value === 'failed') {
+      isConnected.value = false
+      if (connectionState.value === 'failed') {
+        globalStore.addNotification('Call connection failed', 'error', 5000)
+      }
+    }
+  }
+
+  const createPeerConnection = (participantId) => {
     try {
-      peerConnection.value = new RTCPeerConnection(rtcConfiguration)
+      const pc = new RTCPeerConnection(rtcConfiguration)
+      peerConnections.value.set(participantId, pc)
 
       // Add local stream tracks to peer connection
       if (localStream.value) {
         localStream.value.getTracks().forEach((track) => {
-          peerConnection.value.addTrack(track, localStream.value)
+          pc.addTrack(track, localStream.value)
         })
       }
 
       // Handle remote stream
-      peerConnection.value.ontrack = (event) => {
-        console.log('Received remote track:', event)
-        remoteStream.value = event.streams[0]
+      pc.ontrack = (event) => {
+        console.log('Received remote track from', participantId, event)
+        // Peers that were in the room before us are only known by their offer
+        addRemoteParticipant(participantId, new Date().toISOString()).stream = event.streams[0]
+        if (!remoteStream.value) {
+          remoteStream.value = event.streams[0]
+        }
       }
 
       // Handle ICE candidates
-      peerConnection.value.onicecandidate = (event) => {
+      pc.onicecandidate = (event) => {
         if (event.candidate && websocket.value) {
           sendWebSocketMessage({
             type: 'ice_candidate',
             candidate: event.candidate,
+            target: participantId,
           })
         }
       }
 
       // Handle connection state changes
-      peerConnection.value.onconnectionstatechange = () => {
-        connectionState.value = peerConnection.value.connectionState
-        console.log('Connection state:', connectionState.value)
-
-        if (connectionState.value === 'connected') {
-          isConnected.value = true
-          globalStore.addNotification('Video call connected', 'success', 3000)
-        } else if (connectionState.value === 'disconnected' || connectionState.value === 'failed') {
-          isConnected.value = false
-          if (connectionState.value === 'failed') {
-            globalStore.addNotification('Call connection failed', 'error', 5000)
-          }
-        }
+      pc.onconnectionstatechange = () => {
+        updateConnectionState(pc.connectionState)
       }
 
-      return { success: true }
+      return { success: true, peerConnection: pc }
     } catch (error) {
       console.error('Failed to create peer connection:', error)
       return { success: false, error: error.message }
     }
   }
 
-  const connectWebSocket = (roomId) => {
+  const getPeerConnection = (participantId) => {
+    const pc = peerConnections.value.get(participantId)
+    if (pc) {
+      return pc
+    }
+    const result = createPeerConnection(participantId)
+    if (!result.success) {
+      throw new Error(result.error)
+    }
+    return result.peerConnection
+  }
+
+  const closePeerConnection = (participantId) => {
+    const pc = peerConnections.value.get(participantId)
+    if (!pc) {
+      return
+    }
+    pc.close()
+    peerConnections.value.delete(participantId)
+
+    // Show another peer if the one in the main view is gone
+    if (!remoteParticipants.value.some((p) => p.stream === remoteStream.value)) {
+      remoteStream.value = remoteParticipants.value.find((p) => p.stream)?.stream || null
+    }
+  }
+
+  const addRemoteParticipant = (participantId, joinedAt) => {
+    if (!remoteParticipants.value.find((p) => p.id === participantId)) {
+      remoteParticipants.value.push({
+        id: participantId,
+        joined_at: joinedAt,
+        stream: null,
+      })
+    }
+    return remoteParticipants.value.find((p) => p.id === participantId)
+  }
+
+  const scheduleReconnect = (roomId) => {
+    // Exponential backoff with jitter, so clients dropped by a worker restart
+    // don't all come back at the same moment
+    const delay = Math.min(30000, 1000 * 2 ** reconnectAttempts) * (0.5 + Math.random())
+    reconnectAttempts += 1
+    reconnectTimer = setTimeout(async () => {
+      reconnectTimer = null
+      try {
+        await connectWebSocket(roomId, true)
+        reconnectAttempts = 0
+        globalStore.addNotification('Reconnected', 'success', 3000)
+      } catch (error) {
+        // onclose schedules the next attempt
+        console.error('Reconnect failed:', error)
+      }
+    }, delay)
+  }
+
+  const connectWebSocket = (roomId, resume = false) => {
     return new Promise((resolve, reject) => {
       try {
         // WebSocket должен подключаться к бэкенду (порт 8000), а не к фронтенду
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
         const wsHost = import.meta.env.VITE_WS_HOST || window.location.host
-        const wsUrl = `${protocol}//${wsHost}/ws/room/${roomId}/`
+        const wsBase = redirectUrl.value || `${protocol}//${wsHost}`
+        let wsUrl = `${wsBase}/ws/room/${roomId}/?ice_batch=1`
+        if (redirectUrl.value) {
+          // The owning worker serves us even if the room changes hands meanwhile
+          wsUrl += '&redirected=1'
+        }
+        if (resume && resumeToken.value) {
+          wsUrl += `&resume=${encodeURIComponent(resumeToken.value)}`
+          if (lastSeq.value) {
+            wsUrl += `&last_seq=${encodeURIComponent(lastSeq.value)}`
+          }
+        }
 
         console.log('Connecting to WebSocket:', wsUrl)
         websocket.value = new WebSocket(wsUrl)
@@ -156,6 +249,9 @@ export const useWebRTCStore = defineStore('webrtc', () => {
         websocket.value.onmessage = async (event) => {
           try {
             const data = JSON.parse(event.data)
+            if (data.seq) {
+              lastSeq.value = data.seq
+            }
             await handleWebSocketMessage(data)
           } catch (error) {
             console.error('Failed to handle WebSocket message:', error)
@@ -166,9 +262,25 @@ export const useWebRTCStore = defineStore('webrtc', () => {
           console.log('WebSocket closed:', event.code, event.reason)
           isConnected.value = false
 
+          if (event.code === REDIRECT_CLOSE_CODE && redirectUrl.value) {
+            connectWebSocket(roomId, resume).then(resolve, reject)
+            return
+          }
+
           if (event.code !== 1000) {
-            // Not a normal closure
-            globalStore.addNotification('Connection lost', 'error', 5000)
+            // Not a normal closure: resume the session if the server allows it
+            if (
+              resumeToken.value &&
+              !FINAL_CLOSE_CODES.includes(event.code) &&
+              reconnectAttempts < MAX_RECONNECT_ATTEMPTS
+            ) {
+              if (reconnectAttempts === 0) {
+                globalStore.addNotification('Connection lost, reconnecting...', 'info', 5000)
+              }
+              scheduleReconnect(roomId)
+            } else {
+              globalStore.addNotification('Connection lost', 'error', 5000)
+            }
           }
         }
 
@@ -194,6 +306,16 @@ export const useWebRTCStore = defineStore('webrtc', () => {
     console.log('Received WebSocket message:', data.type)
 
     switch (data.type) {
+      case 'redirect':
+        // Followed when the server closes the socket
+        redirectUrl.value = data.url
+        break
+
+      case 'session':
+        resumeToken.value = data.resume_token
+        localParticipantId.value = data.participant_id
+        break
+
       case 'user_joined':
         handleUserJoined(data)
         break
@@ -214,6 +336,12 @@ export const useWebRTCStore = defineStore('webrtc', () => {
         await handleICECandidate(data)
         break
 
+      case 'ice_candidates':
+        for (const candidate of data.candidates) {
+          await handleICECandidate({ ...data, candidate })
+        }
+        break
+
       case 'media_state_update':
         handleMediaStateUpdate(data)
         break
@@ -222,6 +350,10 @@ export const useWebRTCStore = defineStore('webrtc', () => {
         // Handle ping response
         break
 
+      case 'heartbeat':
+        // Server keeps our presence alive while the socket is open
+        break
+
       case 'error':
         globalStore.addNotification(data.message, 'error', 5000)
         break
@@ -231,19 +363,13 @@ export const useWebRTCStore = defineStore('webrtc', () => {
   const handleUserJoined = (data) => {
     const participantId = data.participant_id
 
-    if (!remoteParticipants.value.find((p) => p.id === participantId)) {
-      remoteParticipants.value.push({
-        id: participantId,
-        joined_at: data.timestamp,
-        stream: null,
-      })
-    }
+    addRemoteParticipant(participantId, data.timestamp)
 
     globalStore.addNotification('Someone joined the call', 'info', 3000)
 
-    // If we are already in the room, send an offer to the new participant
-    if (peerConnection.value && localStream.value) {
-      createOffer()
+    // The server only tells peers already in the room, so we offer
+    if (localStream.value) {
+      createOffer(participantId)
     }
   }
 
@@ -251,24 +377,17 @@ export const useWebRTCStore = defineStore('webrtc', () => {
     const participantId = data.participant_id
 
     remoteParticipants.value = remoteParticipants.value.filter((p) => p.id !== participantId)
+    closePeerConnection(participantId)
 
     globalStore.addNotification('Someone left the call', 'info', 3000)
-
-    // Clear remote stream if this was the connected peer
-    if (remoteStream.value) {
-      remoteStream.value = null
-    }
   }
 
   const handleWebRTCOffer = async (data) => {
     try {
-      if (!peerConnection.value) {
-        createPeerConnection()
-      }
-
-      await peerConnection.value.setRemoteDescription(new RTCSessionDescription(data.offer))
-      const answer = await peerConnection.value.createAnswer()
-      await peerConnection.value.setLocalDescription(answer)
+      const pc = getPeerConnection(data.sender)
+      await pc.setRemoteDescription(new RTCSessionDescription(data.offer))
+      const answer = await pc.createAnswer()
+      await pc.setLocalDescription(answer)
 
       sendWebSocketMessage({
         type: 'answer',
@@ -282,7 +401,12 @@ export const useWebRTCStore = defineStore('webrtc', () => {
 
   const handleWebRTCAnswer = async (data) => {
     try {
-      await peerConnection.value.setRemoteDescription(new RTCSessionDescription(data.answer))
+      const pc = peerConnections.value.get(data.sender)
+      if (!pc) {
+        console.warn('Answer from unknown peer:', data.sender)
+        return
+      }
+      await pc.setRemoteDescription(new RTCSessionDescription(data.answer))
     } catch (error) {
       console.error('Failed to handle WebRTC answer:', error)
     }
@@ -290,7 +414,12 @@ export const useWebRTCStore = defineStore('webrtc', () => {
 
   const handleICECandidate = async (data) => {
     try {
-      await peerConnection.value.addIceCandidate(new RTCIceCandidate(data.candidate))
+      const pc = peerConnections.value.get(data.sender)
+      if (!pc) {
+        console.warn('ICE candidate from unknown peer:', data.sender)
+        return
+      }
+      await pc.addIceCandidate(new RTCIceCandidate(data.candidate))
     } catch (error) {
       console.error('Failed to handle ICE candidate:', error)
     }
@@ -303,18 +432,18 @@ export const useWebRTCStore = defineStore('webrtc', () => {
     }
   }
 
-  const createOffer = async () => {
+  const createOffer = async (target) => {
     try {
-      if (!peerConnection.value) {
-        createPeerConnection()
-      }
-
-      const offer = await peerConnection.value.createOffer()
-      await peerConnection.value.setLocalDescription(offer)
+      // Each peer gets its own connection; targeted offers are delivered
+      // straight to the peer's channel
+      const pc = getPeerConnection(target)
+      const offer = await pc.createOffer()
+      await pc.setLocalDescription(offer)
 
       sendWebSocketMessage({
         type: 'offer',
         offer: offer,
+        target: target,
       })
     } catch (error) {
       console.error('Failed to create offer:', error)
@@ -381,11 +510,19 @@ export const useWebRTCStore = defineStore('webrtc', () => {
 
   const endCall = async () => {
     try {
-      // Close peer connection
-      if (peerConnection.value) {
-        peerConnection.value.close()
-        peerConnection.value = null
+      // Close peer connections
+      peerConnections.value.forEach((pc) => pc.close())
+      peerConnections.value.clear()
+
+      // Stop resuming the signaling session
+      if (reconnectTimer) {
+        clearTimeout(reconnectTimer)
+        reconnectTimer = null
       }
+      reconnectAttempts = 0
+      resumeToken.value = null
+      lastSeq.value = null
+      redirectUrl.value = null
 
       // Close WebSocket
       if (websocket.value) {
@@ -417,6 +554,7 @@ export const useWebRTCStore = defineStore('webrtc', () => {
     // State
     localStream,
     remoteStream,
+    peerConnections,
     peerConnection,
     websocket,
     isConnected,